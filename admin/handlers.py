@@ -0,0 +1,84 @@
+import tornado.web
+
+from base_handler import BaseHandler, authenticated
+from auth import permissions as perms
+from auth.permissions import requires
+from utils.instrumentation import request_metrics
+from utils.partitions import partition_manager
+from ticket.archive import ticket_archiver
+
+
+class PoolStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the live metrics of the DB connection pool.
+
+            Route - /api/admin/pool
+            Method - GET
+            :return: size, checked_out, checked_in, overflow, checkouts, timeouts and
+                     the checkout wait time histogram of the pool.
+        """
+        self.write(self.db.pool_status())
+
+
+class MetricsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the request metrics of this process in the Prometheus text format.
+            With several workers each request lands on any of them, scrape the metrics port of
+            every worker instead, see WorkerMetricsHandler.
+
+            Route - /api/admin/metrics
+            Method - GET
+            :return: histograms of the request duration, DB time, serialization time and
+                     response size, and counters of the queries and statuses, per handler and method.
+        """
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(request_metrics.render())
+
+
+class WorkerMetricsHandler(tornado.web.RequestHandler):
+    """    Metrics of a single worker, served on its own port (metrics port + worker number) so
+        Prometheus can scrape every worker. No auth token: bind the port to a private interface.
+
+        Route - /metrics of the metrics port
+        Method - GET
+    """
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(request_metrics.render())
+
+
+class PartitionStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the counters of the monthly partition maintenance.
+
+            Route - /api/admin/partitions
+            Method - GET
+            :return: runs, errors, created partitions, rows moved out of the default partitions
+                     and the last run. Only the worker running the maintenance reports enabled true.
+        """
+        self.write(partition_manager.stats())
+
+
+class TicketArchiveStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the counters of the archival of the soft-deleted tickets.
+
+            Route - /api/admin/ticket-archive
+            Method - GET
+            :return: runs, errors, archived and restored tickets and the last run. Only the
+                     worker running the archival reports enabled true.
+        """
+        self.write(ticket_archiver.stats())
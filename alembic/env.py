@@ -0,0 +1,45 @@
+import os.path
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+
+sys.path.append(os.getcwd())
+
+from settings import settings
+from utils.db import Db
+from models import Base
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(
+        url=Db(**settings['db']).database_url,
+        target_metadata=target_metadata,
+        literal_binds=True
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    db = Db(**settings['db'])
+
+    with db.engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
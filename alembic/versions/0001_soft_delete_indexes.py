@@ -0,0 +1,80 @@
+"""Indexes for the soft-delete access pattern and the ticket listing
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('is_deleted = false')
+
+# (name, table, columns, partial, unique)
+INDEXES = [
+    # Keyset pagination of the ticket listing, alone and for each filter
+    ('ix_ticket_live_created_at_uid', 'ticket', ['created_at', 'uid'], True, False),
+    ('ix_ticket_live_product_uid_created_at_uid', 'ticket', ['product_uid', 'created_at', 'uid'], True, False),
+    ('ix_ticket_live_auth_uid_created_at_uid', 'ticket', ['auth_uid', 'created_at', 'uid'], True, False),
+    ('ix_ticket_live_status_created_at_uid', 'ticket', ['status', 'created_at', 'uid'], True, False),
+    ('ix_ticket_live_type_created_at_uid', 'ticket', ['type', 'created_at', 'uid'], True, False),
+
+    # Foreign keys
+    ('ix_ticket_product_uid', 'ticket', ['product_uid'], False, False),
+    ('ix_ticket_auth_uid', 'ticket', ['auth_uid'], False, False),
+    ('ix_auth_token_auth_uid', 'auth_token', ['auth_uid'], False, False),
+
+    # Live products
+    ('uq_product_live_name', 'product', ['name'], True, True),
+    ('ix_product_live_created_at_uid', 'product', ['created_at', 'uid'], True, False),
+]
+
+
+DUPLICATE_LIVE_NAMES = sa.text("""
+    SELECT name FROM product WHERE is_deleted = false GROUP BY name HAVING count(*) > 1 ORDER BY name LIMIT 20
+""")
+
+# A failed concurrent build leaves an invalid index behind, which if_not_exists would keep.
+INVALID_INDEX = sa.text("""
+    SELECT 1 FROM pg_index JOIN pg_class ON pg_index.indexrelid = pg_class.oid
+    WHERE pg_class.relname = :name AND NOT pg_index.indisvalid
+""")
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # The unique index can't be built over duplicates, fail before building anything.
+    duplicates = connection.execute(DUPLICATE_LIVE_NAMES).scalars().all()
+
+    if duplicates:
+        raise RuntimeError(
+            'Live products share the names {}, rename or delete them before upgrading: '
+            'uq_product_live_name needs unique live names.'.format(', '.join(duplicates))
+        )
+
+    # Built concurrently so the tables stay writable, which can't run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns, partial, unique in INDEXES:
+            if connection.execute(INVALID_INDEX, dict(name=name)).first():
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+            op.create_index(
+                name, table, columns,
+                unique=unique,
+                postgresql_where=LIVE_ROWS if partial else None,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
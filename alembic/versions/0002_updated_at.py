@@ -0,0 +1,41 @@
+"""updated_at on ticket and product, versions of the conditional GET responses
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+TABLES = ['ticket', 'product']
+
+
+def upgrade():
+    # now() is evaluated once, so on Postgres 11+ this doesn't rewrite the tables.
+    # Existing rows all get the migration time.
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                'ix_{}_updated_at'.format(table), table, ['updated_at'],
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.drop_index('ix_{}_updated_at'.format(table), table_name=table, postgresql_concurrently=True, if_exists=True)
+
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
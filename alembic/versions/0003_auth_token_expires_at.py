@@ -0,0 +1,51 @@
+"""Stored, indexed expires_at on auth_token and index of the revoked tokens
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+BACKFILL = sa.text("""
+    UPDATE auth_token SET expires_at = created_at + expire_timeout_seconds * interval '1 second'
+    WHERE uid IN (SELECT uid FROM auth_token WHERE expires_at IS NULL LIMIT :batch_size)
+""")
+
+
+def upgrade():
+    op.add_column('auth_token', sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+    # Backfilled in batches, each committed on its own, so the table is never locked for long.
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+
+        while connection.execute(BACKFILL, dict(batch_size=BATCH_SIZE)).rowcount:
+            pass
+
+        op.create_index('ix_auth_token_expires_at', 'auth_token', ['expires_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_auth_token_revoked', 'auth_token', ['deleted_at'],
+                        postgresql_where=sa.text('is_deleted = true'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+    # Rows inserted by the previous release while backfilling.
+    op.execute(BACKFILL.bindparams(batch_size=None))
+    op.alter_column('auth_token', 'expires_at', nullable=False)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_auth_token_revoked', table_name='auth_token', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_auth_token_expires_at', table_name='auth_token', postgresql_concurrently=True, if_exists=True)
+
+    op.drop_column('auth_token', 'expires_at')
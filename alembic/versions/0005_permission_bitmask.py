@@ -0,0 +1,47 @@
+"""Integer permission bitmask on auth and per-product permission grants
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Character n of the BIT(4) string is bit n of the mask, e.g. '1010' (create, view) becomes 5.
+    op.alter_column(
+        'auth', 'permissions',
+        type_=sa.Integer(),
+        postgresql_using='reverse(permissions::text)::bit(4)::integer'
+    )
+
+    op.create_table(
+        'product_permission',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), primary_key=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('auth_uid', postgresql.UUID(as_uuid=True), sa.ForeignKey('auth.uid'), nullable=False),
+        sa.Column('product_uid', postgresql.UUID(as_uuid=True), sa.ForeignKey('product.uid'), nullable=False),
+        sa.Column('permissions', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('auth_uid', 'product_uid', name='uq_product_permission_auth_uid_product_uid'),
+    )
+    op.create_index('ix_product_permission_created_at', 'product_permission', ['created_at'])
+
+
+def downgrade():
+    op.drop_table('product_permission')
+
+    # Flags past the first four are dropped.
+    op.alter_column(
+        'auth', 'permissions',
+        type_=postgresql.BIT(4),
+        postgresql_using='reverse((permissions & 15)::bit(4)::text)::bit(4)'
+    )
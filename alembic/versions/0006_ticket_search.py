@@ -0,0 +1,42 @@
+"""full-text search vector of the ticket descriptions and its GIN index
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = "to_tsvector('english', coalesce(description ->> 'description', ''))"
+
+
+def upgrade():
+    # A stored generated column rewrites the table under an exclusive lock, run it off-peak.
+    # Postgres keeps it up to date afterwards, no trigger or app code involved.
+    op.add_column('ticket', sa.Column(
+        'search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True)
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_ticket_live_search_vector', 'ticket', ['search_vector'],
+            postgresql_using='gin',
+            postgresql_where=sa.text('is_deleted = false'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_ticket_live_search_vector', table_name='ticket', postgresql_concurrently=True, if_exists=True)
+
+    op.drop_column('ticket', 'search_vector')
@@ -0,0 +1,111 @@
+"""ticket.description from JSON to JSONB, with a GIN index of the containment filters
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+SEARCH_VECTOR = "to_tsvector('english', coalesce(description ->> 'description', ''))"
+
+# Walks the table in uid order, so each batch only reads its own rows. Returns the last uid of
+# the batch, none past the end. Rows already converted by the trigger are left alone.
+BACKFILL = sa.text("""
+    WITH batch AS (
+        SELECT uid FROM ticket WHERE uid > :uid ORDER BY uid LIMIT :batch_size
+    ), converted AS (
+        UPDATE ticket SET description_jsonb = description::jsonb
+        WHERE uid IN (SELECT uid FROM batch) AND description_jsonb IS NULL
+    )
+    SELECT uid FROM batch ORDER BY uid DESC LIMIT 1
+""")
+
+# Writes of the running release while backfilling only set description.
+SYNC_FUNCTION = """
+    CREATE OR REPLACE FUNCTION ticket_description_jsonb_sync() RETURNS trigger AS $$
+    BEGIN
+        NEW.description_jsonb := NEW.description::jsonb;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+SYNC_TRIGGER = """
+    CREATE TRIGGER ticket_description_jsonb_sync BEFORE INSERT OR UPDATE OF description ON ticket
+    FOR EACH ROW EXECUTE FUNCTION ticket_description_jsonb_sync()
+"""
+
+
+def upgrade():
+    op.add_column('ticket', sa.Column('description_jsonb', postgresql.JSONB(), nullable=True))
+    op.execute(SYNC_FUNCTION)
+    op.execute(SYNC_TRIGGER)
+
+    # Converted in keyset batches, each committed on its own, so the table is never locked for long.
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last = '00000000-0000-0000-0000-000000000000'
+
+        while last is not None:
+            last = connection.execute(BACKFILL, dict(uid=last, batch_size=BATCH_SIZE)).scalar()
+
+        op.create_index(
+            'ix_ticket_live_description', 'ticket', ['description_jsonb'],
+            postgresql_using='gin',
+            postgresql_ops=dict(description_jsonb='jsonb_path_ops'),
+            postgresql_where=sa.text('is_deleted = false'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+    # The swap itself. The search vector depends on the old column, so it is dropped and added
+    # back, which rewrites the table once: run it off-peak.
+    op.execute('DROP TRIGGER ticket_description_jsonb_sync ON ticket')
+    op.execute('DROP FUNCTION ticket_description_jsonb_sync()')
+    op.drop_column('ticket', 'search_vector')
+    op.drop_column('ticket', 'description')
+    op.alter_column('ticket', 'description_jsonb', new_column_name='description', nullable=False)
+    op.add_column('ticket', sa.Column(
+        'search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True)
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_ticket_live_search_vector', 'ticket', ['search_vector'],
+            postgresql_using='gin',
+            postgresql_where=sa.text('is_deleted = false'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_ticket_live_description', table_name='ticket', postgresql_concurrently=True, if_exists=True)
+
+    # The search vector and its index go along with the dependent column and are added back.
+    op.drop_column('ticket', 'search_vector')
+    op.alter_column('ticket', 'description', type_=postgresql.JSON(), postgresql_using='description::json')
+    op.add_column('ticket', sa.Column(
+        'search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True)
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_ticket_live_search_vector', 'ticket', ['search_vector'],
+            postgresql_using='gin',
+            postgresql_where=sa.text('is_deleted = false'),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
@@ -0,0 +1,39 @@
+"""ticket_stats, the live ticket counts by product, status and type
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ticket_stats',
+        sa.Column('product_uid', postgresql.UUID(as_uuid=True), sa.ForeignKey('product.uid'), primary_key=True),
+        sa.Column('status', sa.String(), primary_key=True),
+        sa.Column('type', sa.String(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+    )
+
+    # Tickets written by the previous release from now on are not counted, deploy the new
+    # release then run `python -m tools.reconcile_ticket_stats`.
+    op.execute("""
+        INSERT INTO ticket_stats (product_uid, status, type, count)
+        SELECT product_uid, status, type, count(*) FROM ticket
+        WHERE is_deleted = false
+        GROUP BY product_uid, status, type
+    """)
+
+
+def downgrade():
+    op.drop_table('ticket_stats')
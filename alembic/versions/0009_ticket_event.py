@@ -0,0 +1,42 @@
+"""ticket_event, the status history of the tickets, partitioned by month
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from utils.partitions import PartitionManager
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ticket_event',
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('ticket_uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('product_uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('status', sa.SmallInteger(), nullable=False),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+
+    # Created on the empty parent, so each partition gets its own copy.
+    op.create_index('ix_ticket_event_product_uid_created_at', 'ticket_event', ['product_uid', 'created_at'])
+    op.create_index('ix_ticket_event_ticket_uid_created_at', 'ticket_event', ['ticket_uid', 'created_at'])
+
+    # The app keeps creating the next months, see utils.partitions. The history starts now,
+    # the earlier status changes of the tickets are unknown.
+    PartitionManager().ensure(op.get_bind(), ['ticket_event'])
+
+
+def downgrade():
+    # The partitions are dropped along with the parent.
+    op.drop_table('ticket_event')
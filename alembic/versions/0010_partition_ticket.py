@@ -0,0 +1,172 @@
+"""ticket partitioned by month on created_at, and ticket_archive for the old deleted tickets
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+
+A table can't be partitioned in place. The rows are copied in batches to a partitioned
+ticket_new, which a trigger keeps in sync with the writes of the running release, then the
+tables are swapped in one short transaction.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from utils.partitions import PartitionManager
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+COLUMNS = 'uid, created_at, updated_at, is_deleted, deleted_at, auth_uid, product_uid, status, type, description'
+
+# (name, definition) of the indexes of the ticket table, created on ticket_new as <name>_new.
+INDEXES = [
+    ('ix_ticket_created_at', '(created_at)'),
+    ('ix_ticket_updated_at', '(updated_at)'),
+    ('ix_ticket_auth_uid', '(auth_uid)'),
+    ('ix_ticket_product_uid', '(product_uid)'),
+    ('ix_ticket_live_created_at_uid', '(created_at, uid) WHERE is_deleted = false'),
+    ('ix_ticket_live_product_uid_created_at_uid', '(product_uid, created_at, uid) WHERE is_deleted = false'),
+    ('ix_ticket_live_auth_uid_created_at_uid', '(auth_uid, created_at, uid) WHERE is_deleted = false'),
+    ('ix_ticket_live_status_created_at_uid', '(status, created_at, uid) WHERE is_deleted = false'),
+    ('ix_ticket_live_type_created_at_uid', '(type, created_at, uid) WHERE is_deleted = false'),
+    ('ix_ticket_live_description', 'USING gin (description jsonb_path_ops) WHERE is_deleted = false'),
+    ('ix_ticket_live_search_vector', 'USING gin (search_vector) WHERE is_deleted = false'),
+    ('ix_ticket_deleted_deleted_at', '(deleted_at) WHERE is_deleted = true'),
+]
+
+SYNC_FUNCTION = """
+    CREATE OR REPLACE FUNCTION ticket_new_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM ticket_new WHERE uid = OLD.uid AND created_at = OLD.created_at;
+            RETURN OLD;
+        END IF;
+
+        INSERT INTO ticket_new ({columns}) SELECT {new_columns}
+        ON CONFLICT (uid, created_at) DO UPDATE SET
+            updated_at = EXCLUDED.updated_at, is_deleted = EXCLUDED.is_deleted,
+            deleted_at = EXCLUDED.deleted_at, status = EXCLUDED.status, description = EXCLUDED.description;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+""".format(columns=COLUMNS, new_columns=', '.join('NEW.' + name for name in COLUMNS.split(', ')))
+
+# Rows already copied by the trigger are newer, they are kept.
+COPY_BATCH = sa.text("""
+    INSERT INTO ticket_new ({columns})
+    SELECT {columns} FROM ticket
+    WHERE (created_at, uid) > (:created_at, :uid)
+    ORDER BY created_at, uid
+    LIMIT :batch_size
+    ON CONFLICT (uid, created_at) DO NOTHING
+""".format(columns=COLUMNS))
+
+LAST_COPIED = sa.text("""
+    SELECT created_at, uid FROM (
+        SELECT created_at, uid FROM ticket WHERE (created_at, uid) > (:created_at, :uid)
+        ORDER BY created_at, uid LIMIT :batch_size
+    ) batch ORDER BY created_at DESC, uid DESC LIMIT 1
+""")
+
+
+def upgrade():
+    op.create_table(
+        'ticket_archive',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), primary_key=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('is_deleted', sa.Boolean(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column('auth_uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('product_uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('type', sa.String(20), nullable=False),
+        sa.Column('description', postgresql.JSONB(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_ticket_archive_product_uid', 'ticket_archive', ['product_uid'])
+    op.create_index('ix_ticket_archive_archived_at', 'ticket_archive', ['archived_at'])
+
+    # Columns, defaults, NOT NULL and the generated search vector, without the indexes.
+    op.execute('CREATE TABLE ticket_new (LIKE ticket INCLUDING DEFAULTS INCLUDING GENERATED) '
+               'PARTITION BY RANGE (created_at)')
+    op.execute('ALTER TABLE ticket_new ADD CONSTRAINT ticket_new_pkey PRIMARY KEY (uid, created_at)')
+    op.execute('ALTER TABLE ticket_new ADD CONSTRAINT ticket_auth_uid_fkey '
+               'FOREIGN KEY (auth_uid) REFERENCES auth (uid)')
+    op.execute('ALTER TABLE ticket_new ADD CONSTRAINT ticket_product_uid_fkey '
+               'FOREIGN KEY (product_uid) REFERENCES product (uid)')
+
+    # Created before the copy, building them afterwards would block the trigger, so the app.
+    for name, definition in INDEXES:
+        op.execute('CREATE INDEX {}_new ON ticket_new {}'.format(name, definition))
+
+    connection = op.get_bind()
+    oldest = connection.execute(sa.text('SELECT min(created_at) FROM ticket')).scalar()
+
+    # Partitions are named after ticket_new, they are renamed after the swap.
+    PartitionManager().ensure(connection, ['ticket_new'], since=oldest)
+
+    op.execute(SYNC_FUNCTION)
+    op.execute('CREATE TRIGGER ticket_new_sync AFTER INSERT OR UPDATE OR DELETE ON ticket '
+               'FOR EACH ROW EXECUTE FUNCTION ticket_new_sync()')
+
+    # Copied in keyset batches, each committed on its own, so the table is never locked for long.
+    with op.get_context().autocommit_block():
+        position = dict(created_at=oldest, uid='00000000-0000-0000-0000-000000000000', batch_size=BATCH_SIZE)
+
+        while oldest is not None:
+            last = connection.execute(LAST_COPIED, position).first()
+
+            if last is None:
+                break
+
+            connection.execute(COPY_BATCH, position)
+            position.update(created_at=last.created_at, uid=last.uid)
+
+    # The swap, in one transaction. The old table goes along with its trigger and indexes.
+    op.execute('LOCK TABLE ticket IN ACCESS EXCLUSIVE MODE')
+    op.execute('DROP TABLE ticket')
+    op.execute('DROP FUNCTION ticket_new_sync()')
+    op.execute('ALTER TABLE ticket_new RENAME TO ticket')
+    op.execute('ALTER TABLE ticket RENAME CONSTRAINT ticket_new_pkey TO ticket_pkey')
+
+    for name, _ in INDEXES:
+        op.execute('ALTER INDEX {}_new RENAME TO {}'.format(name, name))
+
+    partitions = connection.execute(sa.text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = 'ticket'"
+    )).scalars().all()
+
+    for partition in partitions:
+        op.execute('ALTER TABLE {} RENAME TO {}'.format(partition, partition.replace('ticket_new_', 'ticket_', 1)))
+
+
+def downgrade():
+    # Archived tickets go back to the ticket table first.
+    op.execute('INSERT INTO ticket ({columns}) SELECT {columns} FROM ticket_archive'.format(columns=COLUMNS))
+    op.drop_table('ticket_archive')
+
+    # Copied in one statement under lock, the old table doesn't support the copy-and-swap.
+    op.execute('LOCK TABLE ticket IN ACCESS EXCLUSIVE MODE')
+    op.execute('CREATE TABLE ticket_old (LIKE ticket INCLUDING DEFAULTS INCLUDING GENERATED)')
+    op.execute('INSERT INTO ticket_old ({columns}) SELECT {columns} FROM ticket'.format(columns=COLUMNS))
+    op.execute('DROP TABLE ticket')
+    op.execute('ALTER TABLE ticket_old RENAME TO ticket')
+    op.execute('ALTER TABLE ticket ADD CONSTRAINT ticket_pkey PRIMARY KEY (uid)')
+    op.execute('ALTER TABLE ticket ADD CONSTRAINT ticket_auth_uid_fkey FOREIGN KEY (auth_uid) REFERENCES auth (uid)')
+    op.execute('ALTER TABLE ticket ADD CONSTRAINT ticket_product_uid_fkey '
+               'FOREIGN KEY (product_uid) REFERENCES product (uid)')
+
+    for name, definition in INDEXES:
+        if name != 'ix_ticket_deleted_deleted_at':
+            op.execute('CREATE INDEX {} ON ticket {}'.format(name, definition))
@@ -0,0 +1,72 @@
+"""table_version, commit-ordered versions of the ticket and product listings, and updated_at in UTC
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+TABLES = ['ticket', 'product']
+
+UTC_NOW = "timezone('UTC', clock_timestamp())"
+
+# Fired for every written row, only the first one of a transaction bumps the version.
+# The table name is an argument: on a partitioned table the trigger fires on the partitions.
+BUMP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger AS $$
+    BEGIN
+        IF current_setting('table_version.' || TG_ARGV[0], true) = 'bumped' THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM set_config('table_version.' || TG_ARGV[0], 'bumped', true);
+
+        INSERT INTO table_version (name, updated_at)
+        VALUES (TG_ARGV[0], timezone('UTC', clock_timestamp()))
+        ON CONFLICT (name) DO UPDATE SET updated_at = greatest(
+            EXCLUDED.updated_at, table_version.updated_at + interval '1 microsecond'
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+# Deferred, so it runs when the transaction commits, after all its other locks.
+BUMP_TRIGGER = """
+    CREATE CONSTRAINT TRIGGER {table}_table_version AFTER INSERT OR UPDATE OR DELETE ON {table}
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION table_version_bump('{table}')
+"""
+
+
+def upgrade():
+    op.create_table(
+        'table_version',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.execute(BUMP_FUNCTION)
+
+    for table in TABLES:
+        op.execute(BUMP_TRIGGER.format(table=table))
+        op.execute("INSERT INTO table_version (name, updated_at) VALUES ('{}', {})".format(table, UTC_NOW))
+
+        # Only the default of the new rows changes, the existing ones are not rewritten.
+        op.alter_column(table, 'updated_at', server_default=sa.text(UTC_NOW))
+
+
+def downgrade():
+    for table in TABLES:
+        op.alter_column(table, 'updated_at', server_default=sa.func.now())
+        op.execute('DROP TRIGGER {0}_table_version ON {0}'.format(table))
+
+    op.execute('DROP FUNCTION table_version_bump()')
+    op.drop_table('table_version')
@@ -0,0 +1,32 @@
+"""Permission changes of the users, polled by every worker to drop the cached principals
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'permission_change',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), primary_key=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('auth_uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_permission_change_created_at', 'permission_change', ['created_at'])
+    op.create_index('ix_permission_change_expires_at', 'permission_change', ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('permission_change')
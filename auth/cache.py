@@ -0,0 +1,103 @@
+import collections
+import datetime
+import threading
+
+
+class TokenCache(object):
+    """    Bounded LRU cache of validated auth tokens keyed by token uid.
+        Values are `auth.principal.Principal` objects.
+
+        An entry is dropped when the token expires, when it is older than `ttl_seconds`
+        or when the cache is full and the entry is the least recently used one.
+
+        Safe to use from the DB executor threads, e.g. when `AuthToken.revoke()` runs there.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_size=None, ttl_seconds=None):
+        if max_size is not None:
+            self.max_size = max_size
+
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+
+        self.clear()
+
+    def get(self, token_uid):
+        with self._lock:
+            entry = self._entries.get(token_uid)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            principal, valid_until = entry
+
+            if valid_until <= datetime.datetime.utcnow():
+                del self._entries[token_uid]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token_uid)
+            self.hits += 1
+
+            return principal
+
+    def put(self, principal):
+        if self.max_size <= 0:
+            return
+
+        valid_until = min(
+            principal.expires_at,
+            datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl_seconds)
+        )
+
+        with self._lock:
+            self._entries[principal.token_uid] = (principal, valid_until)
+            self._entries.move_to_end(principal.token_uid)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token_uid):
+        with self._lock:
+            self._entries.pop(token_uid, None)
+
+    def invalidate_user(self, auth_uid):
+        with self._lock:
+            stale = [uid for uid, (principal, _) in self._entries.items() if principal.uid == auth_uid]
+
+            for uid in stale:
+                del self._entries[uid]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return dict(
+            size=len(self._entries),
+            max_size=self.max_size,
+            ttl_seconds=self.ttl_seconds,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            hit_ratio=float(self.hits) / lookups if lookups else 0.0
+        )
+
+
+# Process wide cache used by `base_handler.authenticated`.
+token_cache = TokenCache()
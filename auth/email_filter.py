@@ -0,0 +1,159 @@
+import asyncio
+import datetime
+
+from auth.models import Auth
+from utils.bloom import BloomFilter
+
+
+class EmailFilter(object):
+    """    In-memory Bloom filter of the registered emails.
+
+        Lets signup skip the uniqueness query without a DB round trip, the unique constraint
+        still catches the emails the filter doesn't know yet, and login reject unknown emails
+        without looking the user up. Emails of users created by other processes are picked up
+        by `refresh`, so before a login is rejected `catch_up` loads the users created since
+        the last one: a query on the recent rows only, shared by the concurrent misses.
+        The filter is rebuilt from scratch when it has grown past its false positive target.
+
+        The session functions (`build`, `new_emails`) are meant to run on the DB executor,
+        the other methods on the IOLoop.
+    """
+
+    def __init__(self, error_rate=0.001, min_capacity=10000, enabled=True):
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.enabled = enabled
+
+        self.bloom = None
+        self.loaded_until = None
+
+        self.misses = 0
+        self.rebuilds = 0
+        self.catch_ups = 0
+
+        # Catch ups run one at a time, numbered in order, see `catch_up`.
+        self._catch_up_lock = asyncio.Lock()
+        self._catch_ups_started = 0
+        self._catch_ups_done = 0
+
+    def configure(self, enabled=None, error_rate=None, min_capacity=None, **_):
+        if enabled is not None:
+            self.enabled = enabled
+
+        if error_rate is not None:
+            self.error_rate = error_rate
+
+        if min_capacity is not None:
+            self.min_capacity = min_capacity
+
+        self.bloom = None
+        self.loaded_until = None
+
+    @property
+    def is_loaded(self):
+        return self.enabled and self.bloom is not None
+
+    def might_exist(self, email):
+        """ False only when no user is registered with `email`. True while the filter isn't loaded. """
+        if not self.is_loaded:
+            return True
+
+        if email in self.bloom:
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, email):
+        if self.is_loaded:
+            self.bloom.add(email)
+
+    def needs_rebuild(self):
+        return self.is_loaded and self.bloom.estimated_error_rate() > 2 * self.error_rate
+
+    def build(self, session):
+        """ Build a filter of all the registered emails, sized for twice the current count. """
+        count = session.query(Auth.uid).count()
+
+        bloom = BloomFilter(max(2 * count, self.min_capacity), self.error_rate)
+        loaded_until = datetime.datetime(1970, 1, 1)
+
+        for email, created_at in session.query(Auth.email, Auth.created_at).yield_per(10000):
+            bloom.add(email)
+            loaded_until = max(loaded_until, created_at)
+
+        return bloom, loaded_until
+
+    def load(self, bloom, loaded_until):
+        self.bloom = bloom
+        self.loaded_until = loaded_until
+        self.rebuilds += 1
+
+    def new_emails(self, session, since):
+        """ Emails and creation time of the users created after `since`. """
+        return session.query(Auth.email, Auth.created_at).filter(Auth.created_at > since).all()
+
+    def extend(self, rows):
+        for email, created_at in rows:
+            self.bloom.add(email)
+            self.loaded_until = max(self.loaded_until, created_at)
+
+    async def refresh(self, db, executor, full=False):
+        """ Add the users created since the last load, rebuilding when `full` or overfull. """
+        if not self.enabled:
+            return
+
+        if full or self.bloom is None or self.needs_rebuild():
+            self.load(*await db.run_in_session(executor, self.build))
+            return
+
+        # Rows committed slightly out of created_at order are covered by a small overlap.
+        since = self.loaded_until - datetime.timedelta(seconds=60)
+
+        self.extend(await db.run_in_session(executor, self.new_emails, since))
+
+    async def catch_up(self, db, executor):
+        """ Load the users committed before this call. A catch up started after the call covers
+            it, so the callers waiting on the one in flight share the next one.
+        """
+        needed = self._catch_ups_started + 1
+
+        async with self._catch_up_lock:
+            if self._catch_ups_done >= needed:
+                return
+
+            self._catch_ups_started += 1
+            started = self._catch_ups_started
+
+            try:
+                await self.refresh(db, executor)
+                self.catch_ups += 1
+            finally:
+                self._catch_ups_done = started
+
+    async def is_known(self, db, executor, email):
+        """ False only when no user is registered with `email`, users created by other
+            processes since the last refresh included.
+        """
+        if self.might_exist(email):
+            return True
+
+        await self.catch_up(db, executor)
+
+        return not self.is_loaded or email in self.bloom
+
+    def stats(self):
+        return dict(
+            enabled=self.enabled,
+            loaded=self.is_loaded,
+            count=self.bloom.count if self.bloom else 0,
+            capacity=self.bloom.capacity if self.bloom else 0,
+            estimated_error_rate=self.bloom.estimated_error_rate() if self.bloom else None,
+            misses=self.misses,
+            catch_ups=self.catch_ups,
+            rebuilds=self.rebuilds
+        )
+
+
+# Process wide filter used by SignupHandler and LoginHandler.
+email_filter = EmailFilter()
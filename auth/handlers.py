@@ -1,9 +1,44 @@
 import tornado.web
-from bitarray import bitarray
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 
 from base_handler import BaseHandler, authenticated
-from utils.app_util import is_valid_email, is_valid_password, hash_password, match_password, convert_uuid_or_400
-from auth.models import Auth, AuthToken
+from utils.app_util import is_valid_email, is_valid_password, convert_uuid_or_400
+from auth.models import Auth, AuthToken, ProductPermission, PermissionChange
+from auth import permissions as perms
+from auth.permissions import requires
+from auth.cache import token_cache
+from auth.email_filter import email_filter
+from auth.sweeper import token_sweeper
+from auth.principal import Principal
+from auth.signed_tokens import signed_tokens
+from auth.revocation import revocation_list
+from product.models import Product
+
+
+def issue_token(session, token_settings, auth_uid, email, permissions, max_live=None):
+    """ Create the token returned by signup and login. A signed token when they are enabled,
+        otherwise the uid of the AuthToken row. `permissions` is the bitmask of Auth.
+    """
+    token_type = AuthToken.SIGNED_TOKEN if signed_tokens.enabled else AuthToken.AUTHENTICATION_TOKEN
+
+    token = AuthToken.create_token(
+        session, auth_uid, token_type,
+        expire_seconds=token_settings['expire_seconds'],
+        max_live=max_live
+    )
+
+    if not signed_tokens.enabled:
+        return str(token.uid)
+
+    return signed_tokens.encode(Principal(
+        token_uid=token.uid,
+        uid=auth_uid,
+        email=email,
+        permissions=permissions,
+        expires_at=token.expires_at,
+        product_permissions=ProductPermission.granted(session, auth_uid)
+    ))
 
 
 class IndexHandler(BaseHandler):
@@ -13,15 +48,15 @@ class IndexHandler(BaseHandler):
 
     """
 
-    def get(self):
+    async def get(self):
         self.write(dict(message='Hello, Welcome to Issue Ticket System!'))
 
-    def post(self):
+    async def post(self):
         self.write(dict(message='Hello, Welcome to Issue Ticket System!'))
 
 
 class SignupHandler(BaseHandler):
-    def post(self):
+    async def post(self):
         """
             Route - /api/sign-up
             Method - POST
@@ -42,40 +77,46 @@ class SignupHandler(BaseHandler):
         if not password or not is_valid_password(password):
             raise tornado.web.HTTPError(400, 'Invalid password. Min 6 characters required.')
 
-        with self.session_scope() as session:
-            # Checking if user already exists with the same email
-            if session.query(Auth).filter(Auth.email == email).first():
-                raise tornado.web.HTTPError(403, 'Email Already in use. Please try to sign-up using a different email.')
+        hashed = await self.password_hasher.hash(password)
 
-            hashed = hash_password(password)
+        # The email filter has no false negatives, when it doesn't know the email
+        # the query can be skipped and the unique constraint is enough.
+        check_existing = email_filter.might_exist(email)
 
-            # Creating the initial permission for the user.
-            # 1. Create, 2. Edit, 3. View, 4.Delete
-            initial_permission = [True, False, True, False]
+        token_settings = self.application.all_settings['auth_tokens']
 
-            permission = bitarray()
-            permission.extend(initial_permission)
+        def create_user(session):
+            # Checking if user already exists with the same email
+            if check_existing and session.query(Auth).filter(Auth.email == email).first():
+                raise tornado.web.HTTPError(403, 'Email Already in use. Please try to sign-up using a different email.')
 
             user = Auth(
                 email=email,
                 hashed=hashed,
-                permissions=permission.to01()
+                permissions=perms.DEFAULT
             )
 
             session.add(user)
 
-            token = AuthToken.create_token(session, user, AuthToken.AUTHENTICATION_TOKEN)
+            try:
+                session.flush()
+            except IntegrityError:
+                raise tornado.web.HTTPError(403, 'Email Already in use. Please try to sign-up using a different email.')
 
-            response = dict(
-                token=str(token.uid),
+            return dict(
+                token=issue_token(session, token_settings, user.uid, email, user.permissions),
                 user=user.to_json()
             )
 
-            self.write(response)
+        response = await self.run_in_session(create_user)
+
+        email_filter.add(email)
+
+        self.write(response)
 
 
 class LoginHandler(BaseHandler):
-    def post(self):
+    async def post(self):
         """
             Route - /api/sign-in
             Method - POST
@@ -93,28 +134,55 @@ class LoginHandler(BaseHandler):
         if not email or not password:
             raise tornado.web.HTTPError(400, 'Invalid username or password')
 
-        with self.session_scope() as session:
+        # Unknown emails are rejected without looking the user up. A miss is confirmed against
+        # the users signed up through other workers since the last refresh first.
+        if not await email_filter.is_known(self.db, self.application.db_executor, email):
+            raise tornado.web.HTTPError(400, 'Incorrect email. No user found for {}'.format(email))
+
+        def find_user(session):
             user = session.query(Auth).filter(Auth.email == email).one_or_none()
 
             if not user:
                 raise tornado.web.HTTPError(400, 'Incorrect email. No user found for {}'.format(email))
 
-            if not match_password(password, user.hashed):
-                raise tornado.web.HTTPError(400, 'Incorrect password for {}'.format(email))
+            return user.uid, bytes(user.hashed), user.permissions, user.to_json()
 
-            token = AuthToken.create_token(session, user, AuthToken.AUTHENTICATION_TOKEN)
+        user_uid, hashed, permissions, user_json = await self.run_in_session(find_user)
 
-            response = dict(
-                token=str(token.uid),
-                user=user.to_json()
+        # The password is checked outside of the session so no DB connection is held during bcrypt.
+        if not await self.password_hasher.check(password, hashed):
+            raise tornado.web.HTTPError(400, 'Incorrect password for {}'.format(email))
+
+        # Hashes made with another cost factor are upgraded while the password is at hand.
+        rehashed = None
+
+        if self.password_hasher.needs_rehash(hashed):
+            rehashed = await self.password_hasher.hash(password)
+
+        token_settings = self.application.all_settings['auth_tokens']
+
+        def create_token(session):
+            if rehashed:
+                session.query(Auth).filter(Auth.uid == user_uid).update(dict(hashed=rehashed))
+
+            return issue_token(
+                session, token_settings, user_uid, email, permissions,
+                max_live=token_settings['max_live_per_user']
             )
 
-            self.write(response)
+        token = await self.run_in_session(create_token)
+
+        response = dict(
+            token=token,
+            user=user_json
+        )
+
+        self.write(response)
 
 
 class EditPermissionHandler(BaseHandler):
     @authenticated
-    def put(self):
+    async def put(self):
         """
             Handler to change the permission of the user. Pass the user access token in the Authorization Header
 
@@ -122,18 +190,20 @@ class EditPermissionHandler(BaseHandler):
            Method - PUT
            Params -
                Authorization - Bearer User Access Token received during login or signup
-               permissions -  Int array of length 4
+               permissions -  Int array of length 4, in the order create, edit, view, delete.
+               product_uid - optional, grant the permissions on this product only, on top of the
+                             user's own permissions.
 
-           :returns: - uid, timestamp of the user
+           :returns: - uid, timestamp of the user, and a new token when signed tokens are enabled.
         """
-        token = self.access_token_from_authorization_header()
-
         data = self.convert_argument_to_json()
 
         permissions = data['permissions']
 
-        if len(permissions) is not 4:
-            raise tornado.web.HTTPError(400, 'Some permissions are missing. Permissions count must be 4.')
+        if len(permissions) != len(perms.FLAGS):
+            raise tornado.web.HTTPError(
+                400, 'Some permissions are missing. Permissions count must be {}.'.format(len(perms.FLAGS))
+            )
 
         for ix, permission in enumerate(permissions):
 
@@ -148,19 +218,79 @@ class EditPermissionHandler(BaseHandler):
             except Exception as ex:
                 raise tornado.web.HTTPError(400, 'Permission must be integer')
 
-        with self.session_scope() as session:
-            token = convert_uuid_or_400(token)
+        mask = perms.from_flags(permissions)
 
-            token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
+        product_uid = data.get('product_uid', None)
 
-            user = token.auth
-            updated_permission = bitarray()
+        if product_uid:
+            product_uid = convert_uuid_or_400(product_uid)
 
-            updated_permission.extend(permissions)
+        token_settings = self.application.all_settings['auth_tokens']
 
-            user.permissions = updated_permission.to01()
+        def update_permissions(session):
+            user = session.query(Auth).filter(Auth.uid == self.current_user.uid).one()
+
+            if product_uid:
+                if not session.query(Product.uid).filter(
+                        and_(Product.uid == product_uid, Product.is_deleted == False)).first():
+                    raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
+
+                ProductPermission.grant(session, user.uid, product_uid, mask)
+            else:
+                # The admin flag isn't part of the edit-user flags, it is kept as is.
+                user.permissions = mask | (user.permissions & perms.ADMIN)
+
+            # The other workers drop the principals of this user they cached, see RevocationList.
+            PermissionChange.record(session, user.uid)
 
             session.flush()
 
             response = user.to_json()
-            self.write(response)
+
+            # Signed tokens carry the old permission bits, they are revoked and a new one is returned.
+            if signed_tokens.enabled:
+                AuthToken.revoke_oldest(session, user.uid, AuthToken.SIGNED_TOKEN, 0)
+
+                response['token'] = issue_token(session, token_settings, user.uid, user.email, user.permissions)
+
+            return response
+
+        response = await self.run_in_session(update_permissions)
+
+        # Cached tokens of this user carry the old permission bits, dropped here right away.
+        token_cache.invalidate_user(self.current_user.uid)
+
+        self.write(response)
+
+
+class AuthCacheStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the hit/miss counters of the auth token cache.
+
+            Route - /api/admin/auth-cache
+            Method - GET
+            :return: size, hits, misses and evictions of the cache.
+        """
+        self.write(token_cache.stats())
+
+
+class TokenSweeperStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.ADMIN)
+    async def get(self):
+        """
+            Handler to get the counters of the expired/revoked auth token sweeper.
+
+            Route - /api/admin/token-sweeper
+            Method - GET
+            :return: runs, errors, deleted tokens and the last run of the sweeper. Only the
+                     worker running the sweeps reports enabled true. Also the size of the
+                     in-memory revocation list of the signed tokens.
+        """
+        response = token_sweeper.stats()
+        response['revocation_list'] = revocation_list.stats()
+
+        self.write(response)
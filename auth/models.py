@@ -1,8 +1,13 @@
 import datetime
+import uuid
+
 from sqlalchemy.dialects import postgresql
-from sqlalchemy import Column, String, LargeBinary, ForeignKey, Integer, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, LargeBinary, ForeignKey, Integer, DateTime, Index, UniqueConstraint, text
+from sqlalchemy import event
+from sqlalchemy.orm import relationship, object_session
 
+from auth.cache import token_cache
+from auth.revocation import revocation_list
 from utils.dbbase import Base
 from utils.mixins import UIDMixin, UUID, DeletableMixin
 
@@ -18,13 +23,8 @@ class Auth(UIDMixin, Base):
     # LargeBinary column will be bytea type
     hashed = Column(LargeBinary(60), nullable=False)
 
-    # set the bit for the type of permission
-    # CREATE_TICKET - bit 0
-    # EDIT_TICKET - bit 1
-    # VIEW_TICKET - bit 2
-    # DELETE_TICKET - bit 3
-
-    permissions = Column(postgresql.BIT(4), nullable=False)
+    # Bitmask of the auth.permissions flags, see CREATE_TICKET etc. there.
+    permissions = Column(Integer, nullable=False)
 
 
 # Auth token table with token type, that is usable for different purposes:
@@ -32,25 +32,78 @@ class Auth(UIDMixin, Base):
 class AuthToken(UIDMixin, DeletableMixin, Base):
     __tablename__ = 'auth_token'
 
+    # Revoked tokens, found by the sweeper without scanning the live ones.
+    __table_args__ = (
+        Index('ix_auth_token_revoked', 'deleted_at', postgresql_where=text('is_deleted = true')),
+    )
+
     AUTHENTICATION_TOKEN = "auth_token"
 
+    # Self-contained HMAC signed token, see auth.signed_tokens
+    SIGNED_TOKEN = "signed_token"
+
+    DEFAULT_EXPIRE_SECONDS = 24 * 60 * 60
+
     # For now the type is only AUTHENTICATION_TOKEN
     token_type = Column(String(15), nullable=False, index=True)
 
-    auth_uid = Column(UUID, ForeignKey('auth.uid'), nullable=False)
+    auth_uid = Column(UUID, ForeignKey('auth.uid'), nullable=False, index=True)
     auth = relationship('Auth', backref='auth_tokens')
 
-    expire_timeout_seconds = Column(Integer, nullable=False, default=24 * 60 * 60)
+    expire_timeout_seconds = Column(Integer, nullable=False, default=DEFAULT_EXPIRE_SECONDS)
+
+    # created_at + expire_timeout_seconds, stored so expired tokens can be found with an index.
+    expires_at = Column(DateTime, nullable=False, index=True)
 
     def revoke(self):
         self.mark_deleted()
 
+        # Signed tokens are verified without this row and opaque ones can be cached by any
+        # worker, every worker learns about the revocation from revoked_token.
+        session = object_session(self)
+        session.add(RevokedToken(uid=self.uid, expires_at=self.expires_at))
+
+        # This worker right away, once the revocation is committed.
+        uid, expires_at = self.uid, self.expires_at
+        event.listen(session, 'after_commit', lambda _: revocation_list.add(uid, expires_at), once=True)
+
     @staticmethod
-    def create_token(session, user, token_type):
-        token = AuthToken(auth=user, token_type=token_type)
+    def create_token(session, auth_uid, token_type, expire_seconds=None, max_live=None):
+        """ Add a token of `auth_uid` valid for `expire_seconds`.
+            With `max_live`, the oldest live tokens of the user past that count are revoked.
+        """
+        expire_seconds = expire_seconds or AuthToken.DEFAULT_EXPIRE_SECONDS
+        created_at = datetime.datetime.utcnow()
+
+        if max_live:
+            AuthToken.revoke_oldest(session, auth_uid, token_type, max_live - 1)
+
+        token = AuthToken(
+            auth_uid=auth_uid,
+            token_type=token_type,
+            created_at=created_at,
+            expire_timeout_seconds=expire_seconds,
+            expires_at=created_at + datetime.timedelta(seconds=expire_seconds)
+        )
         session.add(token)
         return token
 
+    @staticmethod
+    def revoke_oldest(session, auth_uid, token_type, keep):
+        """ Revoke the live tokens of `auth_uid` but the `keep` most recent ones. """
+        stale = session \
+            .query(AuthToken) \
+            .filter(AuthToken.auth_uid == auth_uid,
+                    AuthToken.token_type == token_type,
+                    AuthToken.is_deleted == False,
+                    AuthToken.expires_at > datetime.datetime.utcnow()) \
+            .order_by(AuthToken.created_at.desc()) \
+            .offset(keep) \
+            .all()
+
+        for token in stale:
+            token.revoke()
+
     @staticmethod
     def get(session, token_uid, token_type):
         stored = session \
@@ -61,9 +114,78 @@ class AuthToken(UIDMixin, DeletableMixin, Base):
             .first()
         return stored
 
-    def expires_at(self):
-        return self.created_at + datetime.timedelta(seconds=self.expire_timeout_seconds)
-
     def is_expired(self):
         now = datetime.datetime.utcnow()
-        return self.expires_at() < now
\ No newline at end of file
+        return self.expires_at < now
+
+
+class RevokedToken(UIDMixin, Base):
+    """    Revocation list of the auth tokens, uid is the one of the revoked AuthToken.
+        Rows are kept until the token expires.
+    """
+    __tablename__ = 'revoked_token'
+
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class PermissionChange(UIDMixin, Base):
+    """    Permission changes of the users, polled by every worker with the revocation list so the
+        principals they cached with the old permissions are dropped. Rows are kept until no
+        worker can still hold such a principal, see `record`.
+    """
+    __tablename__ = 'permission_change'
+
+    auth_uid = Column(UUID, nullable=False)
+
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def record(session, auth_uid):
+        """ Record a change of the permissions or product grants of `auth_uid`. """
+        created_at = datetime.datetime.utcnow()
+
+        # Cached principals live ttl_seconds at most, the pollers re-read the last minute.
+        session.add(PermissionChange(
+            auth_uid=auth_uid,
+            created_at=created_at,
+            expires_at=created_at + datetime.timedelta(seconds=token_cache.ttl_seconds + 60)
+        ))
+
+
+class ProductPermission(UIDMixin, Base):
+    """    Permission flags granted to a user on a single product, on top of Auth.permissions.
+    """
+    __tablename__ = 'product_permission'
+
+    __table_args__ = (
+        UniqueConstraint('auth_uid', 'product_uid', name='uq_product_permission_auth_uid_product_uid'),
+    )
+
+    auth_uid = Column(UUID, ForeignKey('auth.uid'), nullable=False)
+    product_uid = Column(UUID, ForeignKey('product.uid'), nullable=False)
+
+    permissions = Column(Integer, nullable=False)
+
+    @staticmethod
+    def granted(session, auth_uid):
+        """ {product_uid: permissions} of the product grants of `auth_uid`. """
+        return dict(
+            session.query(ProductPermission.product_uid, ProductPermission.permissions)
+                .filter(ProductPermission.auth_uid == auth_uid)
+        )
+
+    @staticmethod
+    def grant(session, auth_uid, product_uid, permissions):
+        """ Set the permissions of `auth_uid` on `product_uid`, in one upsert. """
+        statement = postgresql.insert(ProductPermission.__table__).values(
+            uid=uuid.uuid4(),
+            created_at=datetime.datetime.utcnow(),
+            auth_uid=auth_uid,
+            product_uid=product_uid,
+            permissions=permissions
+        )
+
+        session.execute(statement.on_conflict_do_update(
+            constraint='uq_product_permission_auth_uid_product_uid',
+            set_=dict(permissions=statement.excluded.permissions)
+        ))
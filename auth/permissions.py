@@ -0,0 +1,74 @@
+import functools
+
+import tornado.web
+
+# Flags of the Auth.permissions bitmask. New permissions take the next free bit.
+CREATE_TICKET = 1 << 0
+EDIT_TICKET = 1 << 1
+VIEW_TICKET = 1 << 2
+DELETE_TICKET = 1 << 3
+
+# Access to the /api/admin routes. Not part of FLAGS, so users can't grant it to themselves
+# through the edit-user API, see tools.grant_admin.
+ADMIN = 1 << 4
+
+# In the order of the permissions array of the edit-user API.
+FLAGS = [CREATE_TICKET, EDIT_TICKET, VIEW_TICKET, DELETE_TICKET]
+
+NAMES = {
+    CREATE_TICKET: 'create ticket',
+    EDIT_TICKET: 'edit tickets',
+    VIEW_TICKET: 'view tickets',
+    DELETE_TICKET: 'delete tickets',
+    ADMIN: 'use the admin routes',
+}
+
+# Permissions of a new user.
+DEFAULT = CREATE_TICKET | VIEW_TICKET
+
+
+def from_flags(values):
+    """ Bitmask of a list of 0/1 values, in the order of FLAGS. """
+    mask = 0
+
+    for flag, value in zip(FLAGS, values):
+        if value:
+            mask |= flag
+
+    return mask
+
+
+def to_flags(mask):
+    return [1 if mask & flag else 0 for flag in FLAGS]
+
+
+def permission_error(permission):
+    return tornado.web.HTTPError(409, 'Current user don\'t have permission to {}.'.format(NAMES[permission]))
+
+
+def check(principal, permission, product_uid=None):
+    """ Raise the permission error unless `principal` is granted `permission`, globally or on
+        `product_uid`. For the handlers that know the product of the request.
+    """
+    if not principal.has_permission(permission, product_uid):
+        raise permission_error(permission)
+
+
+def requires(permission):
+    """ Decorate API methods, below `authenticated`, to require `permission` from the current user.
+        Only the principal resolved by `authenticated` is checked, no query is run.
+        Product scoped grants are not taken into account, handlers honouring them use `check`
+        once the product is known.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            if not self.current_user.has_permission(permission):
+                raise permission_error(permission)
+
+            return await method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,25 @@
+class Principal(object):
+    """    Lightweight identity of the user behind a request, resolved once by `authenticated`
+        and available to the handlers as `self.current_user`.
+
+        `permissions` is the bitmask of auth.permissions flags, `product_permissions` maps
+        product uids to the extra flags granted on that product only.
+    """
+    __slots__ = ('token_uid', 'uid', 'email', 'permissions', 'expires_at', 'product_permissions')
+
+    def __init__(self, token_uid, uid, email, permissions, expires_at, product_permissions=None):
+        self.token_uid = token_uid
+        self.uid = uid
+        self.email = email
+        self.permissions = permissions
+        self.expires_at = expires_at
+        self.product_permissions = product_permissions or {}
+
+    def has_permission(self, permission, product_uid=None):
+        """ True when all the flags of `permission` are granted, globally or on `product_uid`. """
+        granted = self.permissions
+
+        if product_uid is not None:
+            granted |= self.product_permissions.get(product_uid, 0)
+
+        return granted & permission == permission
@@ -0,0 +1,117 @@
+import datetime
+import threading
+
+from auth.cache import token_cache
+
+
+class RevocationList(object):
+    """    In-memory copy of the unexpired rows of revoked_token, so signed tokens can be
+        checked without a DB round trip, and opaque tokens cached by `auth.cache.token_cache`
+        are dropped from it.
+
+        Tokens revoked by other processes are picked up by `refresh`, along with the permission
+        changes of the users, whose cached principals are dropped too. Until the first load
+        `is_loaded` is False and callers must check the token in the DB instead.
+
+        The session functions (`load_all`, `new_rows`) are meant to run on the DB executor,
+        the other methods on the IOLoop.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+        self.loaded_until = None
+        self.permission_changes = 0
+
+    @property
+    def is_loaded(self):
+        return self.loaded_until is not None
+
+    def is_revoked(self, token_uid):
+        return token_uid in self._revoked
+
+    def add(self, token_uid, expires_at):
+        with self._lock:
+            self._revoked[token_uid] = expires_at
+
+        token_cache.invalidate(token_uid)
+
+    def extend(self, rows):
+        with self._lock:
+            for token_uid, created_at, expires_at in rows:
+                self._revoked[token_uid] = expires_at
+                self.loaded_until = max(self.loaded_until, created_at)
+
+        for token_uid, _, _ in rows:
+            token_cache.invalidate(token_uid)
+
+    def apply_permission_changes(self, rows):
+        """ Drop the cached principals of the users whose permissions changed. The rows of the
+            last minute are applied again on every refresh, which also drops a principal loaded
+            before the change but cached after its first refresh.
+        """
+        for auth_uid, created_at in rows:
+            token_cache.invalidate_user(auth_uid)
+
+            with self._lock:
+                self.loaded_until = max(self.loaded_until, created_at)
+
+        self.permission_changes += len(rows)
+
+    def prune(self):
+        """ Forget the revoked tokens that have expired anyway. """
+        now = datetime.datetime.utcnow()
+
+        with self._lock:
+            for token_uid in [uid for uid, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[token_uid]
+
+    def new_rows(self, session, since):
+        """ (uid, created_at, expires_at) of the unexpired tokens revoked after `since`, and
+            (auth_uid, created_at) of the permission changes made after `since`.
+        """
+        # Imported here as auth.models records the revocations in this list.
+        from auth.models import RevokedToken, PermissionChange
+
+        now = datetime.datetime.utcnow()
+
+        revoked = session.query(RevokedToken.uid, RevokedToken.created_at, RevokedToken.expires_at).filter(
+            RevokedToken.created_at > since,
+            RevokedToken.expires_at > now
+        ).all()
+
+        changes = session.query(PermissionChange.auth_uid, PermissionChange.created_at).filter(
+            PermissionChange.created_at > since,
+            PermissionChange.expires_at > now
+        ).all()
+
+        return revoked, changes
+
+    async def refresh(self, db, executor):
+        if self.loaded_until is None:
+            since = datetime.datetime(1970, 1, 1)
+        else:
+            # Rows committed slightly out of created_at order are covered by a small overlap.
+            since = self.loaded_until - datetime.timedelta(seconds=60)
+
+        revoked, changes = await db.run_in_session(executor, self.new_rows, since)
+
+        if self.loaded_until is None:
+            self.loaded_until = since
+
+        self.extend(revoked)
+        self.apply_permission_changes(changes)
+        self.prune()
+
+    def stats(self):
+        return dict(
+            loaded=self.is_loaded,
+            size=len(self._revoked),
+            permission_changes=self.permission_changes,
+            loaded_until=self.loaded_until
+        )
+
+
+# Process wide list used by authenticated.
+revocation_list = RevocationList()
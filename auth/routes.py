@@ -5,5 +5,7 @@ def get_app_routes():
     return [
         (r"/api/sign-up", handlers.SignupHandler),
         (r"/api/sign-in", handlers.LoginHandler),
-        (r"/api/edit-user", handlers.EditPermissionHandler)
+        (r"/api/edit-user", handlers.EditPermissionHandler),
+        (r"/api/admin/auth-cache", handlers.AuthCacheStatsHandler),
+        (r"/api/admin/token-sweeper", handlers.TokenSweeperStatsHandler)
     ]
\ No newline at end of file
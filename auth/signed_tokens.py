@@ -0,0 +1,95 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import uuid
+
+from auth.principal import Principal
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class SignedTokens(object):
+    """    Self-contained auth tokens: '<payload>.<signature>', both base64url encoded, the
+        payload being the JSON of the token uid, user uid, email, permission masks and expiry,
+        signed with HMAC-SHA256. They are verified without a DB lookup.
+
+        Each signed token still has its AuthToken row (type SIGNED_TOKEN), so it can be revoked,
+        see auth.revocation.
+    """
+
+    def __init__(self, secret=None, enabled=False):
+        self.secret = secret
+        self.enabled = enabled
+
+    def configure(self, mode='opaque', secret=None, **_):
+        if mode not in ('opaque', 'signed'):
+            raise ValueError('Invalid auth token mode {}. Must be one of opaque or signed.'.format(mode))
+
+        if mode == 'signed' and not secret:
+            raise ValueError('The signed auth token mode needs a secret.')
+
+        self.enabled = mode == 'signed'
+        self.secret = secret.encode('utf8') if secret else None
+
+    @staticmethod
+    def is_signed(token):
+        return '.' in token
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def encode(self, principal):
+        payload = _b64encode(json.dumps(dict(
+            t=principal.token_uid.hex,
+            u=principal.uid.hex,
+            e=principal.email,
+            p=principal.permissions,
+            g=dict((uid.hex, mask) for uid, mask in principal.product_permissions.items()),
+            x=int((principal.expires_at - datetime.datetime(1970, 1, 1)).total_seconds())
+        ), separators=(',', ':')).encode('utf8'))
+
+        return '{}.{}'.format(payload, _b64encode(self._sign(payload)))
+
+    def decode(self, token):
+        """ Principal of a valid signed `token`. None when it is malformed, badly signed or expired.
+            Revocation is checked by the caller.
+        """
+        if not self.secret:
+            return None
+
+        try:
+            payload, signature = token.split('.')
+
+            if not hmac.compare_digest(self._sign(payload), _b64decode(signature)):
+                return None
+
+            data = json.loads(_b64decode(payload))
+
+            principal = Principal(
+                token_uid=uuid.UUID(data['t']),
+                uid=uuid.UUID(data['u']),
+                email=data['e'],
+                permissions=data['p'],
+                expires_at=datetime.datetime.utcfromtimestamp(data['x']),
+                product_permissions=dict((uuid.UUID(uid), mask) for uid, mask in data.get('g', {}).items())
+            )
+
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+        if principal.expires_at <= datetime.datetime.utcnow():
+            return None
+
+        return principal
+
+
+# Process wide codec used by authenticated and the auth handlers.
+signed_tokens = SignedTokens()
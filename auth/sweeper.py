@@ -0,0 +1,109 @@
+import datetime
+import logging
+import time
+
+from sqlalchemy import select, delete, and_
+
+from auth.models import AuthToken, RevokedToken, PermissionChange
+
+
+class TokenSweeper(object):
+    """    Deletes the expired and the revoked auth tokens, so the auth_token table doesn't
+        grow with every login, the revocation list entries of the expired tokens and the
+        permission changes no cached principal can predate anymore.
+
+        Each batch of at most `batch_size` rows is deleted in its own transaction, and a run
+        stops after `max_batches` batches of each kind, the rest is left to the next run.
+        Meant to be run by a single process, see server.schedule_background_tasks.
+    """
+
+    def __init__(self, batch_size=1000, max_batches=10, grace_seconds=0):
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.grace_seconds = grace_seconds
+
+        self.enabled = False
+        self.running = False
+
+        self.runs = 0
+        self.errors = 0
+        self.deleted = dict(expired=0, revoked=0, revocations=0, permission_changes=0)
+        self.last_run_at = None
+        self.last_run_ms = None
+
+    def configure(self, batch_size=None, max_batches=None, grace_seconds=None, **_):
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        if max_batches is not None:
+            self.max_batches = max_batches
+
+        if grace_seconds is not None:
+            self.grace_seconds = grace_seconds
+
+    def conditions(self):
+        """ (name, model, WHERE clause) of the rows to delete. """
+        before = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.grace_seconds)
+
+        return [
+            ('expired', AuthToken, AuthToken.expires_at < before),
+            ('revoked', AuthToken, and_(AuthToken.is_deleted == True, AuthToken.deleted_at < before)),
+            ('revocations', RevokedToken, RevokedToken.expires_at < before),
+            ('permission_changes', PermissionChange, PermissionChange.expires_at < before),
+        ]
+
+    def delete_batch(self, session, model, condition):
+        """ Delete up to `batch_size` rows of `model` matching `condition`, return how many were
+            deleted. Rows locked by another transaction are skipped.
+        """
+        uids = select(model.uid).where(condition).limit(self.batch_size).with_for_update(skip_locked=True)
+
+        return session.execute(
+            delete(model).where(model.uid.in_(uids)).execution_options(synchronize_session=False)
+        ).rowcount
+
+    async def sweep(self, db, executor):
+        if self.running:
+            return
+
+        self.running = True
+        start = time.perf_counter()
+
+        try:
+            for name, model, condition in self.conditions():
+                for _ in range(self.max_batches):
+                    deleted = await db.run_in_session(executor, self.delete_batch, model, condition)
+
+                    self.deleted[name] += deleted
+
+                    if deleted < self.batch_size:
+                        break
+
+        except Exception:
+            self.errors += 1
+            logging.exception('Auth token sweep failed')
+
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_run_at = datetime.datetime.utcnow()
+            self.last_run_ms = (time.perf_counter() - start) * 1000
+
+    def stats(self):
+        return dict(
+            enabled=self.enabled,
+            batch_size=self.batch_size,
+            max_batches=self.max_batches,
+            runs=self.runs,
+            errors=self.errors,
+            expired_deleted=self.deleted['expired'],
+            revoked_deleted=self.deleted['revoked'],
+            revocations_deleted=self.deleted['revocations'],
+            permission_changes_deleted=self.deleted['permission_changes'],
+            last_run_at=self.last_run_at,
+            last_run_ms=self.last_run_ms
+        )
+
+
+# Process wide sweeper, only enabled in the process running the background sweeps.
+token_sweeper = TokenSweeper()
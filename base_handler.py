@@ -1,11 +1,79 @@
 import tornado.web
 import tornado.escape
+import tornado.ioloop
+import contextvars
 import functools
+import hashlib
+import email.utils
+import time
 
-from auth.models import AuthToken
+from auth.cache import token_cache
+from auth.revocation import revocation_list
+from auth.signed_tokens import signed_tokens
+from auth.principal import Principal
+from auth.models import AuthToken, Auth, ProductPermission
 from utils.app_util import convert_uuid_or_400
+from utils.json_encoder import json_encoder
+from utils.instrumentation import RequestStats, current_request, request_metrics
 
 class BaseHandler(tornado.web.RequestHandler):
+    _in_flight = False
+
+    # RequestStats of this request, see utils.instrumentation.
+    stats = None
+
+    def prepare(self):
+        self._in_flight = True
+        self.application.in_flight += 1
+
+        if request_metrics.enabled:
+            self.stats = RequestStats()
+            current_request.set(self.stats)
+
+    def on_finish(self):
+        if self._in_flight:
+            self._in_flight = False
+            self.application.in_flight -= 1
+
+        if self.stats is not None:
+            request_metrics.observe(
+                type(self).__name__, self.request.method, self.get_status(), self.request.uri, self.stats
+            )
+            current_request.set(None)
+
+    def finish(self, chunk=None):
+        if chunk is not None:
+            self.write(chunk)
+
+        if self.stats is not None and not self._headers_written:
+            self.set_header('Server-Timing', self.stats.server_timing())
+
+        return super(BaseHandler, self).finish()
+
+    def write(self, chunk):
+        """ Same as RequestHandler.write, but dicts are encoded with `utils.json_encoder`,
+            which takes UUIDs and datetimes as they are.
+        """
+        if isinstance(chunk, dict):
+            start = time.perf_counter()
+            chunk = json_encoder.encode(chunk)
+            self.set_header('Content-Type', 'application/json; charset=UTF-8')
+
+            if self.stats is not None:
+                self.stats.add_timing('json', time.perf_counter() - start)
+
+        chunk = tornado.escape.utf8(chunk)
+
+        if self.stats is not None:
+            self.stats.response_bytes += len(chunk)
+
+        super(BaseHandler, self).write(chunk)
+
+    def write_encoded(self, body):
+        """ Write `body`, a response dict already encoded to JSON. """
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.write(body)
+
     @property
     def db(self):
         return self.application.db
@@ -13,6 +81,142 @@ class BaseHandler(tornado.web.RequestHandler):
     def session_scope(self):
         return self.db.session_scope()
 
+    def async_session_scope(self):
+        return self.db.async_session_scope()
+
+    async def run_blocking(self, executor, fn, *args):
+        """ Run the blocking `fn(*args)` on `executor` without stalling the IOLoop.
+            When the application runs without executors (async_mode off) `fn` is called inline.
+        """
+        if executor is None:
+            return fn(*args)
+
+        # The request context goes along, so the queries are recorded in this request's stats.
+        return await tornado.ioloop.IOLoop.current().run_in_executor(
+            executor, contextvars.copy_context().run, fn, *args
+        )
+
+    async def run_in_session(self, fn, *args):
+        """ Run `fn(session, *args)` inside a session scope and return its result.
+            `fn` must not touch the handler (write, flush...), return the response instead.
+
+            With the asyncio engine `fn` is run through `AsyncSession.run_sync` on the IOLoop,
+            otherwise on the DB executor.
+        """
+        return await self.db.run_in_session(self.application.db_executor, fn, *args)
+
+    async def stream_query(self, statement, consume, batch_size=1000):
+        """ Run the select `statement` with a server-side cursor and `await consume(rows)` for
+            each batch of at most `batch_size` rows, so the full result is never held in memory.
+        """
+        if self.db.is_async:
+            async with self.async_session_scope() as session:
+                result = await session.stream(statement)
+
+                async for rows in result.partitions(batch_size):
+                    await consume(rows)
+
+            return
+
+        # The session is only ever used by one executor thread at a time.
+        executor = self.application.db_executor
+        session = self.db.session()
+
+        try:
+            result = await self.run_blocking(
+                executor, session.execute, statement.execution_options(stream_results=True)
+            )
+            partitions = result.partitions(batch_size)
+
+            while True:
+                rows = await self.run_blocking(executor, next, partitions, None)
+
+                if rows is None:
+                    break
+
+                await consume(rows)
+
+        finally:
+            await self.run_blocking(executor, session.close)
+
+    async def export_rows(self, statement, convert_to_dict, batch_size=1000):
+        """ Stream the rows of `statement` to the client as a JSON array, or as NDJSON when
+            the `format` query argument is 'ndjson'. Each batch is encoded and flushed on its own.
+        """
+        output_format = self.get_query_argument('format', 'json')
+
+        if output_format not in ('json', 'ndjson'):
+            raise tornado.web.HTTPError(400, 'Invalid format. Must be one of json or ndjson.')
+
+        ndjson = output_format == 'ndjson'
+
+        if ndjson:
+            self.set_header('Content-Type', 'application/x-ndjson')
+        else:
+            self.set_header('Content-Type', 'application/json; charset=UTF-8')
+            self.write('[')
+
+        first = [True]
+
+        async def write_batch(rows):
+            start = time.perf_counter()
+            encoded = [json_encoder.encode(item) for item in convert_to_dict(rows)]
+
+            if self.stats is not None:
+                self.stats.add_timing('json', time.perf_counter() - start)
+
+            if ndjson:
+                self.write(b'\n'.join(encoded) + b'\n')
+            else:
+                self.write((b'' if first[0] else b',') + b','.join(encoded))
+
+            first[0] = False
+
+            await self.flush()
+
+        await self.stream_query(statement, write_batch, batch_size)
+
+        if not ndjson:
+            self.write(']')
+
+    def not_modified(self, last_modified):
+        """ Set the ETag and Last-Modified headers of a response whose content only changes with
+            `last_modified` (the updated_at of the data) and the request URI.
+
+            Return True when the client copy named by If-None-Match or If-Modified-Since is still
+            current. The status is then set to 304 and the handler must return without writing,
+            so the full query and serialization can be skipped.
+        """
+        if last_modified is None:
+            return False
+
+        version = '{}|{}'.format(self.request.uri, last_modified.isoformat())
+        self.set_header('Etag', '"{}"'.format(hashlib.sha1(version.encode('utf8')).hexdigest()))
+        self.set_header('Last-Modified', last_modified)
+
+        if self.request.headers.get('If-None-Match'):
+            current = self.check_etag_header()
+
+        else:
+            current = False
+            since = self.request.headers.get('If-Modified-Since')
+
+            if since:
+                try:
+                    since = email.utils.parsedate_to_datetime(since).replace(tzinfo=None)
+                    current = last_modified.replace(microsecond=0) <= since
+                except (TypeError, ValueError):
+                    pass
+
+        if current:
+            self.set_status(304)
+
+        return current
+
+    @property
+    def password_hasher(self):
+        return self.application.password_hasher
+
     def access_token_from_query_string(self):
         return self.get_query_argument('access_token', None)
 
@@ -30,26 +234,78 @@ class BaseHandler(tornado.web.RequestHandler):
         return data
 
 
+def load_principal(session, token_uid):
+    row = session.query(AuthToken, Auth.email, Auth.permissions) \
+        .join(Auth, AuthToken.auth_uid == Auth.uid) \
+        .filter(AuthToken.uid == token_uid) \
+        .one_or_none()
+
+    if not row:
+        raise tornado.web.HTTPError(403, 'Auth token invalid or expired. Please login.')
+
+    token, email, permissions = row
+
+    if token.is_expired() or token.is_deleted:
+        raise tornado.web.HTTPError(403, 'Auth token invalid or expired. Please login.')
+
+    return Principal(
+        token_uid=token.uid,
+        uid=token.auth_uid,
+        email=email,
+        permissions=permissions,
+        expires_at=token.expires_at,
+        product_permissions=ProductPermission.granted(session, token.auth_uid)
+    )
+
+
 def authenticated(method):
     """ Decorate API methods with this to require that token is passed against Authorization.
         If the token is missing , 401 HTTP error is thrown
+
+        The token and its user are resolved with a single query into a `Principal` that is
+        set as `self.current_user`. Principals are kept in `auth.cache.token_cache`, so repeated
+        calls with the same token don't hit the database until the cache entry expires.
+        Signed tokens (see `auth.signed_tokens`) carry the principal and are only checked
+        against the in-memory revocation list, which also rejects the revoked opaque tokens
+        still cached by this worker.
     """
 
     @functools.wraps(method)
-    def wrapper(self, *args, **kwargs):
+    async def wrapper(self, *args, **kwargs):
         token = self.access_token_from_authorization_header()
 
         if token is None:
             raise tornado.web.HTTPError(401, 'Unauthorized Access. Auth token missing.')
 
-        with self.session_scope() as session:
-            token = convert_uuid_or_400(token)
+        principal = None
 
-            token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
+        if signed_tokens.is_signed(token):
+            principal = signed_tokens.decode(token)
 
-            if not token or token.is_expired() or token.is_deleted:
+            if principal is None or revocation_list.is_revoked(principal.token_uid):
                 raise tornado.web.HTTPError(403, 'Auth token invalid or expired. Please login.')
 
-        return method(self, *args, **kwargs)
+            if not revocation_list.is_loaded:
+                # Until the revocation list is loaded, the token row is checked like an opaque token.
+                token, principal = principal.token_uid, None
+
+        else:
+            token = convert_uuid_or_400(token)
+
+            # A principal cached before the revocation was committed is not trusted either.
+            if revocation_list.is_revoked(token):
+                raise tornado.web.HTTPError(403, 'Auth token invalid or expired. Please login.')
+
+        if principal is None:
+            principal = token_cache.get(token)
+
+        if principal is None:
+            principal = await self.run_in_session(load_principal, token)
+
+            token_cache.put(principal)
+
+        self.current_user = principal
+
+        return await method(self, *args, **kwargs)
 
     return wrapper
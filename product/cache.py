@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+
+
+class LocalCacheBackend(object):
+    """    In-process cache backend. Each worker has its own copy, so entries changed through
+        another worker are only seen once they expire. Also the stand-in for the shared
+        backend in tests.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            return value
+
+    async def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+
+    async def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisCacheBackend(object):
+    """    Cache backend shared by all the workers and dynos, values are stored as JSON.
+        Needs the optional `redis` package.
+    """
+
+    def __init__(self, url):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(url)
+
+    async def get(self, key):
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl_seconds):
+        await self.client.set(key, json.dumps(value), ex=ttl_seconds)
+
+    async def delete(self, *keys):
+        await self.client.delete(*keys)
+
+
+class ProductCache(object):
+    """    Read-through cache of the live products: the serialized response of each product
+        plus the one of the product listing. Writes invalidate the product and the listing.
+    """
+    LIST_KEY = 'product:list'
+
+    def __init__(self, backend=None, ttl_seconds=60):
+        self.backend = backend or LocalCacheBackend()
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, backend='local', redis_url=None, ttl_seconds=None):
+        if backend == 'redis':
+            self.backend = RedisCacheBackend(redis_url)
+        else:
+            self.backend = LocalCacheBackend()
+
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def product_key(uid):
+        return 'product:{}'.format(uid)
+
+    async def _get(self, key):
+        value = await self.backend.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    @staticmethod
+    def entry(body, updated_at):
+        """ Cached response: its JSON encoded `body` and the `updated_at` it is a version of. """
+        return dict(
+            body=body.decode('utf8'),
+            updated_at=updated_at.isoformat() if updated_at else None
+        )
+
+    async def get_product(self, uid):
+        """ Entry (see `entry`) of the product `uid`. """
+        return await self._get(self.product_key(uid))
+
+    async def set_product(self, uid, entry):
+        await self.backend.set(self.product_key(uid), entry, self.ttl_seconds)
+
+    async def get_list(self):
+        """ Entry (see `entry`) of the product listing. """
+        return await self._get(self.LIST_KEY)
+
+    async def set_list(self, entry):
+        await self.backend.set(self.LIST_KEY, entry, self.ttl_seconds)
+
+    async def invalidate(self, uid=None):
+        keys = [self.LIST_KEY]
+
+        if uid is not None:
+            keys.append(self.product_key(uid))
+
+        await self.backend.delete(*keys)
+
+    def stats(self):
+        return dict(
+            backend=self.backend.__class__.__name__,
+            ttl_seconds=self.ttl_seconds,
+            hits=self.hits,
+            misses=self.misses
+        )
+
+
+# Process wide cache used by the product and ticket handlers.
+product_cache = ProductCache()
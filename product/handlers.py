@@ -1,29 +1,55 @@
+import datetime
+
 import tornado.web
 from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 
 from base_handler import BaseHandler, authenticated
 from product.models import Product
+from product.cache import product_cache
+from ticket.models import TicketStats
+from auth import permissions as perms
 from utils.app_util import is_valid_email, convert_uuid_or_400
+from utils.json_encoder import json_encoder
 
 
 class CreateProductHandler(BaseHandler):
     @authenticated
-    def get(self):
+    async def get(self):
         """
             Handler to list all the products.
             route - /api/product
             Method - GET
-            :return: list of non-deleted products
+            :return: list of non-deleted products, 304 when the If-None-Match / If-Modified-Since
+                     copy is still current
         """
-        with self.session_scope() as session:
-            products = session.query(Product).filter(Product.is_deleted == False).all()
+        listing = await product_cache.get_list()
+
+        if listing is None:
+            # The version is read first, a 304 doesn't need the listing. Read before the listing
+            # it can only be older than it, the next request then gets the listing again.
+            last_modified = await self.run_in_session(Product.last_modified)
+
+            if self.not_modified(last_modified):
+                return
+
+            def list_products(session):
+                products = session.query(*Product.columns()).filter(Product.is_deleted == False).all()
 
-            response = Product.convert_to_dict(products)
+                return Product.convert_to_dict(products)
 
-            self.write(dict(products=response))
+            response = await self.run_in_session(list_products)
+
+            listing = product_cache.entry(json_encoder.encode(dict(products=response)), last_modified)
+            await product_cache.set_list(listing)
+
+        elif listing['updated_at'] and self.not_modified(datetime.datetime.fromisoformat(listing['updated_at'])):
+            return
+
+        self.write_encoded(listing['body'])
 
     @authenticated
-    def post(self):
+    async def post(self):
         """
             Handler to create new product.
             Route - /api/product
@@ -52,8 +78,8 @@ class CreateProductHandler(BaseHandler):
         if not owners_email or not is_valid_email(owners_email):
             raise tornado.web.HTTPError(400, 'Invalid Owner\'s email.')
 
-        with self.session_scope() as session:
-            if session.query(Product).filter(and_(Product.name == name, Product.is_deleted == False)).one_or_none():
+        def create_product(session):
+            if session.query(Product.uid).filter(and_(Product.name == name, Product.is_deleted == False)).first():
                 raise tornado.web.HTTPError(400, 'Product with the name {} already exists'.format(name))
 
             product = Product(
@@ -62,49 +88,89 @@ class CreateProductHandler(BaseHandler):
                 owner_email=owners_email
             )
             session.add(product)
-            session.flush()
 
-            response = product.to_json()
+            # A concurrent create with the same name passes the check above and is stopped by
+            # uq_product_live_name.
+            try:
+                session.flush()
+            except IntegrityError:
+                raise tornado.web.HTTPError(400, 'Product with the name {} already exists'.format(name))
+
+            return product.to_json()
+
+        response = await self.run_in_session(create_product)
+
+        await product_cache.invalidate()
 
-            self.write(response)
+        self.write(response)
+
+
+class ProductExportHandler(BaseHandler):
+    @authenticated
+    async def get(self):
+        """
+        Handler to export all the products.
+        Rows are streamed from a server-side cursor, so memory use doesn't grow with the table.
+
+        Route - /api/product/export
+        Method - GET
+        :param format: json (default) for a JSON array or ndjson for one product per line.
+        :return: all non-deleted products
+        """
+        await self.export_rows(Product.export_query(), Product.convert_to_dict)
 
 
 class ProductHandler(BaseHandler):
     @authenticated
-    def get(self, product_uid):
+    async def get(self, product_uid):
         """
         Handler to get the product details for th given product uid.
 
         Route - /api/product/<product-uid>
         Method - GET
         :param product_uid: uid of the product
-        :return: json of the product.
+        :return: json of the product, 304 when the If-None-Match / If-Modified-Since copy is still current.
         """
         product_uid = convert_uuid_or_400(product_uid)
 
-        with self.session_scope() as session:
-            product = session.query(Product).filter(
-                and_(
-                    Product.uid == product_uid,
-                    Product.is_deleted == False
-                )
-            ).one_or_none()
+        cached = await product_cache.get_product(product_uid)
 
-            if product:
-                response = dict(
-                    name=product.name,
-                    type=product.type,
-                    owner=product.owner_email,
-                    uid=str(product.uid),
-                    created_at=product.created_at.isoformat()
-                )
-                self.write(response)
+        if cached is None:
+            # The version is read first, a 304 doesn't need the product.
+            last_modified = await self.run_in_session(Product.last_modified, product_uid)
 
-            else:
+            if not last_modified:
                 raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
 
+            if self.not_modified(last_modified):
+                return
+
+            def get_product(session):
+                product = session.query(*Product.columns()).filter(
+                    and_(
+                        Product.uid == product_uid,
+                        Product.is_deleted == False
+                    )
+                ).one_or_none()
+
+                if product:
+                    return Product.convert_to_dict([product])[0]
+
+                else:
+                    raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
+
+            response = await self.run_in_session(get_product)
+
+            cached = product_cache.entry(json_encoder.encode(response), response['updated_at'])
+            await product_cache.set_product(product_uid, cached)
+
+        elif self.not_modified(datetime.datetime.fromisoformat(cached['updated_at'])):
+            return
+
+        self.write_encoded(cached['body'])
+
     @authenticated
-    def put(self, product_uid):
+    async def put(self, product_uid):
         """
         Handler to edit the product.
 
@@ -131,7 +197,7 @@ class ProductHandler(BaseHandler):
         if not owners_email or not is_valid_email(owners_email):
             raise tornado.web.HTTPError(400, 'Invalid Owner\'s email.')
 
-        with self.session_scope() as session:
+        def update_product(session):
             product = session.query(Product).filter(
                 and_(
                     Product.uid == product_uid,
@@ -144,17 +210,25 @@ class ProductHandler(BaseHandler):
                 product.type = type
                 product.owner_email = owners_email
 
-                session.flush()
-
-                response = product.to_json()
+                # Renaming to the name of another live product is stopped by uq_product_live_name.
+                try:
+                    session.flush()
+                except IntegrityError:
+                    raise tornado.web.HTTPError(400, 'Product with the name {} already exists'.format(name))
 
-                self.write(response)
+                return product.to_json()
 
             else:
                 raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
 
+        response = await self.run_in_session(update_product)
+
+        await product_cache.invalidate(product_uid)
+
+        self.write(response)
+
     @authenticated
-    def delete(self, product_uid):
+    async def delete(self, product_uid):
         """
         Handler to delete the product.
         Route - /api/product/<product-uid>
@@ -164,7 +238,7 @@ class ProductHandler(BaseHandler):
         """
         product_uid = convert_uuid_or_400(product_uid)
 
-        with self.session_scope() as session:
+        def delete_product(session):
             product = session.query(Product).filter(
                 and_(
                     Product.uid == product_uid,
@@ -177,7 +251,48 @@ class ProductHandler(BaseHandler):
 
                 response = product.to_json()
                 response['deleted_at'] = product.deleted_at.isoformat()
-                self.write(response)
+                return response
 
             else:
                 raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
+
+        response = await self.run_in_session(delete_product)
+
+        await product_cache.invalidate(product_uid)
+
+        self.write(response)
+
+
+class ProductStatsHandler(BaseHandler):
+    @authenticated
+    async def get(self, product_uid):
+        """
+        Handler to get the ticket counts of a product, if the user has permission to view its tickets.
+
+        Route - /api/product/<product-uid>/stats
+        Method - GET
+        :param product_uid: uid of the product
+        :return: product_uid, total, counts of the live tickets by status and by type.
+        """
+        product_uid = convert_uuid_or_400(product_uid)
+
+        if not self.current_user.has_permission(perms.VIEW_TICKET, product_uid):
+            raise perms.permission_error(perms.VIEW_TICKET)
+
+        def get_stats(session):
+            rows = TicketStats.products_query(session, product_uid).all()
+
+            # Products without tickets have no rows.
+            if not rows and not session.query(Product.uid).filter(
+                    and_(Product.uid == product_uid, Product.is_deleted == False)).first():
+                raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
+
+            response = TicketStats.summarize(rows)
+            del response['products']
+
+            return response
+
+        response = await self.run_in_session(get_stats)
+        response['product_uid'] = product_uid
+
+        self.write(response)
@@ -1,14 +1,21 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, Index, select, and_
 
 from utils.dbbase import Base
-from utils.mixins import UIDMixin, DeletableMixin
+from utils.table_version import TableVersion
+from utils.mixins import UIDMixin, DeletableMixin, UpdatedAtMixin, live_rows
 
 
-class Product(UIDMixin, DeletableMixin, Base):
+class Product(UIDMixin, DeletableMixin, UpdatedAtMixin, Base):
     """    Product is an identity for which tickets can be created
     """
     __tablename__ = 'product'
 
+    __table_args__ = (
+        # Names are unique among the live products only, deleted ones can be reused.
+        Index('uq_product_live_name', 'name', unique=True, postgresql_where=live_rows()),
+        Index('ix_product_live_created_at_uid', 'created_at', 'uid', postgresql_where=live_rows()),
+    )
+
     HEALTH_CARE = 'health_care'
     BANKING = 'banking'
     OTHERS = 'others'
@@ -20,19 +27,51 @@ class Product(UIDMixin, DeletableMixin, Base):
 
     owner_email = Column(String(30), nullable=False)
 
+    @staticmethod
+    def last_modified(session, uid=None):
+        """ updated_at of the live product `uid` (None when there is none), or without `uid` the
+            commit-ordered version of the product table, see TableVersion. Version of the HTTP responses.
+        """
+        if uid is None:
+            return TableVersion.get(session, Product.__tablename__)
+
+        return session.query(Product.updated_at).filter(
+            and_(Product.uid == uid, Product.is_deleted == False)
+        ).scalar()
+
+    @staticmethod
+    def columns():
+        """ Columns read by convert_to_dict. Listings query them alone, without ORM instances. """
+        return (
+            Product.name,
+            Product.type,
+            Product.owner_email,
+            Product.uid,
+            Product.created_at,
+            Product.updated_at
+        )
+
+    @staticmethod
+    def export_query():
+        """ Columns of all live products needed by convert_to_dict, for streaming exports. """
+        return select(*Product.columns()).where(Product.is_deleted == False).order_by(Product.created_at, Product.uid)
+
     @staticmethod
     def convert_to_dict(products):
-        data = []
-
-        for product in products:
-            data.append(
-                dict(
-                    name=product.name,
-                    type=product.type,
-                    owner=product.owner_email,
-                    uid=str(product.uid),
-                    created_at=product.created_at.isoformat()
-                )
+        """ Response dicts of the given product rows or instances. The uids and dates are left
+            as they are, the response encoder serializes them.
+        """
+        return [
+            dict(
+                name=product.name,
+                type=product.type,
+                owner=product.owner_email,
+                uid=product.uid,
+                created_at=product.created_at,
+                updated_at=product.updated_at
             )
+            for product in products
+        ]
+
 
-        return data
+TableVersion.track(Product.__table__)
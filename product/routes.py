@@ -4,5 +4,7 @@ from product import handlers
 def get_app_routes():
     return [
         (r"/api/product", handlers.CreateProductHandler),
+        (r"/api/product/export", handlers.ProductExportHandler),
+        (r"/api/product/([-0-9a-fA-F]*)/stats", handlers.ProductStatsHandler),
         (r"/api/product/([-0-9a-fA-F]*)", handlers.ProductHandler)
     ]
\ No newline at end of file
@@ -1,23 +1,48 @@
 import tornado.web
+import tornado.gen
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import logging
 import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
 
 
 from auth import routes as auth_routes
 from ticket import routes as ticket_routes
 from product import routes as product_routes
 from utils.db import Db
+from utils.password_hasher import PasswordHasher
 from settings import settings
 from auth.handlers import IndexHandler
+from admin.handlers import PoolStatsHandler, MetricsHandler, PartitionStatsHandler, TicketArchiveStatsHandler
+from admin.handlers import WorkerMetricsHandler
+from auth.cache import token_cache
+from auth.email_filter import email_filter
+from auth.sweeper import token_sweeper
+from auth.signed_tokens import signed_tokens
+from auth.revocation import revocation_list
+from product.cache import product_cache
+from ticket.archive import ticket_archiver
+from utils.json_encoder import json_encoder
+from utils.instrumentation import instrument_engine, request_metrics
+from utils.partitions import partition_manager, partitioned_tables
+from models import Base
 
 class ApiApplication(tornado.web.Application):
-    pass
+    # Requests between BaseHandler.prepare and on_finish, drained on shutdown.
+    in_flight = 0
 
 
 def create(settings):
     routes = [
         (r"/api", IndexHandler),
+        (r"/api/admin/pool", PoolStatsHandler),
+        (r"/api/admin/metrics", MetricsHandler),
+        (r"/api/admin/partitions", PartitionStatsHandler),
+        (r"/api/admin/ticket-archive", TicketArchiveStatsHandler),
     ]
 
     # Adding the routes of all the modules
@@ -31,23 +56,173 @@ def create(settings):
     application = ApiApplication(routes, **settings['tornado'])
 
     application.db = Db(**settings['db'])
+
+    request_metrics.configure(worker=tornado.process.task_id() or 0, **settings['metrics'])
+
+    if request_metrics.enabled:
+        instrument_engine(application.db.serving_engine)
+
+    token_cache.configure(**settings['auth_cache'])
+    email_filter.configure(**settings['email_filter'])
+    token_sweeper.configure(**settings['auth_tokens'])
+    signed_tokens.configure(**settings['auth_tokens'])
+    product_cache.configure(**settings['product_cache'])
+    json_encoder.configure(**settings['json'])
+    partition_manager.configure(**settings['partitions'])
+    ticket_archiver.configure(**settings['ticket_archive'])
+
+    concurrency = settings['concurrency']
+
+    application.db_executor = None
+
+    if concurrency['async_mode'] and not application.db.is_async:
+        # Without a local pool (external pooler) fall back to the executor default size.
+        db_workers = concurrency['db_workers'] or application.db.pool_capacity
+        application.db_executor = ThreadPoolExecutor(db_workers, thread_name_prefix='db')
+
+    application.password_hasher = PasswordHasher(**settings['passwords'])
+    application.password_hasher.start(use_pool=concurrency['async_mode'])
+
     application.all_settings = settings
 
     return application
 
 
-def start(application):
+def schedule_background_tasks(application):
+    """ Periodic jobs of this process, run on the IOLoop once it is started. """
+    io_loop = tornado.ioloop.IOLoop.current()
+    db = application.db
+    executor = application.db_executor
+
+    filter_settings = application.all_settings['email_filter']
+
+    if email_filter.enabled:
+        io_loop.spawn_callback(email_filter.refresh, db, executor, True)
+
+        tornado.ioloop.PeriodicCallback(
+            lambda: email_filter.refresh(db, executor), filter_settings['refresh_seconds'] * 1000
+        ).start()
+        tornado.ioloop.PeriodicCallback(
+            lambda: email_filter.refresh(db, executor, full=True), filter_settings['rebuild_seconds'] * 1000
+        ).start()
+
+    token_settings = application.all_settings['auth_tokens']
+
+    # Needed in both token modes: signed tokens are checked against it, and the opaque tokens
+    # revoked through other workers are dropped from the token cache.
+    io_loop.spawn_callback(revocation_list.refresh, db, executor)
+
+    tornado.ioloop.PeriodicCallback(
+        lambda: revocation_list.refresh(db, executor), token_settings['revocation_refresh_seconds'] * 1000
+    ).start()
+
+    # Tokens are shared by all the workers, the first one sweeps them.
+    if token_settings['sweep_seconds'] and tornado.process.task_id() in (None, 0):
+        token_sweeper.enabled = True
+
+        tornado.ioloop.PeriodicCallback(
+            lambda: token_sweeper.sweep(db, executor), token_settings['sweep_seconds'] * 1000
+        ).start()
+
+    partition_settings = application.all_settings['partitions']
+
+    # Likewise the first worker creates the partitions of the coming months.
+    if partition_settings['check_seconds'] and tornado.process.task_id() in (None, 0):
+        partition_manager.enabled = True
+        tables = partitioned_tables(Base.metadata)
+
+        io_loop.spawn_callback(partition_manager.maintain, db, executor, tables)
+
+        tornado.ioloop.PeriodicCallback(
+            lambda: partition_manager.maintain(db, executor, tables), partition_settings['check_seconds'] * 1000
+        ).start()
+
+    archive_settings = application.all_settings['ticket_archive']
+
+    if archive_settings['run_seconds'] and tornado.process.task_id() in (None, 0):
+        ticket_archiver.enabled = True
+
+        tornado.ioloop.PeriodicCallback(
+            lambda: ticket_archiver.archive(db, executor), archive_settings['run_seconds'] * 1000
+        ).start()
+
+
+def install_shutdown_handlers(server, application):
+    """ Stop accepting connections on SIGTERM/SIGINT, let in-flight requests finish for up to
+        `shutdown_timeout` seconds, then release the DB pool and executors and stop the IOLoop.
+    """
+    io_loop = tornado.ioloop.IOLoop.current()
+    timeout = application.all_settings['server']['shutdown_timeout']
+
+    async def shutdown():
+        logging.info('Shutting down worker %s', tornado.process.task_id())
+        server.stop()
+
+        deadline = io_loop.time() + timeout
+
+        while application.in_flight > 0 and io_loop.time() < deadline:
+            await tornado.gen.sleep(0.1)
+
+        if application.db_executor is not None:
+            application.db_executor.shutdown(wait=False)
+
+        application.password_hasher.shutdown()
+
+        await application.db.dispose()
+        io_loop.stop()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        io_loop.asyncio_loop.add_signal_handler(sig, lambda: io_loop.spawn_callback(shutdown))
+
+
+def start(settings):
+    """ Bind the port once, fork the workers when more than one is configured, then build the
+        application in each worker, so no DB connection or thread is shared across processes.
+    """
     print('Starting the Application...')
 
     port = int(os.environ.get("PORT", 8998))
-    application.listen(port, **application.all_settings['tornado_server_settings'])
-    logging.info("Listening at port %d", port)
-    tornado.ioloop.IOLoop.instance().start()
+    workers = settings['server']['workers']
+
+    sockets = tornado.netutil.bind_sockets(port)
+
+    if not settings['passwords']['rounds']:
+        # Calibrated once before forking, so all the workers agree on the cost.
+        rounds = PasswordHasher.calibrate(settings['passwords']['target_ms'])
+        settings = dict(settings, passwords=dict(settings['passwords'], rounds=rounds))
+
+    if workers != 1:
+        # Autoreload (debug) can't be used with multiple processes.
+        settings = dict(settings, tornado=dict(settings['tornado'], autoreload=False))
+
+        # Dead workers are restarted by the parent, up to max_restarts times.
+        tornado.process.fork_processes(workers, max_restarts=settings['server']['max_restarts'])
+
+    application = create(settings)
+
+    server = tornado.httpserver.HTTPServer(application, **settings['tornado_server_settings'])
+    server.add_sockets(sockets)
+
+    logging.info("Worker %s listening at port %d", tornado.process.task_id(), port)
+
+    metrics_settings = settings['metrics']
+
+    if metrics_settings['enabled'] and metrics_settings['port']:
+        # Own port per worker, a scrape of the main port would land on any of them.
+        metrics_port = metrics_settings['port'] + (tornado.process.task_id() or 0)
+
+        tornado.web.Application([(r"/metrics", WorkerMetricsHandler)]).listen(
+            metrics_port, address=metrics_settings['host']
+        )
+        logging.info("Worker %s serving its metrics at port %d", tornado.process.task_id(), metrics_port)
+
+    install_shutdown_handlers(server, application)
+    schedule_background_tasks(application)
+    tornado.ioloop.IOLoop.current().start()
 
 
 if __name__ == "__main__":
     settings = settings
 
     # Start the app
-    application = create(settings)
-    start(application)
+    start(settings)
@@ -6,7 +6,19 @@ settings = dict(
         password=os.environ.get('password'),
         host=os.environ.get('host'),
         database='issue_ticket',
-        port='5432'
+        port='5432',
+        # 'sync' (psycopg2 on the DB executor) or 'async' (asyncpg on the IOLoop)
+        engine=os.environ.get('DB_ENGINE', 'sync'),
+        # Connection pool of each process. Keep pool_size + max_overflow times the number
+        # of processes below the RDS connection limit.
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        # Set when connecting through PgBouncer or another external pooler: no local pool
+        # and no statement caching.
+        external_pooler=os.environ.get('DB_EXTERNAL_POOLER', '0') == '1',
     ),
     tornado=dict(
         debug=True,
@@ -14,4 +26,92 @@ settings = dict(
     tornado_server_settings={
         "xheaders": False
     },
+    # Number of worker processes sharing the listening socket, 0 starts one per CPU.
+    # Each worker has its own DB pool, see the pool settings above.
+    server=dict(
+        workers=int(os.environ.get('WEB_CONCURRENCY', 1)),
+        max_restarts=100,
+        shutdown_timeout=int(os.environ.get('SHUTDOWN_TIMEOUT', 20)),
+    ),
+    # In-process cache of validated auth tokens
+    auth_cache=dict(
+        max_size=int(os.environ.get('AUTH_CACHE_SIZE', 10000)),
+        ttl_seconds=int(os.environ.get('AUTH_CACHE_TTL', 300)),
+    ),
+    # Per request timings (Server-Timing header, /api/admin/metrics) and the log of the requests
+    # slower than slow_request_ms, with their slowest queries. With a port, worker N also serves
+    # its metrics at http://host:(port + N)/metrics, for Prometheus to scrape every worker.
+    metrics=dict(
+        enabled=os.environ.get('REQUEST_METRICS', '1') == '1',
+        slow_request_ms=int(os.environ.get('SLOW_REQUEST_MS', 500)),
+        port=int(os.environ.get('METRICS_PORT', 0)),
+        host=os.environ.get('METRICS_HOST', '127.0.0.1'),
+    ),
+    # Encoder of the JSON responses: 'orjson' (needs the orjson package), 'json' for the stdlib,
+    # or 'auto' for orjson when it is installed.
+    json=dict(
+        backend=os.environ.get('JSON_BACKEND', 'auto'),
+    ),
+    # Read-through product cache. 'local' keeps it in each process (entries changed through
+    # another worker are seen after ttl_seconds), 'redis' shares it and needs the redis package.
+    product_cache=dict(
+        backend=os.environ.get('PRODUCT_CACHE_BACKEND', 'local'),
+        redis_url=os.environ.get('REDIS_URL'),
+        ttl_seconds=int(os.environ.get('PRODUCT_CACHE_TTL', 60)),
+    ),
+    # Auth tokens: lifetime, cap of live tokens per user (the oldest are revoked on login), and
+    # the sweeper deleting expired/revoked tokens every sweep_seconds (0 disables it).
+    # mode 'signed' issues HMAC signed tokens verified without a DB lookup, it needs a secret
+    # shared by all the workers. Revocations are picked up every revocation_refresh_seconds.
+    auth_tokens=dict(
+        mode=os.environ.get('AUTH_TOKEN_MODE', 'opaque'),
+        secret=os.environ.get('AUTH_TOKEN_SECRET'),
+        revocation_refresh_seconds=5,
+        expire_seconds=int(os.environ.get('AUTH_TOKEN_EXPIRE_SECONDS', 24 * 60 * 60)),
+        max_live_per_user=int(os.environ.get('AUTH_TOKEN_MAX_LIVE', 10)),
+        sweep_seconds=int(os.environ.get('AUTH_TOKEN_SWEEP_SECONDS', 300)),
+        batch_size=1000,
+        max_batches=10,
+        grace_seconds=3600,
+    ),
+    # Bloom filter of the registered emails used by sign-up and sign-in. Users created by other
+    # processes are added every refresh_seconds, the filter is rebuilt every rebuild_seconds.
+    email_filter=dict(
+        enabled=os.environ.get('EMAIL_FILTER', '1') == '1',
+        error_rate=0.001,
+        min_capacity=10000,
+        refresh_seconds=5,
+        rebuild_seconds=3600,
+    ),
+    # Tickets soft-deleted more than after_days days ago are moved to ticket_archive by the first
+    # worker every run_seconds (0 disables it), at most max_batches batches of batch_size a run.
+    ticket_archive=dict(
+        after_days=int(os.environ.get('TICKET_ARCHIVE_AFTER_DAYS', 30)),
+        run_seconds=int(os.environ.get('TICKET_ARCHIVE_SECONDS', 3600)),
+        batch_size=1000,
+        max_batches=10,
+    ),
+    # Monthly partitions of the partitioned tables (ticket, ticket_event) are created months_ahead
+    # months in advance by the first worker, checked every check_seconds (0 disables it).
+    partitions=dict(
+        months_ahead=3,
+        check_seconds=int(os.environ.get('PARTITION_CHECK_SECONDS', 6 * 60 * 60)),
+    ),
+    # Blocking DB work runs on this executor and bcrypt on the password hashing pool so the
+    # IOLoop is never stalled. db_workers bounds the concurrent DB sessions, 0 sizes it to the
+    # engine pool (pool_size + max_overflow). With async_mode off every handler runs its DB and
+    # bcrypt work inline on the IOLoop. The asyncio DB engine doesn't use the DB executor at all.
+    concurrency=dict(
+        async_mode=os.environ.get('ASYNC_MODE', '1') == '1',
+        db_workers=int(os.environ.get('DB_WORKERS', 0)),
+    ),
+    # bcrypt runs on a pool of `workers` processes. The cost factor is `rounds`, or calibrated
+    # against target_ms at startup when 0. Past max_pending queued hashes sign-up and sign-in
+    # answer 503.
+    passwords=dict(
+        workers=int(os.environ.get('HASH_WORKERS', 2)),
+        max_pending=int(os.environ.get('HASH_MAX_PENDING', 64)),
+        rounds=int(os.environ.get('BCRYPT_ROUNDS', 0)),
+        target_ms=int(os.environ.get('BCRYPT_TARGET_MS', 250)),
+    ),
 )
@@ -0,0 +1,153 @@
+import datetime
+import logging
+import time
+
+from sqlalchemy import select, delete, insert, update, and_, func, tuple_
+
+from ticket.models import Ticket, TicketArchive, record_transitions
+
+
+class TicketArchiver(object):
+    """    Moves the tickets soft-deleted more than `after_days` days ago from the ticket table to
+        ticket_archive, so the partitions and their indexes only hold the rows the app reads.
+
+        Each batch of at most `batch_size` tickets is moved by a single DELETE ... RETURNING
+        feeding an INSERT, in its own transaction, and a run stops after `max_batches` batches.
+        `restore` moves archived tickets back. Meant to be run by a single process, see
+        server.schedule_background_tasks.
+    """
+
+    def __init__(self, after_days=30, batch_size=1000, max_batches=10):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+        self.enabled = False
+        self.running = False
+
+        self.runs = 0
+        self.errors = 0
+        self.archived = 0
+        self.restored = 0
+        self.last_run_at = None
+        self.last_run_ms = None
+
+    def configure(self, after_days=None, batch_size=None, max_batches=None, **_):
+        if after_days is not None:
+            self.after_days = after_days
+
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        if max_batches is not None:
+            self.max_batches = max_batches
+
+    def archive_batch(self, session):
+        """ Move up to `batch_size` archivable tickets, return how many were moved. Rows locked
+            by another transaction are skipped.
+        """
+        table = Ticket.__table__
+        before = datetime.datetime.utcnow() - datetime.timedelta(days=self.after_days)
+
+        keys = select(table.c.uid, table.c.created_at) \
+            .where(and_(table.c.is_deleted == True, table.c.deleted_at < before)) \
+            .limit(self.batch_size) \
+            .with_for_update(skip_locked=True)
+
+        moved = delete(table) \
+            .where(tuple_(table.c.uid, table.c.created_at).in_(keys)) \
+            .returning(*[table.c[name] for name in TicketArchive.COLUMNS]) \
+            .cte('moved')
+
+        return session.execute(insert(TicketArchive.__table__).from_select(
+            TicketArchive.COLUMNS + ('archived_at',),
+            select(*[moved.c[name] for name in TicketArchive.COLUMNS], func.now())
+        )).rowcount
+
+    def restore(self, session, uids, undelete=False):
+        """ Move the archived tickets `uids` back to the ticket table, return the uids restored.
+            With `undelete` they are live again, counted in the ticket stats and history.
+            Otherwise they stay soft-deleted with deleted_at reset to now, so the archival only
+            picks them up again `after_days` days later.
+        """
+        archive = TicketArchive.__table__
+        table = Ticket.__table__
+
+        moved = delete(archive) \
+            .where(archive.c.uid.in_(uids)) \
+            .returning(*[archive.c[name] for name in TicketArchive.COLUMNS]) \
+            .cte('moved')
+
+        restored = set(uid for uid, in session.execute(
+            insert(table)
+                .from_select(TicketArchive.COLUMNS, select(*[moved.c[name] for name in TicketArchive.COLUMNS]))
+                .returning(table.c.uid)
+        ))
+
+        if undelete and restored:
+            transitions = [
+                (uid, product_uid, type, None, status)
+                for uid, product_uid, type, status in session.execute(
+                    update(table)
+                        .where(and_(table.c.uid.in_(restored), table.c.is_deleted == True))
+                        .values(is_deleted=False, deleted_at=None)
+                        .returning(table.c.uid, table.c.product_uid, table.c.type, table.c.status)
+                )
+            ]
+
+            record_transitions(session, transitions)
+
+        elif restored:
+            session.execute(
+                update(table)
+                    .where(and_(table.c.uid.in_(restored), table.c.is_deleted == True))
+                    .values(deleted_at=datetime.datetime.utcnow())
+            )
+
+        self.restored += len(restored)
+
+        return restored
+
+    async def archive(self, db, executor):
+        if self.running:
+            return
+
+        self.running = True
+        start = time.perf_counter()
+
+        try:
+            for _ in range(self.max_batches):
+                archived = await db.run_in_session(executor, self.archive_batch)
+
+                self.archived += archived
+
+                if archived < self.batch_size:
+                    break
+
+        except Exception:
+            self.errors += 1
+            logging.exception('Ticket archival failed')
+
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_run_at = datetime.datetime.utcnow()
+            self.last_run_ms = (time.perf_counter() - start) * 1000
+
+    def stats(self):
+        return dict(
+            enabled=self.enabled,
+            after_days=self.after_days,
+            batch_size=self.batch_size,
+            max_batches=self.max_batches,
+            runs=self.runs,
+            errors=self.errors,
+            archived=self.archived,
+            restored=self.restored,
+            last_run_at=self.last_run_at,
+            last_run_ms=self.last_run_ms
+        )
+
+
+# Process wide archiver, only enabled in the process running the background jobs.
+ticket_archiver = TicketArchiver()
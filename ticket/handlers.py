@@ -1,45 +1,126 @@
+import datetime
+import uuid
+
 import tornado.web
-from sqlalchemy import and_
+from sqlalchemy import and_, column, values, String, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
 
 from base_handler import BaseHandler, authenticated
-from ticket.models import Ticket
-from utils.app_util import convert_uuid_or_400
-from auth.models import AuthToken, Auth
+from ticket.models import Ticket, TicketStats, TicketEvent, record_transitions
+from utils.mixins import UUID
+from utils.app_util import convert_uuid_or_400, encode_cursor, decode_cursor_or_400, parse_utc_datetime
+from auth import permissions as perms
+from auth.permissions import requires
 from product.models import Product
 
 
+def parse_fields(fields):
+    """ The structured fields of a ticket (component, severity...), stored next to its text in the
+        description. Raise ValueError when they are not an object.
+    """
+    if fields is None:
+        return {}
+
+    if not isinstance(fields, dict) or 'description' in fields:
+        raise ValueError('Invalid fields. Must be an object without a description key.')
+
+    return fields
+
+
 class CreteTicketHandler(BaseHandler):
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+
     @authenticated
-    def get(self):
+    async def get(self):
         """
-        Handler to get all the tickets if the user has permission to view tickets.
+        Handler to get the tickets if the user has permission to view tickets, globally or on
+        the product_uid filter.
         Route - /api/ticket
         Method- GET
 
-        :return: list of tickets
+        :param:
+            limit - page size, default 50, max 500.
+            cursor - next_cursor of the previous page.
+            product_uid, status, type, auth_uid - optional filters.
+            desc.<field> - optional, only the tickets whose description has that field
+                           with that (string) value, e.g. desc.severity=high.
+            since, until - optional ISO dates (UTC unless given an offset) bounding the creation
+                           date, only the monthly partitions in between are read.
+
+        :return: page of tickets, newest first, and next_cursor (null on the last page).
+                 304 when the If-None-Match / If-Modified-Since copy is still current.
         """
-        with self.session_scope() as session:
-            token = self.access_token_from_authorization_header()
+        try:
+            limit = int(self.get_query_argument('limit', self.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Invalid limit. Must be an integer.')
 
-            token = convert_uuid_or_400(token)
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
 
-            auth_token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
+        cursor = self.get_query_argument('cursor', None)
+        after = decode_cursor_or_400(cursor) if cursor else None
 
-            permissions = auth_token.auth.permissions
+        filters = dict(
+            status=self.get_query_argument('status', None),
+            type=self.get_query_argument('type', None),
+            product_uid=self.get_query_argument('product_uid', None),
+            auth_uid=self.get_query_argument('auth_uid', None)
+        )
 
-            if int(permissions[2]) != 1:
-                raise tornado.web.HTTPError(409, 'Current user don\'t have permission to view tickets.')
+        if filters['status'] and filters['status'] not in Ticket.VALID_TICKET_STATUS:
+            raise tornado.web.HTTPError(400, 'Invalid status filter.')
 
-            tickets = session.query(Ticket).filter(
-                    Ticket.is_deleted == False
-            ).all()
+        if filters['type'] and filters['type'] not in Ticket.VALID_TICKET_TYPES:
+            raise tornado.web.HTTPError(400, 'Invalid type filter.')
+
+        for key in ('product_uid', 'auth_uid'):
+            if filters[key]:
+                filters[key] = convert_uuid_or_400(filters[key])
+
+        perms.check(self.current_user, perms.VIEW_TICKET, filters['product_uid'])
+
+        # Containment filters, served by the GIN index of the descriptions.
+        filters['fields'] = dict(
+            (name[len('desc.'):], self.get_query_argument(name))
+            for name in self.request.query_arguments if name.startswith('desc.')
+        )
+
+        if '' in filters['fields']:
+            raise tornado.web.HTTPError(400, 'Invalid description filter. Must be desc.<field>.')
+
+        try:
+            for key in ('since', 'until'):
+                value = self.get_query_argument(key, None)
+                # Naive UTC like created_at, an aware date wouldn't prune the partitions.
+                filters[key] = parse_utc_datetime(value) if value else None
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Invalid since or until. Must be ISO dates.')
 
-            response = Ticket.convert_to_dict(tickets)
+        # The version is the last committed change of any ticket, a single row read.
+        last_modified = await self.run_in_session(Ticket.last_modified)
 
-            self.write(dict(tickets=response))
+        if self.not_modified(last_modified):
+            return
+
+        def list_tickets(session):
+            # One extra row tells if there is a next page.
+            tickets = Ticket.list_query(session, after=after, **filters).limit(limit + 1).all()
+
+            next_cursor = None
+
+            if len(tickets) > limit:
+                tickets = tickets[:limit]
+                next_cursor = encode_cursor(tickets[-1].created_at, tickets[-1].uid)
+
+            return dict(tickets=Ticket.convert_to_dict(tickets), next_cursor=next_cursor)
+
+        response = await self.run_in_session(list_tickets)
+
+        self.write(response)
 
     @authenticated
-    def post(self):
+    async def post(self):
         """
         Handler to create new Ticket.
 
@@ -50,7 +131,9 @@ class CreteTicketHandler(BaseHandler):
             type- either of Bug, Enhancement or Feature.
             product_uid - Foreign key for model Product
 
-            description - JSON field storing the description of ticket.
+            desc - description of the ticket.
+            fields - optional object of structured fields (component, severity...) stored
+                     with the description, the listing can filter on them.
         :return: uid, timestamp of the ticket created.
         """
         data = self.convert_argument_to_json()
@@ -60,6 +143,11 @@ class CreteTicketHandler(BaseHandler):
         desc = data.get('desc', None)
         product_uid = convert_uuid_or_400(data.get('product_uid', None))
 
+        try:
+            fields = parse_fields(data.get('fields', None))
+        except ValueError as ex:
+            raise tornado.web.HTTPError(400, str(ex))
+
         if not type or type not in Ticket.VALID_TICKET_TYPES:
             raise tornado.web.HTTPError(400, 'Invalid type for ticket. Must be one of bug, enhancement or feature')
 
@@ -73,9 +161,13 @@ class CreteTicketHandler(BaseHandler):
         if not product_uid:
             raise tornado.web.HTTPError(400, "Please provide product uid for which ticket to be created.")
 
-        with self.session_scope() as session:
+        # Creation can also be granted on the product only.
+        perms.check(self.current_user, perms.CREATE_TICKET, product_uid)
 
-            product = session.query(Product).filter(
+        def create_ticket(session):
+            # Checked in the transaction, not in the product cache: the foreign key doesn't know
+            # about soft deletes and the local cache misses the deletes made by other workers.
+            product = session.query(Product.uid).filter(
                 and_(
                     Product.uid == product_uid,
                     Product.is_deleted == False
@@ -85,59 +177,526 @@ class CreteTicketHandler(BaseHandler):
             if not product:
                 raise tornado.web.HTTPError(409, 'No product found for {}'.format(product_uid))
 
-            token = self.access_token_from_authorization_header()
-
-            token = convert_uuid_or_400(token)
-
-            auth_token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
-
-            permissions = auth_token.auth.permissions
-
-            if int(permissions[0]) != 1:
-                raise tornado.web.HTTPError(409, 'Current user don\'t have permission to create ticket.')
-
             ticket = Ticket(
                 status=status,
                 type=type,
-                auth=auth_token.auth,
-                description=dict(description=desc),
+                auth_uid=self.current_user.uid,
+                description=dict(fields, description=desc),
                 product_uid=product_uid
             )
 
             session.add(ticket)
             session.flush()
 
-            response = ticket.to_json()
+            record_transitions(session, [(ticket.uid, product_uid, type, None, status)])
+
+            return ticket.to_json()
+
+        response = await self.run_in_session(create_ticket)
+
+        self.write(response)
+
+
+class TicketExportHandler(BaseHandler):
+    @authenticated
+    @requires(perms.VIEW_TICKET)
+    async def get(self):
+        """
+        Handler to export all the tickets if the user has permission to view tickets.
+        Rows are streamed from a server-side cursor, so memory use doesn't grow with the table.
+
+        Route - /api/ticket/export
+        Method - GET
+        :param format: json (default) for a JSON array or ndjson for one ticket per line.
+        :return: all non-deleted tickets
+        """
+        await self.export_rows(Ticket.export_query(), Ticket.convert_to_dict)
+
+
+class TicketSearchHandler(BaseHandler):
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    # Deep offsets read and rank every skipped match, refine the query instead.
+    MAX_OFFSET = 1000
+
+    @authenticated
+    async def get(self):
+        """
+        Handler to search the ticket descriptions if the user has permission to view tickets,
+        globally or on the product_uid filter.
+        Served by the full-text GIN index of the live tickets.
+
+        Route - /api/ticket/search
+        Method - GET
+        :param:
+            q - words to search, web search syntax: "quoted phrase", or, -excluded.
+            limit - page size, default 20, max 100.
+            offset - next_offset of the previous page, max 1000.
+            product_uid, status, type - optional filters.
+
+        :return: page of tickets, best match first, each with its rank and an HTML escaped snippet
+                 of the description with the matched words between <b> and </b>, and next_offset
+                 (null on the last page).
+        """
+        text = self.get_query_argument('q', '').strip()
+
+        if not text:
+            raise tornado.web.HTTPError(400, 'Please provide the words to search.')
+
+        try:
+            limit = int(self.get_query_argument('limit', self.DEFAULT_PAGE_SIZE))
+            offset = int(self.get_query_argument('offset', 0))
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Invalid limit or offset. Must be integers.')
+
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+
+        if offset < 0 or offset > self.MAX_OFFSET:
+            raise tornado.web.HTTPError(400, 'Invalid offset. Must be between 0 and {}.'.format(self.MAX_OFFSET))
+
+        filters = dict(
+            status=self.get_query_argument('status', None),
+            type=self.get_query_argument('type', None),
+            product_uid=self.get_query_argument('product_uid', None)
+        )
+
+        if filters['status'] and filters['status'] not in Ticket.VALID_TICKET_STATUS:
+            raise tornado.web.HTTPError(400, 'Invalid status filter.')
+
+        if filters['type'] and filters['type'] not in Ticket.VALID_TICKET_TYPES:
+            raise tornado.web.HTTPError(400, 'Invalid type filter.')
+
+        if filters['product_uid']:
+            filters['product_uid'] = convert_uuid_or_400(filters['product_uid'])
+
+        perms.check(self.current_user, perms.VIEW_TICKET, filters['product_uid'])
+
+        def search_tickets(session):
+            # One extra row tells if there is a next page.
+            rows = Ticket.search_query(session, text, limit=limit + 1, offset=offset, **filters).all()
+
+            next_offset = None
+
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_offset = offset + limit
+
+            tickets = Ticket.convert_to_dict(rows)
+
+            for ticket, row in zip(tickets, rows):
+                ticket['rank'] = row.rank
+                ticket['snippet'] = row.snippet
+
+            return dict(tickets=tickets, next_offset=next_offset)
+
+        response = await self.run_in_session(search_tickets)
+
+        self.write(response)
+
+
+class TicketStatsHandler(BaseHandler):
+    @authenticated
+    @requires(perms.VIEW_TICKET)
+    async def get(self):
+        """
+        Handler to get the ticket counts of all the products, read from the ticket_stats table
+        so the cost depends on the number of products, not of tickets.
+
+        Route - /api/ticket/stats
+        Method - GET
+        :return: total, counts by status and by type, and the same for each live product
+                 under products.
+        """
+        def get_stats(session):
+            return TicketStats.summarize(TicketStats.products_query(session))
+
+        response = await self.run_in_session(get_stats)
+
+        self.write(response)
+
+
+class TicketTimeInStatusHandler(BaseHandler):
+    DEFAULT_DAYS = 90
+
+    @authenticated
+    async def get(self):
+        """
+        Handler to get the median and p90 time the tickets spend in each status, per product,
+        computed by the database from the ticket history. Needs the permission to view tickets,
+        globally or on the product_uid filter.
+
+        Route - /api/ticket/time-in-status
+        Method - GET
+        :param:
+            since, until - optional ISO dates (UTC unless given an offset), the statuses entered
+                           in between are measured. Default the last 90 days.
+            product_uid - optional filter.
+
+        :return: products - product_uid and, for each status, the number of tickets that left it
+                 and the median and p90 seconds spent in it.
+        """
+        try:
+            until = self.get_query_argument('until', None)
+            until = parse_utc_datetime(until) if until else datetime.datetime.utcnow()
+
+            since = self.get_query_argument('since', None)
+            if since:
+                since = parse_utc_datetime(since)
+            else:
+                since = until - datetime.timedelta(days=self.DEFAULT_DAYS)
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'Invalid since or until. Must be ISO dates.')
+
+        if since >= until:
+            raise tornado.web.HTTPError(400, 'Invalid since. Must be before until.')
+
+        product_uid = self.get_query_argument('product_uid', None)
+
+        if product_uid:
+            product_uid = convert_uuid_or_400(product_uid)
+
+        perms.check(self.current_user, perms.VIEW_TICKET, product_uid)
+
+        def time_in_status(session):
+            products = {}
+
+            for row in TicketEvent.time_in_status_query(session, since, until, product_uid):
+                statuses = products.setdefault(row.product_uid, {})
+                statuses[TicketEvent.STATUSES[row.status]] = dict(
+                    tickets=row.tickets,
+                    median_seconds=row.median,
+                    p90_seconds=row.p90
+                )
+
+            return dict(
+                since=since,
+                until=until,
+                products=[dict(product_uid=uid, statuses=statuses) for uid, statuses in products.items()]
+            )
+
+        response = await self.run_in_session(time_in_status)
+
+        self.write(response)
+
+
+class TicketBatchHandler(BaseHandler):
+    MAX_BATCH_SIZE = 1000
+
+    OPERATION_PERMISSIONS = dict(
+        create=perms.CREATE_TICKET,
+        update=perms.EDIT_TICKET,
+        delete=perms.DELETE_TICKET,
+    )
+
+    @authenticated
+    async def post(self):
+        """
+        Handler to create, update and delete many tickets in one call.
+        Each kind of operation runs as one bulk statement, all of them in a single transaction.
+        Updates and deletes need the permission globally or on the product of the ticket.
+
+        Route - /api/ticket/batch
+        Method - POST
+        :param:
+            operations - array of at most 1000 operations, each one of
+                {"op": "create", "status", "type", "product_uid", "desc", "fields"}
+                {"op": "update", "uid", "status", "desc", "fields"}
+                {"op": "delete", "uid"}
+
+        :return: results - one entry per operation, in order, with either the ticket
+                 uid (and timestamps) or an error message.
+        """
+        data = self.convert_argument_to_json()
+
+        operations = data.get('operations', None)
+
+        if not isinstance(operations, list) or not operations:
+            raise tornado.web.HTTPError(400, 'Please provide the operations to run.')
+
+        if len(operations) > self.MAX_BATCH_SIZE:
+            raise tornado.web.HTTPError(400, 'Too many operations. Max {} per batch.'.format(self.MAX_BATCH_SIZE))
+
+        results = [None] * len(operations)
+        creates, updates, deletes = [], [], []
+
+        for ix, operation in enumerate(operations):
+            try:
+                item = self.validate(operation)
+            except ValueError as ex:
+                results[ix] = dict(error=str(ex))
+                continue
+
+            item['index'] = ix
+
+            if item['op'] == 'create':
+                creates.append(item)
+            elif item['op'] == 'update':
+                updates.append(item)
+            else:
+                deletes.append(item)
+
+        def run_batch(session):
+            # Status changes for the ticket counts and history, recorded once at the end.
+            transitions = []
+
+            self.create_tickets(session, creates, results, transitions)
+            self.update_tickets(session, updates, results, transitions)
+            self.delete_tickets(session, deletes, results, transitions)
+
+            record_transitions(session, transitions)
+
+            return results
+
+        response = await self.run_in_session(run_batch)
+
+        self.write(dict(results=response))
+
+    def validate(self, operation):
+        """ Check a single operation, raise ValueError with the message returned for the item. """
+        if not isinstance(operation, dict) or operation.get('op') not in self.OPERATION_PERMISSIONS:
+            raise ValueError('Invalid op. Must be one of create, update or delete.')
+
+        op = operation['op']
+
+        item = dict(op=op)
+
+        # Updates and deletes are checked against the product of the ticket, once it is locked.
+        if op == 'create':
+            product_uid = self.parse_uuid(operation.get('product_uid', None))
+            self.check_permission(op, product_uid)
+
+        if op in ('update', 'delete'):
+            item['uid'] = self.parse_uuid(operation.get('uid', None))
+
+        if op in ('create', 'update'):
+            item['status'] = operation.get('status', None)
+            item['desc'] = operation.get('desc', None)
+            item['fields'] = parse_fields(operation.get('fields', None))
+
+            if not item['status'] or item['status'] not in Ticket.VALID_TICKET_STATUS:
+                raise ValueError('Invalid status for ticket. Must be one of select_dev, in_progress or done')
+
+            if not item['desc']:
+                raise ValueError('Please provide description for the ticket.')
+
+        if op == 'create':
+            item['type'] = operation.get('type', None)
+            item['product_uid'] = product_uid
+
+            if not item['type'] or item['type'] not in Ticket.VALID_TICKET_TYPES:
+                raise ValueError('Invalid type for ticket. Must be one of bug, enhancement or feature')
+
+        return item
+
+    def check_permission(self, op, product_uid):
+        """ Raise ValueError when the current user can't run `op` on the product `product_uid`. """
+        permission = self.OPERATION_PERMISSIONS[op]
+
+        if not self.current_user.has_permission(permission, product_uid):
+            raise ValueError('Current user don\'t have permission to {}.'.format(perms.NAMES[permission]))
+
+    @staticmethod
+    def parse_uuid(value):
+        try:
+            return uuid.UUID(value)
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError('Bad uuid format')
+
+    def create_tickets(self, session, items, results, transitions):
+        if not items:
+            return
+
+        # Existence of all the products is checked with a single IN query.
+        product_uids = set(item['product_uid'] for item in items)
+
+        live_products = set(uid for uid, in session.query(Product.uid).filter(
+            and_(
+                Product.uid.in_(product_uids),
+                Product.is_deleted == False
+            )
+        ))
+
+        created_at = datetime.datetime.utcnow()
+        rows = []
+
+        for item in items:
+            if item['product_uid'] not in live_products:
+                results[item['index']] = dict(error='No product found for {}'.format(item['product_uid']))
+                continue
+
+            row = dict(
+                uid=uuid.uuid4(),
+                created_at=created_at,
+                status=item['status'],
+                type=item['type'],
+                auth_uid=self.current_user.uid,
+                description=dict(item['fields'], description=item['desc']),
+                product_uid=item['product_uid']
+            )
+            rows.append(row)
+            transitions.append((row['uid'], row['product_uid'], row['type'], None, row['status']))
+
+            results[item['index']] = dict(uid=str(row['uid']), created_at=created_at.isoformat())
+
+        if rows:
+            session.execute(Ticket.__table__.insert().values(rows))
+
+    def update_tickets(self, session, items, results, transitions):
+        if not items:
+            return
+
+        # Lock the live rows up front, so missing tickets can be reported per item.
+        # Their statuses follow the changes of the batch.
+        live_tickets = dict(
+            (uid, (created_at, product_uid, status, type))
+            for uid, created_at, product_uid, status, type in session.query(
+                Ticket.uid, Ticket.created_at, Ticket.product_uid, Ticket.status, Ticket.type
+            ).filter(
+                and_(
+                    Ticket.uid.in_(set(item['uid'] for item in items)),
+                    Ticket.is_deleted == False
+                )
+            ).with_for_update()
+        )
+
+        # One row per ticket, several updates of a ticket are merged in order: the last status
+        # wins and the fields add up, as the || of each update would have.
+        changes = {}
+
+        for item in items:
+            if item['uid'] not in live_tickets:
+                results[item['index']] = dict(error='No Ticket found for {}'.format(item['uid']))
+                continue
+
+            created_at, product_uid, status, type = live_tickets[item['uid']]
+
+            try:
+                self.check_permission('update', product_uid)
+            except ValueError as ex:
+                results[item['index']] = dict(error=str(ex))
+                continue
+
+            transitions.append((item['uid'], product_uid, type, status, item['status']))
+            live_tickets[item['uid']] = (created_at, product_uid, item['status'], type)
+
+            change = changes.setdefault(item['uid'], dict(created_at=created_at, description={}))
+            change['status'] = item['status']
+            change['description'].update(item['fields'], description=item['desc'])
+
+            results[item['index']] = dict(uid=str(item['uid']))
+
+        if changes:
+            table = Ticket.__table__
+
+            # A single UPDATE ... FROM (VALUES ...), the partition key prunes each row to its partition.
+            rows = values(
+                column('uid', UUID),
+                column('created_at', DateTime),
+                column('status', String),
+                column('description', JSONB),
+                name='changes'
+            ).data([
+                (uid, change['created_at'], change['status'], change['description'])
+                for uid, change in changes.items()
+            ])
+
+            session.execute(
+                table.update()
+                    .where(and_(table.c.uid == rows.c.uid, table.c.created_at == rows.c.created_at))
+                    .values(
+                        status=rows.c.status,
+                        # The fields not given are kept.
+                        description=table.c.description.op('||')(rows.c.description)
+                    )
+            )
+
+    def delete_tickets(self, session, items, results, transitions):
+        if not items:
+            return
 
-            self.write(response)
+        # Lock the live rows first, the permission is checked on the product of each ticket.
+        live_tickets = dict(
+            (uid, (product_uid, status, type))
+            for uid, product_uid, status, type in session.query(
+                Ticket.uid, Ticket.product_uid, Ticket.status, Ticket.type
+            ).filter(
+                and_(
+                    Ticket.uid.in_(set(item['uid'] for item in items)),
+                    Ticket.is_deleted == False
+                )
+            ).with_for_update()
+        )
+
+        deleted_at = datetime.datetime.utcnow()
+        deleted = set()
+
+        for item in items:
+            if item['uid'] not in live_tickets:
+                results[item['index']] = dict(error='No Ticket found for {}'.format(item['uid']))
+                continue
+
+            product_uid, status, type = live_tickets[item['uid']]
+
+            try:
+                self.check_permission('delete', product_uid)
+            except ValueError as ex:
+                results[item['index']] = dict(error=str(ex))
+                continue
+
+            if item['uid'] not in deleted:
+                deleted.add(item['uid'])
+                transitions.append((item['uid'], product_uid, type, status, None))
+
+            results[item['index']] = dict(uid=str(item['uid']), deleted_at=deleted_at.isoformat())
+
+        if deleted:
+            table = Ticket.__table__
+
+            session.execute(
+                table.update()
+                    .where(table.c.uid.in_(deleted))
+                    .values(is_deleted=True, deleted_at=deleted_at)
+            )
 
 
 class TicketHandler(BaseHandler):
 
     @authenticated
-    def get(self, ticket_uid):
+    async def get(self, ticket_uid):
         """
-        Handler to get details of a ticket.
+        Handler to get details of a ticket, if the user has permission to view tickets globally
+        or on the product of the ticket.
 
         Route - /api/ticket/<ticket-uid>
         Method - GET
         :param ticket_uid: id of the ticket to be returned
-        :return: ticket details
+        :return: ticket details, 304 when the If-None-Match / If-Modified-Since copy is still current.
 
         """
-        with self.session_scope() as session:
-            token = self.access_token_from_authorization_header()
+        ticket_uid = convert_uuid_or_400(ticket_uid)
 
-            token = convert_uuid_or_400(token)
+        def ticket_version(session):
+            return session.query(Ticket.updated_at, Ticket.product_uid).filter(
+                and_(
+                    Ticket.uid == ticket_uid,
+                    Ticket.is_deleted == False
+                )
+            ).one_or_none()
 
-            auth_token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
+        version = await self.run_in_session(ticket_version)
 
-            permissions = auth_token.auth.permissions
+        if not version:
+            raise tornado.web.HTTPError(409, 'No Ticket found for {}'.format(ticket_uid))
 
-            if int(permissions[2]) != 1:
-                raise tornado.web.HTTPError(409, 'Current user don\'t have permission to view tickets.')
+        # Checked before the 304 too, the version of a ticket isn't for everyone either.
+        perms.check(self.current_user, perms.VIEW_TICKET, version.product_uid)
 
-            ticket = session.query(Ticket).filter(
+        if self.not_modified(version.updated_at):
+            return
+
+        def get_ticket(session):
+            ticket = session.query(*Ticket.columns(), Ticket.auth_uid).filter(
                 and_(
                     Ticket.uid == ticket_uid,
                     Ticket.is_deleted == False
@@ -145,41 +704,42 @@ class TicketHandler(BaseHandler):
             ).one_or_none()
 
             if ticket:
+                response = Ticket.convert_to_dict([ticket])[0]
+                response['auth_uid'] = ticket.auth_uid
 
-                response = dict(
-                    status=ticket.status,
-                    type=ticket.type,
-                    product_uid=str(ticket.product_uid),
-                    description=ticket.description,
-                    auth_uid=str(ticket.auth.uid),
-                    uid=str(ticket.uid),
-                    created_at=ticket.created_at.isoformat()
-
-                )
-
-                self.write(response)
+                return response
 
             else:
                 raise tornado.web.HTTPError(409, 'No Ticket found for {}'.format(ticket_uid))
 
+        response = await self.run_in_session(get_ticket)
+
+        self.write(response)
+
 
     @authenticated
-    def put(self, ticket_uid):
+    async def put(self, ticket_uid):
         """
-        Handler to update the status and description  of a ticket.
+        Handler to update the status and description  of a ticket, if the user has permission to
+        edit tickets globally or on the product of the ticket.
 
         Route - /api/ticket/<ticket-uid>
         Method - PUT
         :param ticket_uid: id of the ticket to be returned
+        :param fields: optional object of structured fields to set, the others are kept.
         :return: uid , timestamp of ticket
 
         """
-
         data = self.convert_argument_to_json()
 
         status = data.get('status', None)
         desc = data.get('desc', None)
 
+        try:
+            fields = parse_fields(data.get('fields', None))
+        except ValueError as ex:
+            raise tornado.web.HTTPError(400, str(ex))
+
         if not status or status not in Ticket.VALID_TICKET_STATUS:
             raise tornado.web.HTTPError(400,
                                         'Invalid status for ticket. Must be one of select_dev, in_progress or done')
@@ -187,81 +747,75 @@ class TicketHandler(BaseHandler):
         if not desc:
             raise tornado.web.HTTPError(400, 'Please provide description for the ticket.')
 
-        with self.session_scope() as session:
-            token = self.access_token_from_authorization_header()
-
-            token = convert_uuid_or_400(token)
-
-            auth_token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
-
-            permissions = auth_token.auth.permissions
-
-            if int(permissions[1]) != 1:
-                raise tornado.web.HTTPError(409, 'Current user don\'t have permission to edit tickets.')
-
+        def update_ticket(session):
+            # Locked, so concurrent changes can't record the same status change twice.
             ticket = session.query(Ticket).filter(
                 and_(
                     Ticket.uid == ticket_uid,
                     Ticket.is_deleted == False
                 )
-            ).one_or_none()
+            ).with_for_update().one_or_none()
 
             if ticket:
-                description = dict(description=desc)
+                perms.check(self.current_user, perms.EDIT_TICKET, ticket.product_uid)
+
+                description = dict(ticket.description, **fields)
+                description['description'] = desc
+
+                record_transitions(session, [(ticket.uid, ticket.product_uid, ticket.type, ticket.status, status)])
 
                 ticket.status = status
                 ticket.description=description
 
                 session.flush()
 
-                response = ticket.to_json()
-
-                self.write(response)
+                return ticket.to_json()
 
             else:
                 raise tornado.web.HTTPError(409, 'No Ticket found for {}'.format(ticket_uid))
 
+        response = await self.run_in_session(update_ticket)
+
+        self.write(response)
+
 
     @authenticated
-    def delete(self, ticket_uid):
+    async def delete(self, ticket_uid):
         """
-        Handler to delete a ticket for given ticket uid.
+        Handler to delete a ticket for given ticket uid, if the user has permission to delete
+        tickets globally or on the product of the ticket.
 
         Route - /api/ticket/<ticket-uid>
         Method - PUT
         :param ticket_uid: uid of the ticket to be deleted
         :return: uid, creted_at and deleted_at timestamp
         """
-
-        with self.session_scope() as session:
-            token = self.access_token_from_authorization_header()
-
-            token = convert_uuid_or_400(token)
-
-            auth_token = session.query(AuthToken).filter(AuthToken.uid == token).one_or_none()
-
-            permissions = auth_token.auth.permissions
-
-            if int(permissions[3]) != 1:
-                raise tornado.web.HTTPError(409, 'Current user don\'t have permission to delete tickets.')
-
+        def delete_ticket(session):
             ticket = session.query(Ticket).filter(
                 and_(
                     Ticket.uid == ticket_uid,
                     Ticket.is_deleted == False
                 )
-            ).one_or_none()
+            ).with_for_update().one_or_none()
 
             if ticket:
+                perms.check(self.current_user, perms.DELETE_TICKET, ticket.product_uid)
+
                 ticket.mark_deleted()
 
                 session.flush()
 
+                record_transitions(session, [(ticket.uid, ticket.product_uid, ticket.type, ticket.status, None)])
+
                 response = ticket.to_json()
                 response['deleted_at'] = ticket.deleted_at.isoformat()
 
-                self.write(response)
+                return response
 
             else:
                 raise tornado.web.HTTPError(409, 'No Ticket found for {}'.format(ticket_uid))
 
+        response = await self.run_in_session(delete_ticket)
+
+        self.write(response)
+
@@ -1,16 +1,54 @@
-from sqlalchemy import Column, String, ForeignKey
+import collections
+import datetime
+
+from sqlalchemy import Column, String, ForeignKey, Index, Integer, SmallInteger, Boolean, DateTime, Computed
+from sqlalchemy import PrimaryKeyConstraint, tuple_, select, func, and_, text
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 
 from utils.dbbase import Base
-from utils.mixins import UIDMixin, UUID, DeletableMixin
+from product.models import Product
+from utils.table_version import TableVersion
+from utils.mixins import UIDMixin, UUID, DeletableMixin, UpdatedAtMixin, live_rows
 
 
-class Ticket(UIDMixin, DeletableMixin, Base):
+class Ticket(UIDMixin, DeletableMixin, UpdatedAtMixin, Base):
     """    Ticket is an identity that can be against a Product
+
+        The table is partitioned by month on created_at (see utils.partitions), so the primary
+        key is (uid, created_at). Tickets soft-deleted long ago are moved to TicketArchive.
     """
     __tablename__ = 'ticket'
 
+    __table_args__ = (
+        # The partition key has to be part of the primary key.
+        PrimaryKeyConstraint('uid', 'created_at'),
+        # Keyset pagination of the live tickets on (created_at, uid), alone and for each listing filter.
+        Index('ix_ticket_live_created_at_uid', 'created_at', 'uid',
+              postgresql_where=live_rows()),
+        Index('ix_ticket_live_product_uid_created_at_uid', 'product_uid', 'created_at', 'uid',
+              postgresql_where=live_rows()),
+        Index('ix_ticket_live_auth_uid_created_at_uid', 'auth_uid', 'created_at', 'uid',
+              postgresql_where=live_rows()),
+        Index('ix_ticket_live_status_created_at_uid', 'status', 'created_at', 'uid',
+              postgresql_where=live_rows()),
+        Index('ix_ticket_live_type_created_at_uid', 'type', 'created_at', 'uid',
+              postgresql_where=live_rows()),
+        # Containment (@>) filters on the fields of the description.
+        Index('ix_ticket_live_description', 'description', postgresql_using='gin',
+              postgresql_ops=dict(description='jsonb_path_ops'), postgresql_where=live_rows()),
+        # Full-text search of the live tickets.
+        Index('ix_ticket_live_search_vector', 'search_vector', postgresql_using='gin',
+              postgresql_where=live_rows()),
+        # Candidates of the archival, see ticket.archive.
+        Index('ix_ticket_deleted_deleted_at', 'deleted_at', postgresql_where=text('is_deleted = true')),
+        dict(postgresql_partition_by='RANGE (created_at)'),
+    )
+
+    created_at = Column(DateTime, default=func.now(), primary_key=True, nullable=False, index=True)
+
+    SEARCH_CONFIG = 'english'
+
     ENHANCEMENT = 'enhancement'
     BUG = 'bug'
     FEATURE = 'feature'
@@ -22,29 +60,371 @@ class Ticket(UIDMixin, DeletableMixin, Base):
     VALID_TICKET_TYPES = [ENHANCEMENT, BUG, FEATURE]
     VALID_TICKET_STATUS = [SELECTED_FOR_DEV, IN_PROGRESS, DONE]
 
-    auth_uid = Column(UUID, ForeignKey('auth.uid'), nullable=False)
+    auth_uid = Column(UUID, ForeignKey('auth.uid'), nullable=False, index=True)
     auth = relationship('Auth', backref='tickets')
 
-    product_uid = Column(UUID, ForeignKey('product.uid'), nullable=False)
+    product_uid = Column(UUID, ForeignKey('product.uid'), nullable=False, index=True)
 
     status = Column(String(20), nullable=False, default=SELECTED_FOR_DEV, server_default=SELECTED_FOR_DEV )
     type = Column(String(20), nullable=False, default=BUG, server_default=BUG)
 
-    description = Column(postgresql.JSON, nullable=False)
+    # The ticket text under 'description', plus any structured fields (component, severity...).
+    description = Column(postgresql.JSONB, nullable=False)
+
+    # Text search document of the description, maintained by Postgres. Only read by the search.
+    search_vector = deferred(Column(
+        postgresql.TSVECTOR,
+        Computed("to_tsvector('english', coalesce(description ->> 'description', ''))", persisted=True)
+    ))
+
+    @staticmethod
+    def list_query(session, product_uid=None, status=None, type=None, auth_uid=None, after=None, fields=None,
+                   since=None, until=None):
+        """ Rows of the live tickets (see `columns`), newest first, matching the given filters.
+            `after` is the (created_at, uid) of the last row of the previous page.
+            `fields` is a dict the description must contain, e.g. {'severity': 'high'}.
+            `since` and `until` bound created_at, only the partitions of those months are read.
+        """
+        query = session.query(*Ticket.columns()).filter(Ticket.is_deleted == False)
+
+        if product_uid:
+            query = query.filter(Ticket.product_uid == product_uid)
+
+        if status:
+            query = query.filter(Ticket.status == status)
+
+        if type:
+            query = query.filter(Ticket.type == type)
+
+        if auth_uid:
+            query = query.filter(Ticket.auth_uid == auth_uid)
+
+        if fields:
+            query = query.filter(Ticket.description.contains(fields))
+
+        if since:
+            query = query.filter(Ticket.created_at >= since)
+
+        if until:
+            query = query.filter(Ticket.created_at < until)
+
+        if after:
+            query = query.filter(tuple_(Ticket.created_at, Ticket.uid) < tuple_(*after))
+
+        return query.order_by(Ticket.created_at.desc(), Ticket.uid.desc())
+
+    @staticmethod
+    def search_query(session, text, product_uid=None, status=None, type=None, limit=20, offset=0):
+        """ Rows of the live tickets matching the web search style `text` (see `columns`), best
+            match first, with their `rank` and a `snippet` of the description with the matched
+            words between <b> and </b>. The rest of the snippet is HTML escaped, so it can be
+            rendered as HTML as is.
+        """
+        query = func.websearch_to_tsquery(Ticket.SEARCH_CONFIG, text)
+        rank = func.ts_rank_cd(Ticket.search_vector, query)
+
+        page = session.query(*Ticket.columns(), rank.label('rank')).filter(
+            Ticket.is_deleted == False,
+            Ticket.search_vector.op('@@')(query)
+        )
+
+        if product_uid:
+            page = page.filter(Ticket.product_uid == product_uid)
+
+        if status:
+            page = page.filter(Ticket.status == status)
+
+        if type:
+            page = page.filter(Ticket.type == type)
+
+        page = page.order_by(rank.desc(), Ticket.uid.desc()).limit(limit).offset(offset).subquery()
+
+        # The description is escaped first, the only tags left are the <b> of ts_headline.
+        description = page.c.description['description'].astext
+
+        for character, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')):
+            description = func.replace(description, character, entity)
+
+        # Snippets are only built for the rows of the page.
+        snippet = func.ts_headline(
+            Ticket.SEARCH_CONFIG,
+            description,
+            query,
+            'MaxFragments=2, MinWords=5, MaxWords=20'
+        )
+
+        return session.query(page, snippet.label('snippet')).order_by(page.c.rank.desc(), page.c.uid.desc())
+
+    @staticmethod
+    def last_modified(session, uid=None):
+        """ updated_at of the live ticket `uid` (None when there is none), or without `uid` the
+            commit-ordered version of the ticket table, see TableVersion. Version of the HTTP responses.
+        """
+        if uid is None:
+            return TableVersion.get(session, Ticket.__tablename__)
+
+        return session.query(Ticket.updated_at).filter(
+            and_(Ticket.uid == uid, Ticket.is_deleted == False)
+        ).scalar()
+
+    @staticmethod
+    def columns():
+        """ Columns read by convert_to_dict. Listings query them alone, without ORM instances. """
+        return (
+            Ticket.uid,
+            Ticket.description,
+            Ticket.type,
+            Ticket.status,
+            Ticket.product_uid,
+            Ticket.created_at,
+            Ticket.updated_at
+        )
+
+    @staticmethod
+    def export_query():
+        """ Columns of all live tickets needed by convert_to_dict, for streaming exports. """
+        return select(*Ticket.columns()).where(Ticket.is_deleted == False).order_by(Ticket.created_at, Ticket.uid)
 
     @staticmethod
     def convert_to_dict(tickets):
-        data = []
-        for ticket in tickets:
-            data.append(
-                dict(
-                    uid=str(ticket.uid),
-                    description=ticket.description,
-                    type=ticket.type,
-                    status=ticket.status,
-                    product_uid=str(ticket.product_uid)
-                )
+        """ Response dicts of the given ticket rows or instances. The uids and dates are left
+            as they are, the response encoder serializes them.
+        """
+        return [
+            dict(
+                uid=ticket.uid,
+                description=ticket.description,
+                type=ticket.type,
+                status=ticket.status,
+                product_uid=ticket.product_uid,
+                created_at=ticket.created_at,
+                updated_at=ticket.updated_at
             )
+            for ticket in tickets
+        ]
+
+
+TableVersion.track(Ticket.__table__)
+
+
+class TicketStats(Base):
+    """    Number of live tickets of each (product, status, type), kept up to date by the ticket
+        handlers in the same transaction as the ticket changes, so the stats endpoints read a
+        few rows per product whatever the number of tickets.
+        `reconcile` rebuilds it from the ticket table.
+    """
+    __tablename__ = 'ticket_stats'
+
+    product_uid = Column(UUID, ForeignKey('product.uid'), primary_key=True)
+    status = Column(String, primary_key=True)
+    type = Column(String, primary_key=True)
+
+    count = Column(Integer, nullable=False)
+
+    @staticmethod
+    def add(session, deltas):
+        """ Apply `deltas`, {(product_uid, status, type): change of the count}, in one upsert.
+            The rows are locked until the end of the transaction, always in the same order so
+            concurrent writers don't deadlock.
+        """
+        rows = [
+            dict(product_uid=key[0], status=key[1], type=key[2], count=delta)
+            for key, delta in sorted(deltas.items(), key=lambda item: (str(item[0][0]),) + item[0][1:])
+            if delta
+        ]
+
+        if not rows:
+            return
+
+        table = TicketStats.__table__
+        statement = postgresql.insert(table).values(rows)
+
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.product_uid, table.c.status, table.c.type],
+            set_=dict(count=table.c.count + statement.excluded.count)
+        ))
+
+    @staticmethod
+    def products_query(session, product_uid=None):
+        """ (product_uid, status, type, tickets) of the live products, or of `product_uid` only.
+            The count is labelled tickets, `count` is a method of the result rows.
+        """
+        query = session.query(
+            TicketStats.product_uid, TicketStats.status, TicketStats.type, TicketStats.count.label('tickets')
+        ) \
+            .join(Product, TicketStats.product_uid == Product.uid) \
+            .filter(Product.is_deleted == False, TicketStats.count != 0)
+
+        if product_uid:
+            query = query.filter(TicketStats.product_uid == product_uid)
+
+        return query
+
+    @staticmethod
+    def summarize(rows):
+        """ Response dict of the rows of `products_query`: the total and the counts by status and
+            by type, overall and for each product.
+        """
+        def empty():
+            return dict(total=0, status={}, type={})
+
+        def count(summary, row):
+            summary['total'] += row.tickets
+            summary['status'][row.status] = summary['status'].get(row.status, 0) + row.tickets
+            summary['type'][row.type] = summary['type'].get(row.type, 0) + row.tickets
+
+        overall = empty()
+        products = {}
+
+        for row in rows:
+            count(overall, row)
+            count(products.setdefault(row.product_uid, empty()), row)
+
+        overall['products'] = [dict(products[uid], product_uid=uid) for uid in sorted(products, key=str)]
+
+        return overall
+
+    @staticmethod
+    def reconcile(session):
+        """ Rebuild the counts from the live tickets. Ticket writers wait on the table lock, the
+            ones that went first are committed by the time it is granted, so none is lost.
+        """
+        session.execute(text('LOCK TABLE ticket_stats IN EXCLUSIVE MODE'))
+        session.query(TicketStats).delete(synchronize_session=False)
+
+        counts = select(Ticket.product_uid, Ticket.status, Ticket.type, func.count()) \
+            .where(Ticket.is_deleted == False) \
+            .group_by(Ticket.product_uid, Ticket.status, Ticket.type)
+
+        session.execute(TicketStats.__table__.insert().from_select(
+            ['product_uid', 'status', 'type', 'count'], counts
+        ))
+
+
+class TicketEvent(Base):
+    """    Append-only history of the ticket status changes, one row when a ticket is created,
+        changes status or is deleted, written in the same transaction as the change.
+
+        Rows are kept small (no description, status as a small int code) and the table is
+        partitioned by month on created_at, see utils.partitions. There is no primary key,
+        (ticket_uid, created_at) identifies the rows for the ORM only.
+    """
+    __tablename__ = 'ticket_event'
+
+    # Status code of the deletion events, which only end the time in the previous status.
+    DELETED = 0
+
+    STATUS_CODES = {
+        Ticket.SELECTED_FOR_DEV: 1,
+        Ticket.IN_PROGRESS: 2,
+        Ticket.DONE: 3,
+    }
+
+    STATUSES = dict((code, status) for status, code in STATUS_CODES.items())
+
+    created_at = Column(DateTime, nullable=False)
+    ticket_uid = Column(UUID, nullable=False)
+    product_uid = Column(UUID, nullable=False)
+    status = Column(SmallInteger, nullable=False)
+
+    __table_args__ = (
+        Index('ix_ticket_event_product_uid_created_at', 'product_uid', 'created_at'),
+        Index('ix_ticket_event_ticket_uid_created_at', 'ticket_uid', 'created_at'),
+        dict(postgresql_partition_by='RANGE (created_at)'),
+    )
+
+    __mapper_args__ = dict(primary_key=[ticket_uid, created_at])
+
+    @staticmethod
+    def time_in_status_query(session, since, until, product_uid=None):
+        """ (product_uid, status code, tickets, median, p90) of the time spent in each status, in
+            seconds, for the statuses entered between `since` and `until` and left since then.
+            The exit of each status is the next event of the ticket, found by a window function.
+        """
+        left_at = func.lead(TicketEvent.created_at).over(
+            partition_by=TicketEvent.ticket_uid,
+            order_by=TicketEvent.created_at
+        )
+
+        intervals = select(
+            TicketEvent.product_uid, TicketEvent.status, TicketEvent.created_at, left_at.label('left_at')
+        ).where(TicketEvent.created_at >= since)
+
+        if product_uid:
+            intervals = intervals.where(TicketEvent.product_uid == product_uid)
+
+        intervals = intervals.subquery()
+
+        seconds = func.extract('epoch', intervals.c.left_at - intervals.c.created_at)
+
+        return session.query(
+            intervals.c.product_uid,
+            intervals.c.status,
+            func.count().label('tickets'),
+            func.percentile_cont(0.5).within_group(seconds).label('median'),
+            func.percentile_cont(0.9).within_group(seconds).label('p90')
+        ).filter(
+            intervals.c.created_at < until,
+            intervals.c.left_at != None,
+            intervals.c.status != TicketEvent.DELETED
+        ).group_by(intervals.c.product_uid, intervals.c.status).order_by(intervals.c.product_uid, intervals.c.status)
+
+
+class TicketArchive(Base):
+    """    Tickets soft-deleted more than `after_days` days ago, moved out of the ticket table by
+        ticket.archive.TicketArchiver in batches, and moved back by its `restore`.
+        Same columns as Ticket, without the search vector, plus archived_at.
+    """
+    __tablename__ = 'ticket_archive'
+
+    # Columns moved between ticket and ticket_archive.
+    COLUMNS = (
+        'uid', 'created_at', 'updated_at', 'is_deleted', 'deleted_at',
+        'auth_uid', 'product_uid', 'status', 'type', 'description'
+    )
+
+    uid = Column(UUID, primary_key=True)
+    created_at = Column(DateTime, primary_key=True)
+    updated_at = Column(DateTime, nullable=False)
+    is_deleted = Column(Boolean, nullable=False)
+    deleted_at = Column(DateTime, nullable=True)
+    auth_uid = Column(UUID, nullable=False)
+    product_uid = Column(UUID, nullable=False, index=True)
+    status = Column(String(20), nullable=False)
+    type = Column(String(20), nullable=False)
+    description = Column(postgresql.JSONB, nullable=False)
+
+    archived_at = Column(DateTime, nullable=False, index=True)
+
+
+def record_transitions(session, transitions):
+    """ Apply the ticket changes `transitions`, (ticket_uid, product_uid, type, old status,
+        new status) with None for the status before a creation or after a deletion, to the
+        ticket counts and the ticket history.
+    """
+    deltas = collections.Counter()
+    events = []
+    now = datetime.datetime.utcnow()
+
+    for ix, (ticket_uid, product_uid, type, old_status, new_status) in enumerate(transitions):
+        if old_status == new_status:
+            continue
+
+        if old_status is not None:
+            deltas[(product_uid, old_status, type)] -= 1
+
+        if new_status is not None:
+            deltas[(product_uid, new_status, type)] += 1
+
+        events.append(dict(
+            # Changes of the same ticket in one call keep their order.
+            created_at=now + datetime.timedelta(microseconds=ix),
+            ticket_uid=ticket_uid,
+            product_uid=product_uid,
+            status=TicketEvent.STATUS_CODES[new_status] if new_status is not None else TicketEvent.DELETED
+        ))
 
-        return data
+    TicketStats.add(session, deltas)
 
+    if events:
+        session.execute(TicketEvent.__table__.insert(), events)
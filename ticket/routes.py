@@ -3,5 +3,10 @@ from ticket import handlers
 def get_app_routes():
     return [
         (r"/api/ticket", handlers.CreteTicketHandler),
+        (r"/api/ticket/export", handlers.TicketExportHandler),
+        (r"/api/ticket/batch", handlers.TicketBatchHandler),
+        (r"/api/ticket/search", handlers.TicketSearchHandler),
+        (r"/api/ticket/stats", handlers.TicketStatsHandler),
+        (r"/api/ticket/time-in-status", handlers.TicketTimeInStatusHandler),
         (r"/api/ticket/([-0-9a-fA-F]*)", handlers.TicketHandler)
     ]
\ No newline at end of file
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Move the tickets soft-deleted more than --after-days days ago to ticket_archive, or move
+archived tickets back.
+
+    python -m tools.archive_tickets archive --after-days 30
+    python -m tools.archive_tickets restore <ticket-uid> [<ticket-uid>...] [--undelete]
+
+The server runs the archival periodically (TICKET_ARCHIVE_SECONDS), this is for backlogs and
+restores. Restored tickets stay deleted unless --undelete is given, then they are only archived
+again --after-days days after the restore.
+"""
+import argparse
+import uuid
+
+from settings import settings
+from utils.db import Db
+from ticket.archive import ticket_archiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    archive = commands.add_parser('archive')
+    archive.add_argument('--after-days', type=int, default=settings['ticket_archive']['after_days'])
+    archive.add_argument('--batch-size', type=int, default=settings['ticket_archive']['batch_size'])
+
+    restore = commands.add_parser('restore')
+    restore.add_argument('uids', nargs='+', type=uuid.UUID)
+    restore.add_argument('--undelete', action='store_true', help='Also mark the tickets not deleted.')
+
+    args = parser.parse_args()
+
+    db = Db(**settings['db'])
+
+    if args.command == 'archive':
+        ticket_archiver.configure(after_days=args.after_days, batch_size=args.batch_size)
+        total = 0
+
+        while True:
+            with db.session_scope() as session:
+                archived = ticket_archiver.archive_batch(session)
+
+            total += archived
+            print('Archived {} tickets'.format(total))
+
+            if archived < ticket_archiver.batch_size:
+                break
+
+    else:
+        with db.session_scope() as session:
+            restored = ticket_archiver.restore(session, args.uids, undelete=args.undelete)
+
+        for uid in args.uids:
+            print('{} {}'.format(uid, 'restored' if uid in restored else 'not archived'))
+
+
+if __name__ == "__main__":
+    main()
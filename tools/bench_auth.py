@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+CPU cost of the per-request auth and permission check, in-process, no server or DB needed.
+
+    python -m tools.bench_auth --iterations 200000
+
+bit-string   the former check: BIT(4) string of a cached principal indexed and parsed per request
+cached       opaque token: token cache lookup, then the integer bitmask check of `requires`
+signed       signed token: HMAC verification and payload decoding, revocation list lookup, bitmask check
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+from auth import permissions as perms
+from auth.cache import TokenCache
+from auth.principal import Principal
+from auth.revocation import RevocationList
+from auth.signed_tokens import SignedTokens
+
+
+def bench(name, check, iterations):
+    start = time.process_time()
+
+    for _ in range(iterations):
+        check()
+
+    elapsed = time.process_time() - start
+
+    print('{:<12} {:.2f}us per request'.format(name, elapsed / iterations * 1000000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    principal = Principal(
+        token_uid=uuid.uuid4(),
+        uid=uuid.uuid4(),
+        email='bench@example.com',
+        permissions=perms.DEFAULT,
+        expires_at=datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    )
+
+    cache = TokenCache(max_size=10000, ttl_seconds=3600)
+    cache.put(principal)
+
+    codec = SignedTokens()
+    codec.configure(mode='signed', secret='bench-secret')
+    signed = codec.encode(principal)
+
+    revocations = RevocationList()
+    revocations.loaded_until = datetime.datetime.utcnow()
+
+    bits = '1010'
+
+    def bit_string():
+        return cache.get(principal.token_uid) is not None and int(bits[2]) == 1
+
+    def cached():
+        return cache.get(principal.token_uid).has_permission(perms.VIEW_TICKET)
+
+    def verified():
+        decoded = codec.decode(signed)
+        return not revocations.is_revoked(decoded.token_uid) and decoded.has_permission(perms.VIEW_TICKET)
+
+    bench('bit-string', bit_string, args.iterations)
+    bench('cached', cached, args.iterations)
+    bench('signed', verified, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Ticket creation throughput of the per-request path (POST /api/ticket) against the
+batch endpoint (POST /api/ticket/batch).
+
+    python server.py &
+    python -m tools.bench_batch --tickets 5000 --batch-size 1000 --concurrency 20
+"""
+import argparse
+import time
+import uuid
+
+import tornado.gen
+import tornado.ioloop
+
+from tools.benchmark import fetch_json, login_or_signup, new_client
+
+
+def ticket(product_uid, ix):
+    return dict(status='select_dev', type='bug', product_uid=product_uid, desc='Bench ticket {}'.format(ix))
+
+
+async def run(args):
+    client = new_client(args.concurrency)
+
+    token = await login_or_signup(client, args.url, args.email, args.password)
+
+    _, product = await fetch_json(client, args.url + '/api/product', 'POST', token=token, body=dict(
+        name='bench-{}'.format(uuid.uuid4().hex[:8]), type='others', email='owner@example.com'
+    ))
+
+    pending = iter(range(args.tickets))
+
+    async def single_worker():
+        for ix in pending:
+            await fetch_json(client, args.url + '/api/ticket', 'POST', ticket(product['uid'], ix), token=token)
+
+    start = time.perf_counter()
+    await tornado.gen.multi([single_worker() for _ in range(args.concurrency)])
+    single = time.perf_counter() - start
+
+    batches = iter(range(0, args.tickets, args.batch_size))
+
+    async def batch_worker():
+        for offset in batches:
+            operations = [dict(op='create', **ticket(product['uid'], ix))
+                          for ix in range(offset, min(offset + args.batch_size, args.tickets))]
+            await fetch_json(client, args.url + '/api/ticket/batch', 'POST', dict(operations=operations),
+                             token=token)
+
+    start = time.perf_counter()
+    await tornado.gen.multi([batch_worker() for _ in range(args.concurrency)])
+    batch = time.perf_counter() - start
+
+    print('per-request: {:.2f}s {:.1f} tickets/s'.format(single, args.tickets / single))
+    print('batch:       {:.2f}s {:.1f} tickets/s'.format(batch, args.tickets / batch))
+    print('speedup:     {:.1f}x'.format(single / batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8998')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+CPU time of serializing ticket listings, per JSON backend. Runs in-process, no server or DB needed.
+
+    python -m tools.bench_encode --rows 10000 100000
+
+`str+tornado` is the former path: uids and dates converted to strings by hand, then
+tornado.escape.json_encode. The `rows+*` paths pass the rows through Ticket.convert_to_dict
+and utils.json_encoder.
+"""
+import argparse
+import collections
+import datetime
+import time
+import uuid
+
+import tornado.escape
+
+from ticket.models import Ticket
+from utils.json_encoder import JsonEncoder
+
+TicketRow = collections.namedtuple('TicketRow', [column.key for column in Ticket.columns()])
+
+
+def make_rows(count):
+    start = datetime.datetime.utcnow()
+
+    return [
+        TicketRow(
+            uid=uuid.uuid4(),
+            description=dict(description='Ticket number {}'.format(ix)),
+            type=Ticket.VALID_TICKET_TYPES[ix % len(Ticket.VALID_TICKET_TYPES)],
+            status=Ticket.VALID_TICKET_STATUS[ix % len(Ticket.VALID_TICKET_STATUS)],
+            product_uid=uuid.uuid4(),
+            created_at=start + datetime.timedelta(seconds=ix),
+            updated_at=start + datetime.timedelta(seconds=ix)
+        )
+        for ix in range(count)
+    ]
+
+
+def encode_strings(rows):
+    tickets = [
+        dict(
+            uid=str(row.uid),
+            description=row.description,
+            type=row.type,
+            status=row.status,
+            product_uid=str(row.product_uid),
+            created_at=row.created_at.isoformat(),
+            updated_at=row.updated_at.isoformat()
+        )
+        for row in rows
+    ]
+
+    return tornado.escape.json_encode(dict(tickets=tickets))
+
+
+def encoders():
+    yield 'str+tornado', encode_strings
+
+    for backend in ('json', 'orjson'):
+        try:
+            encoder = JsonEncoder(backend)
+        except ImportError:
+            print('{} is not installed, skipped'.format(backend))
+            continue
+
+        yield 'rows+' + backend, lambda rows, encode=encoder.encode: encode(dict(tickets=Ticket.convert_to_dict(rows)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        rows = make_rows(count)
+
+        for name, encode in encoders():
+            samples = []
+
+            for _ in range(args.repeat):
+                start = time.process_time()
+                body = encode(rows)
+                samples.append(time.process_time() - start)
+
+            print('rows={:<7} {:<12} best={:.1f}ms mean={:.1f}ms bytes={}'.format(
+                count, name, min(samples) * 1000, sum(samples) / len(samples) * 1000, len(body)
+            ))
+
+
+if __name__ == "__main__":
+    main()
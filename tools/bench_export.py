@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Time-to-first-byte, total time and server memory of the streaming ticket export.
+
+    python -m tools.bench_export --seed 1000000          # once, inserts 1M tickets
+    python server.py &
+    python -m tools.bench_export --server-pid $! --format ndjson
+
+Pass --server-pid to report the server's resident and peak memory (Linux only) around the export.
+"""
+import argparse
+import time
+
+import tornado.ioloop
+
+from settings import settings
+from tools.benchmark import login_or_signup, new_client, seed_tickets
+
+
+def memory_kb(pid):
+    data = {}
+
+    with open('/proc/{}/status'.format(pid)) as status:
+        for line in status:
+            if line.startswith(('VmRSS', 'VmHWM')):
+                key, value = line.split(':')
+                data[key] = int(value.split()[0])
+
+    return data
+
+
+async def run(args):
+    client = new_client(1)
+
+    token = await login_or_signup(client, args.url, args.email, args.password)
+
+    if args.server_pid:
+        print('server memory before: {}'.format(memory_kb(args.server_pid)))
+
+    received = dict(bytes=0, first_byte=None)
+
+    def on_chunk(chunk):
+        if received['first_byte'] is None:
+            received['first_byte'] = time.perf_counter()
+        received['bytes'] += len(chunk)
+
+    start = time.perf_counter()
+
+    await client.fetch(
+        '{}{}?format={}'.format(args.url, args.path, args.format),
+        headers={'Authorization': 'Bearer {}'.format(token)},
+        streaming_callback=on_chunk,
+        request_timeout=3600
+    )
+
+    elapsed = time.perf_counter() - start
+
+    print('ttfb={:.1f}ms total={:.2f}s bytes={} throughput={:.1f}MB/s'.format(
+        ((received['first_byte'] or start) - start) * 1000,
+        elapsed,
+        received['bytes'],
+        received['bytes'] / elapsed / 1024 / 1024
+    ))
+
+    if args.server_pid:
+        print('server memory after: {}'.format(memory_kb(args.server_pid)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8998')
+    parser.add_argument('--path', default='/api/ticket/export')
+    parser.add_argument('--format', default='json', choices=['json', 'ndjson'])
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--server-pid', type=int)
+    parser.add_argument('--seed', type=int, default=0, help='Insert this many tickets and exit.')
+    args = parser.parse_args()
+
+    if args.seed:
+        from utils.db import Db
+
+        seed_tickets(Db(**settings['db']), args.seed)
+        print('Seeded {} tickets'.format(args.seed))
+        return
+
+    tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+
+
+if __name__ == "__main__":
+    main()
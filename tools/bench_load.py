@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Load benchmark with mixed login and read traffic.
+
+Start the server once with ASYNC_MODE=0 (everything inline on the IOLoop) and once with
+ASYNC_MODE=1 (DB and bcrypt on executors), run this script against both and compare p99:
+
+    ASYNC_MODE=0 python server.py &
+    python -m tools.bench_load --url http://localhost:8998 --requests 2000 --concurrency 50
+"""
+import argparse
+import random
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from tools.benchmark import fetch_json, login_or_signup, new_client, summarize, timed
+
+
+async def run(args):
+    client = new_client(args.concurrency)
+
+    token = await login_or_signup(client, args.url, args.email, args.password)
+
+    latencies = dict(login=[], read=[])
+    errors = [0]
+    pending = iter(range(args.requests))
+
+    async def worker():
+        for _ in pending:
+            if random.random() < args.login_ratio:
+                kind = 'login'
+                coro = fetch_json(client, args.url + '/api/sign-in', 'POST',
+                                  dict(email=args.email, password=args.password), raise_error=False)
+            else:
+                kind = 'read'
+                coro = fetch_json(client, args.url + args.read_path, token=token, raise_error=False)
+
+            try:
+                latencies[kind].append(await timed(coro))
+            except Exception:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    await tornado.gen.multi([worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    summarize('login', latencies['login'], elapsed)
+    summarize('read', latencies['read'], elapsed)
+    summarize('all', latencies['login'] + latencies['read'], elapsed)
+    print('errors={}'.format(errors[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8998')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--read-path', default='/api/product')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--login-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Latency of the full-text ticket search against fetching every ticket and matching them
+in the client, the only way to search descriptions before /api/ticket/search.
+
+    python -m tools.bench_search --seed 1000000          # once, inserts 1M tickets
+    python server.py &
+    python -m tools.bench_search --requests 200 --concurrency 10
+
+The export baseline is run --baseline-requests times only, it reads the whole table each time.
+"""
+import argparse
+import json
+import random
+import time
+import urllib.parse
+
+import tornado.gen
+import tornado.ioloop
+
+from settings import settings
+from tools.benchmark import SEED_WORDS, fetch_json, login_or_signup, new_client, seed_tickets, summarize, timed
+
+
+def random_query():
+    """ One or two words of the seeded vocabulary, sometimes as a phrase. """
+    words = random.sample(SEED_WORDS, random.choice((1, 2)))
+
+    if len(words) == 2 and random.random() < 0.3:
+        return '"{}"'.format(' '.join(words))
+
+    return ' '.join(words)
+
+
+async def search(client, args, token, text):
+    url = '{}/api/ticket/search?{}'.format(args.url, urllib.parse.urlencode(dict(q=text, limit=args.limit)))
+    return await fetch_json(client, url, token=token)
+
+
+async def export_and_match(client, args, token, text):
+    """ Fetch all the tickets and keep the ones whose description has all the words. """
+    words = text.strip('"').split()
+
+    response = await client.fetch(
+        args.url + '/api/ticket/export?format=ndjson',
+        headers={'Authorization': 'Bearer {}'.format(token)},
+        request_timeout=3600
+    )
+
+    matches = []
+
+    for line in response.body.splitlines():
+        description = json.loads(line)['description']['description'].lower()
+
+        if all(word in description for word in words):
+            matches.append(line)
+
+    return matches[:args.limit]
+
+
+async def run(args):
+    client = new_client(args.concurrency)
+
+    token = await login_or_signup(client, args.url, args.email, args.password)
+
+    latencies = []
+    pending = iter(range(args.requests))
+
+    async def worker():
+        for _ in pending:
+            latencies.append(await timed(search(client, args, token, random_query())))
+
+    start = time.perf_counter()
+    await tornado.gen.multi([worker() for _ in range(args.concurrency)])
+    summarize('search', latencies, time.perf_counter() - start)
+
+    baseline = []
+
+    for _ in range(args.baseline_requests):
+        baseline.append(await timed(export_and_match(client, args, token, random_query())))
+
+    summarize('export+grep', baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8998')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--baseline-requests', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0, help='Insert this many tickets and exit.')
+    args = parser.parse_args()
+
+    if args.seed:
+        from utils.db import Db
+
+        seed_tickets(Db(**settings['db']), args.seed, products=100)
+        print('Seeded {} tickets'.format(args.seed))
+        return
+
+    tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Read throughput of the server with 1 worker against N workers.
+
+Starts `python server.py` with WEB_CONCURRENCY set to each of --workers in turn, loads the
+product and ticket listing endpoints for --duration seconds each and stops the server.
+
+    python -m tools.bench_workers --workers 1,4 --duration 20 --concurrency 64
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from tools.benchmark import fetch_json, login_or_signup, new_client, summarize, timed
+
+READ_PATHS = ['/api/product', '/api/ticket']
+
+
+async def wait_until_ready(client, url, timeout=30):
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        try:
+            await fetch_json(client, url + '/api')
+            return
+        except Exception:
+            await tornado.gen.sleep(0.2)
+
+    raise RuntimeError('Server did not start within {}s'.format(timeout))
+
+
+async def load(client, url, token, duration, concurrency):
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            latencies.append(await timed(fetch_json(client, url, token=token)))
+
+    start = time.perf_counter()
+    await tornado.gen.multi([worker() for _ in range(concurrency)])
+
+    return latencies, time.perf_counter() - start
+
+
+async def run(args, workers):
+    client = new_client(args.concurrency)
+
+    await wait_until_ready(client, args.url)
+
+    token = await login_or_signup(client, args.url, args.email, args.password)
+
+    for path in READ_PATHS:
+        latencies, elapsed = await load(client, args.url + path, token, args.duration, args.concurrency)
+        summarize('{}w {}'.format(workers, path), latencies, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8998)
+    parser.add_argument('--workers', default='1,{}'.format(os.cpu_count()))
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--password', default='bench-password')
+    args = parser.parse_args()
+
+    args.url = 'http://localhost:{}'.format(args.port)
+
+    for workers in [int(count) for count in args.workers.split(',')]:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(args.port))
+        server = subprocess.Popen([sys.executable, 'server.py'], env=env, start_new_session=True)
+
+        try:
+            tornado.ioloop.IOLoop.current().run_sync(lambda: run(args, workers))
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Helpers shared by the benchmark scripts in this package.
+
+The scripts talk to a running server over HTTP, run them from the project root e.g.
+`python -m tools.bench_load --url http://localhost:8998`.
+"""
+import datetime
+import json
+import random
+import time
+import uuid
+
+import tornado.httpclient
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    ix = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[ix]
+
+
+def summarize(name, samples, elapsed=None):
+    """ Print count, throughput and latency percentiles (in ms) of `samples` given in seconds. """
+    line = '{:<12} n={:<7}'.format(name, len(samples))
+
+    if elapsed:
+        line += ' rps={:<9.1f}'.format(len(samples) / elapsed)
+
+    line += ' p50={:.1f}ms p90={:.1f}ms p99={:.1f}ms max={:.1f}ms'.format(
+        percentile(samples, 50) * 1000,
+        percentile(samples, 90) * 1000,
+        percentile(samples, 99) * 1000,
+        max(samples) * 1000 if samples else 0.0
+    )
+    print(line)
+
+
+async def fetch_json(client, url, method='GET', body=None, token=None, raise_error=True):
+    headers = {'Content-Type': 'application/json'}
+
+    if token:
+        headers['Authorization'] = 'Bearer {}'.format(token)
+
+    response = await client.fetch(
+        url,
+        method=method,
+        headers=headers,
+        body=json.dumps(body) if body is not None else None,
+        raise_error=raise_error
+    )
+
+    return response.code, json.loads(response.body) if response.body else None
+
+
+async def login_or_signup(client, base_url, email, password):
+    """ Return an auth token for `email`, creating the account when it doesn't exist yet. """
+    code, data = await fetch_json(
+        client, base_url + '/api/sign-in', 'POST', dict(email=email, password=password), raise_error=False
+    )
+
+    if code != 200:
+        code, data = await fetch_json(client, base_url + '/api/sign-up', 'POST', dict(email=email, password=password))
+
+    return data['token']
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def new_client(max_clients):
+    return tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=max_clients)
+
+
+# Vocabulary of the seeded descriptions, so the search benchmarks match a realistic share of rows.
+SEED_WORDS = (
+    'login', 'logout', 'password', 'session', 'timeout', 'crash', 'slow', 'export', 'import', 'report',
+    'dashboard', 'invoice', 'payment', 'refund', 'email', 'notification', 'upload', 'download', 'search',
+    'filter', 'button', 'page', 'mobile', 'browser', 'layout', 'permission', 'cache', 'database', 'error',
+    'warning', 'font', 'color', 'translation', 'calendar', 'schedule', 'backup', 'restore', 'api', 'token',
+    'settings', 'profile', 'avatar', 'comment', 'attachment', 'printer', 'keyboard', 'shortcut', 'sync',
+)
+
+SEED_SEVERITIES = ('low', 'medium', 'high', 'critical')
+
+
+def seed_description(ix, words=12):
+    """ Description of the `ix`th seeded ticket, `words` words picked from SEED_WORDS. """
+    picked = random.Random(ix).sample(SEED_WORDS, words)
+    return 'Seeded ticket number {}: {}'.format(ix, ' '.join(picked))
+
+
+def seed_tickets(db, count, products=1, batch_size=10000):
+    """ Insert `count` tickets spread over one month and over `products` new products, in bulk.
+        Return the uids of the products.
+    """
+    from auth.models import Auth
+    from product.models import Product
+    from ticket.models import Ticket, TicketStats
+
+    auth_uid = uuid.uuid4()
+    product_uids = [uuid.uuid4() for _ in range(products)]
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=30)
+
+    with db.session_scope() as session:
+        session.execute(Auth.__table__.insert().values(
+            uid=auth_uid, created_at=start, email='seed-{}@example.com'.format(auth_uid),
+            hashed=b'x' * 60, permissions=0b1111
+        ))
+
+        for offset in range(0, products, batch_size):
+            session.execute(Product.__table__.insert(), [
+                dict(uid=uid, created_at=start, name='seed-{}'.format(uid.hex[:12]),
+                     type=Product.OTHERS, owner_email='owner@example.com')
+                for uid in product_uids[offset:offset + batch_size]
+            ])
+
+    # The tickets go back a month, their partitions may not exist yet.
+    from utils.partitions import partition_manager
+
+    with db.session_scope() as session:
+        partition_manager.ensure(session, [Ticket.__tablename__], since=start)
+
+    step = datetime.timedelta(days=30) / max(count, 1)
+
+    for offset in range(0, count, batch_size):
+        rows = [
+            dict(
+                uid=uuid.uuid4(),
+                created_at=start + step * ix,
+                auth_uid=auth_uid,
+                product_uid=product_uids[ix % products],
+                status=Ticket.VALID_TICKET_STATUS[ix % len(Ticket.VALID_TICKET_STATUS)],
+                type=Ticket.VALID_TICKET_TYPES[ix % len(Ticket.VALID_TICKET_TYPES)],
+                description=dict(
+                    description=seed_description(ix),
+                    component=SEED_WORDS[ix % len(SEED_WORDS)],
+                    severity=SEED_SEVERITIES[ix % len(SEED_SEVERITIES)]
+                )
+            )
+            for ix in range(offset, min(offset + batch_size, count))
+        ]
+
+        with db.session_scope() as session:
+            session.execute(Ticket.__table__.insert(), rows)
+
+    # Bulk inserts bypass the handlers that keep the ticket counts.
+    with db.session_scope() as session:
+        TicketStats.reconcile(session)
+
+    return product_uids
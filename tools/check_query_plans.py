@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Fail when a handler query is planned with a sequential scan on one of the app tables, or when
+a date-bounded ticket listing reads every partition of the ticket table.
+
+Run it against a database holding a realistic amount of data, e.g.
+
+    python -m tools.check_query_plans --seed 1000000 --products 10000
+
+--seed inserts that many tickets (and --products products) and runs ANALYZE first.
+Exits with status 1 when any query falls back to a sequential scan or isn't pruned.
+"""
+import argparse
+import datetime
+import re
+import sys
+import uuid
+
+from sqlalchemy import and_, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from settings import settings
+from utils.db import Db
+from models import Base
+from auth.models import Auth, AuthToken, ProductPermission
+from product.models import Product
+from ticket.models import Ticket, TicketStats
+from tools.benchmark import seed_tickets
+
+CHECKED_TABLES = set(table.name for table in Base.metadata.sorted_tables)
+
+# Monthly and default partitions, e.g. ticket_202610, are checked as their table.
+PARTITION = re.compile(r'^(.*)_(\d{6}|default)$')
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def visit_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def handler_queries(session, sample):
+    """ (name, query) for the queries run by the handlers, bound to values from `sample`. """
+    after = (sample.created_at, sample.uid)
+    week = dict(since=sample.created_at - datetime.timedelta(days=7), until=sample.created_at)
+
+    return [
+        ('ticket list', Ticket.list_query(session).limit(51)),
+        ('ticket list next page', Ticket.list_query(session, after=after).limit(51)),
+        ('ticket list by product', Ticket.list_query(session, product_uid=sample.product_uid).limit(51)),
+        ('ticket list by auth', Ticket.list_query(session, auth_uid=sample.auth_uid).limit(51)),
+        ('ticket list by status', Ticket.list_query(session, status=sample.status).limit(51)),
+        ('ticket list by type', Ticket.list_query(session, type=sample.type).limit(51)),
+        ('ticket list by date', Ticket.list_query(session, **week).limit(51)),
+        ('ticket list by field', Ticket.list_query(
+            session, fields=dict(component=sample.description.get('component', 'login'))).limit(51)),
+        ('ticket search', Ticket.search_query(session, 'login timeout')),
+        ('ticket search by product', Ticket.search_query(session, 'login', product_uid=sample.product_uid)),
+        ('ticket by uid', session.query(*Ticket.columns(), Ticket.auth_uid).filter(
+            and_(Ticket.uid == sample.uid, Ticket.is_deleted == False))),
+        ('ticket version', session.query(Ticket.updated_at).filter(
+            and_(Ticket.uid == sample.uid, Ticket.is_deleted == False))),
+        ('ticket batch lock', session.query(Ticket.uid).filter(
+            and_(Ticket.uid.in_([sample.uid, uuid.uuid4()]), Ticket.is_deleted == False))),
+        ('product ticket stats', TicketStats.products_query(session, sample.product_uid)),
+        ('product by uid', session.query(*Product.columns()).filter(
+            and_(Product.uid == sample.product_uid, Product.is_deleted == False))),
+        ('product name check', session.query(Product.uid).filter(
+            and_(Product.name == 'some product', Product.is_deleted == False))),
+        ('products by uid', session.query(Product.uid).filter(
+            and_(Product.uid.in_([sample.product_uid]), Product.is_deleted == False))),
+        ('login', session.query(Auth).filter(Auth.email == 'someone@example.com')),
+        ('authenticated', session.query(AuthToken, Auth.email, Auth.permissions)
+            .join(Auth, AuthToken.auth_uid == Auth.uid)
+            .filter(AuthToken.uid == uuid.uuid4())),
+        ('product grants', session.query(ProductPermission.product_uid, ProductPermission.permissions)
+            .filter(ProductPermission.auth_uid == sample.auth_uid)),
+    ]
+
+
+def table_name(relation):
+    """ Table of the relation `relation`, itself unless it is a partition. """
+    match = PARTITION.match(relation or '')
+
+    if match and match.group(1) in CHECKED_TABLES:
+        return match.group(1)
+
+    return relation
+
+
+def seq_scans(plan):
+    """ Yield the relation names of the sequential scan nodes of a JSON plan. """
+    if plan.get('Node Type') == 'Seq Scan' and table_name(plan.get('Relation Name')) in CHECKED_TABLES:
+        yield plan['Relation Name']
+
+    for child in plan.get('Plans', []):
+        for relation in seq_scans(child):
+            yield relation
+
+
+def scanned_partitions(plan, table):
+    """ Yield the partitions of `table` read by a JSON plan. """
+    relation = plan.get('Relation Name')
+
+    if relation != table and table_name(relation) == table:
+        yield relation
+
+    for child in plan.get('Plans', []):
+        for partition in scanned_partitions(child, table):
+            yield partition
+
+
+def partition_count(session, table):
+    return session.execute(text(
+        'SELECT count(*) FROM pg_inherits JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+        'WHERE parent.relname = :table'
+    ), dict(table=table)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='Insert this many tickets first.')
+    parser.add_argument('--products', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = Db(**settings['db'])
+
+    if args.seed:
+        print('Seeding {} tickets over {} products...'.format(args.seed, args.products))
+        seed_tickets(db, args.seed, products=args.products)
+
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+    failures = 0
+
+    with db.session_scope() as session:
+        sample = session.query(Ticket).filter(Ticket.is_deleted == False).first()
+
+        if sample is None:
+            print('No tickets found, seed the database with --seed first.')
+            sys.exit(2)
+
+        partitions = partition_count(session, Ticket.__tablename__)
+
+        for name, query in handler_queries(session, sample):
+            plan = session.execute(Explain(query.statement)).scalar()[0]['Plan']
+            relations = sorted(set(seq_scans(plan)))
+
+            if relations:
+                failures += 1
+                print('FAIL {:<24} seq scan on {}'.format(name, ', '.join(relations)))
+
+            elif name == 'ticket list by date' and len(set(scanned_partitions(plan, 'ticket'))) >= partitions:
+                failures += 1
+                print('FAIL {:<24} all {} ticket partitions read'.format(name, partitions))
+
+            else:
+                print('ok   {}'.format(name))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Fail when a read endpoint runs more SQL statements than expected.
+
+Starts the application in-process against the configured database, creates a product and a
+ticket through the API, then counts the statements each request sends to the database
+(token already cached, so authentication doesn't add any).
+
+    python -m tools.check_statement_counts
+
+Exits with status 1 when any request runs a different number of statements.
+"""
+import sys
+import uuid
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+from sqlalchemy import event
+
+import server
+from settings import settings
+from tools.benchmark import fetch_json, login_or_signup, new_client
+
+
+class StatementCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+
+def checks(product_uid, ticket_uid):
+    """ (name, path, headers, expected statements), in the order they are run. """
+    return [
+        ('ticket list', '/api/ticket', None, 2),
+        ('ticket list, not modified', '/api/ticket', 'etag', 1),
+        ('ticket list by product', '/api/ticket?product_uid={}'.format(product_uid), None, 2),
+        ('ticket', '/api/ticket/{}'.format(ticket_uid), None, 2),
+        ('ticket, not modified', '/api/ticket/{}'.format(ticket_uid), 'etag', 1),
+        ('ticket export', '/api/ticket/export', None, 1),
+        ('product list, cold', '/api/product', None, 2),
+        ('product list, warm', '/api/product', None, 0),
+        ('product, cold', '/api/product/{}'.format(product_uid), None, 1),
+        ('product, warm', '/api/product/{}'.format(product_uid), None, 0),
+        ('product export', '/api/product/export', None, 1),
+    ]
+
+
+async def run(base_url, counter):
+    client = new_client(1)
+
+    token = await login_or_signup(client, base_url, 'statements@example.com', 'statements-password')
+
+    _, product = await fetch_json(client, base_url + '/api/product', 'POST', token=token, body=dict(
+        name='chk-{}'.format(uuid.uuid4().hex[:8]), type='others', email='owner@example.com'
+    ))
+    _, ticket = await fetch_json(client, base_url + '/api/ticket', 'POST', token=token, body=dict(
+        status='select_dev', type='bug', product_uid=product['uid'], desc='Statement count check'
+    ))
+
+    failures = 0
+    etags = {}
+
+    for name, path, conditional, expected in checks(product['uid'], ticket['uid']):
+        headers = {'Authorization': 'Bearer {}'.format(token)}
+
+        if conditional:
+            headers['If-None-Match'] = etags[path]
+
+        counter.count = 0
+        response = await client.fetch(base_url + path, headers=headers, raise_error=False)
+        etags[path] = response.headers.get('Etag', '')
+
+        if counter.count != expected or response.code not in (200, 304):
+            failures += 1
+            print('FAIL {:<28} {} statements, expected {} (HTTP {})'.format(name, counter.count, expected, response.code))
+        else:
+            print('ok   {:<28} {} statements'.format(name, counter.count))
+
+    return failures
+
+
+def main():
+    application = server.create(settings)
+
+    counter = StatementCounter(application.db.serving_engine)
+
+    sock, port = tornado.testing.bind_unused_port()
+    http_server = tornado.httpserver.HTTPServer(application)
+    http_server.add_sockets([sock])
+
+    failures = tornado.ioloop.IOLoop.current().run_sync(lambda: run('http://127.0.0.1:{}'.format(port), counter))
+
+    http_server.stop()
+    application.password_hasher.shutdown()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
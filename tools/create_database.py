@@ -19,6 +19,17 @@ def main():
     db.drop_tables(Base.metadata)
     db.create_tables(Base.metadata)
 
+    from utils.partitions import partition_manager, partitioned_tables
+
+    with db.session_scope() as session:
+        partition_manager.ensure(session, partitioned_tables(Base.metadata))
+
+    # The tables are created from the models, so they already match the latest migration.
+    from alembic.config import Config
+    from alembic import command
+
+    command.stamp(Config('alembic.ini'), 'head')
+
     print('Done!')
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Grant or take back the access to the /api/admin routes.
+
+    python -m tools.grant_admin user@example.com            # grant
+    python -m tools.grant_admin user@example.com --revoke   # take back
+
+The admin flag can't be set through the edit-user API. Every worker drops the principals of the
+user it cached. Signed tokens carry the permissions they were issued with: on --revoke they are
+revoked, after a grant the user has to sign in again to get the flag in a signed token.
+"""
+import argparse
+import sys
+
+from settings import settings
+from utils.db import Db
+from auth import permissions as perms
+from auth.cache import token_cache
+from auth.models import Auth, AuthToken, PermissionChange
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('email', help='Email of the user.')
+    parser.add_argument('--revoke', action='store_true', help='Take the admin flag back.')
+    args = parser.parse_args()
+
+    db = Db(**settings['db'])
+
+    # PermissionChange rows must outlive the principals cached by the workers.
+    token_cache.configure(**settings['auth_cache'])
+
+    with db.session_scope() as session:
+        user = session.query(Auth).filter(Auth.email == args.email).with_for_update().one_or_none()
+
+        if not user:
+            print('No user found for {}'.format(args.email))
+            sys.exit(1)
+
+        if args.revoke:
+            user.permissions = user.permissions & ~perms.ADMIN
+
+            AuthToken.revoke_oldest(session, user.uid, AuthToken.SIGNED_TOKEN, 0)
+        else:
+            user.permissions = user.permissions | perms.ADMIN
+
+        # The workers drop the principals of this user they cached, see RevocationList.
+        PermissionChange.record(session, user.uid)
+
+        print('{} is {}an admin'.format(args.email, 'not ' if args.revoke else ''))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Rebuild the ticket_stats counts from the ticket table.
+
+    python -m tools.reconcile_ticket_stats           # rebuild
+    python -m tools.reconcile_ticket_stats --check   # only report the drift, exit 1 on any
+
+The handlers keep the counts up to date, run it after writing tickets outside of the API
+(bulk imports, manual fixes) or from cron as a safety net. Ticket writes wait while it rebuilds,
+the check reads a single snapshot and doesn't block them.
+"""
+import argparse
+import sys
+
+from sqlalchemy import func, text
+
+from settings import settings
+from utils.db import Db
+from ticket.models import Ticket, TicketStats
+
+
+def drift(session):
+    """ {(product_uid, status, type): (stored count, actual count)} of the keys that differ.
+        Both sides must be read from the same snapshot, or from under the ticket_stats lock,
+        otherwise the tickets written in between show up as drift.
+    """
+    stored = dict(
+        ((row.product_uid, row.status, row.type), row.count)
+        for row in session.query(TicketStats)
+    )
+    actual = dict(
+        ((product_uid, status, type), count)
+        for product_uid, status, type, count in session.query(
+            Ticket.product_uid, Ticket.status, Ticket.type, func.count()
+        ).filter(Ticket.is_deleted == False).group_by(Ticket.product_uid, Ticket.status, Ticket.type)
+    )
+
+    return dict(
+        (key, (stored.get(key, 0), actual.get(key, 0)))
+        for key in set(stored) | set(actual)
+        if stored.get(key, 0) != actual.get(key, 0)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='Report the drift without rebuilding.')
+    args = parser.parse_args()
+
+    db = Db(**settings['db'])
+
+    with db.session_scope() as session:
+        if args.check:
+            # A ticket change and its count change commit together, one snapshot sees both or neither.
+            session.connection(execution_options=dict(isolation_level='REPEATABLE READ'))
+        else:
+            # Taken by the rebuild anyway, the counts can't move between the check and the rebuild.
+            session.execute(text('LOCK TABLE ticket_stats IN EXCLUSIVE MODE'))
+
+        differences = drift(session)
+
+        for (product_uid, status, type), (stored, actual) in sorted(differences.items(), key=str):
+            print('{} {:<12} {:<12} stored={} actual={}'.format(product_uid, status, type, stored, actual))
+
+        print('{} counts out of date'.format(len(differences)))
+
+        if args.check:
+            sys.exit(1 if differences else 0)
+
+        if differences:
+            TicketStats.reconcile(session)
+            print('Rebuilt')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import base64
+import datetime
 import uuid
 import tornado.web
 import re
@@ -13,18 +15,52 @@ def convert_uuid_or_400(uidstr):
             400, log_message="Bad uuid format")
 
 
+def encode_cursor(created_at, uid):
+    """ Opaque keyset pagination cursor pointing at the row with (created_at, uid). """
+    raw = '{}|{}'.format(created_at.isoformat(), uid)
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii')
+
+
+def decode_cursor_or_400(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8')
+        created_at, uid = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(uid)
+
+    except ValueError:
+        raise tornado.web.HTTPError(
+            400, log_message="Bad cursor format")
+
+
+def parse_utc_datetime(value):
+    """ Naive UTC datetime of the ISO date `value`, comparable with the stored ones. Dates with an
+        offset are converted to UTC, the others are taken as UTC. Raises ValueError.
+    """
+    parsed = datetime.datetime.fromisoformat(value)
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return parsed
+
+
 def is_valid_email(email):
     EMAIL_REGEX = re.compile(r"[^@]+@[^@]+\.[^@]+")
     return EMAIL_REGEX.match(email)
 
 
-def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt())
+def hash_password(password, rounds=12):
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds))
 
 
 def match_password(password, hashed_password):
     canditate = password.encode('utf-8')
-    return bcrypt.hashpw(canditate, hashed_password) == hashed_password
+    return bcrypt.checkpw(canditate, hashed_password)
+
+
+def password_cost(hashed_password):
+    """ Cost factor of a bcrypt hash, e.g. 12 for b'$2b$12$...'. """
+    return int(hashed_password[4:6])
 
 
 def is_valid_password(password):
@@ -0,0 +1,53 @@
+import math
+
+import mmh3
+from bitarray import bitarray
+
+
+class BloomFilter(object):
+    """    Bloom filter of strings sized for `capacity` items at the given false positive rate.
+
+        A key that was added is always reported as present, a key that wasn't is reported
+        as present with a probability of about `error_rate` while `count <= capacity`.
+        Adding a key again (or one already reported as present) doesn't change the filter
+        nor `count`.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+
+        self.num_bits = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(float(self.num_bits) / self.capacity * math.log(2))))
+
+        self.bits = bitarray(self.num_bits)
+        self.bits.setall(False)
+
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing over the two halves of the 128 bit murmur3 hash.
+        h1, h2 = mmh3.hash64(key.encode('utf8'), signed=False)
+
+        return [(h1 + ix * h2) % self.num_bits for ix in range(self.num_hashes)]
+
+    def add(self, key):
+        """ Add `key`, return False when it was already reported as present. """
+        added = False
+
+        for position in self._positions(key):
+            if not self.bits[position]:
+                self.bits[position] = True
+                added = True
+
+        if added:
+            self.count += 1
+
+        return added
+
+    def __contains__(self, key):
+        return all(self.bits[position] for position in self._positions(key))
+
+    def estimated_error_rate(self):
+        """ False positive rate measured from the bits set, whatever was added. """
+        return (float(self.bits.count(True)) / self.num_bits) ** self.num_hashes
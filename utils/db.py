@@ -1,12 +1,25 @@
+import asyncio
+import contextvars
 import logging
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 import sqlalchemy_utils
 
+from utils.pool_metrics import PoolMetrics, timed_pool_class
+
 Session = sessionmaker()
 
+# Sessions of the asyncio engine. Objects are not expired on commit, since touching an
+# expired attribute outside of an awaited call is not possible with asyncio.
+AsyncSessionMaker = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+SYNC_ENGINE = 'sync'
+ASYNC_ENGINE = 'async'
+
 class Db:
     def __init__(self, **kwargs):
         all_settings = dict()
@@ -20,12 +33,78 @@ class Db:
 
         self.settings = all_settings
 
+        # Metrics of the pool serving the requests, i.e. the asyncio one when enabled.
+        self.pool_metrics = PoolMetrics()
+
+        is_async = all_settings.get('engine', SYNC_ENGINE) == ASYNC_ENGINE
+
         self.engine = create_engine(
             self.database_url,
-            echo = all_settings.get('echo', False)
+            **self._engine_options(is_async=False, metrics=None if is_async else self.pool_metrics)
         )
         Session.configure(bind=self.engine)
 
+        # The sync engine is always there for tools and migrations, the asyncio one
+        # (asyncpg driver) only when selected with the `engine` setting.
+        self.async_engine = None
+
+        if is_async:
+            self.async_engine = create_async_engine(
+                self.database_url.replace('postgresql://', 'postgresql+asyncpg://', 1),
+                **self._engine_options(is_async=True, metrics=self.pool_metrics)
+            )
+            AsyncSessionMaker.configure(bind=self.async_engine)
+
+    def _engine_options(self, is_async, metrics):
+        settings = self.settings
+
+        options = dict(
+            echo=settings.get('echo', False),
+            pool_pre_ping=settings.get('pool_pre_ping', False)
+        )
+
+        if settings.get('external_pooler', False):
+            # An external pooler (PgBouncer in transaction mode) owns the connections, so don't
+            # keep any here and don't use prepared statements that would outlive a transaction.
+            options['poolclass'] = NullPool
+
+            if is_async:
+                options['connect_args'] = dict(statement_cache_size=0, prepared_statement_cache_size=0)
+
+            return options
+
+        pool_class = AsyncAdaptedQueuePool if is_async else QueuePool
+
+        options.update(
+            poolclass=timed_pool_class(pool_class, metrics) if metrics else pool_class,
+            pool_size=settings.get('pool_size', 5),
+            max_overflow=settings.get('max_overflow', 10),
+            pool_timeout=settings.get('pool_timeout', 30),
+            pool_recycle=settings.get('pool_recycle', -1)
+        )
+
+        return options
+
+    @property
+    def pool_capacity(self):
+        """ Max number of connections the serving pool hands out at once, None when unbounded. """
+        if self.settings.get('external_pooler', False):
+            return None
+
+        return self.settings.get('pool_size', 5) + self.settings.get('max_overflow', 10)
+
+    @property
+    def serving_engine(self):
+        """ Engine of the requests: the asyncio one when enabled (its sync facade), else the sync one. """
+        return self.async_engine.sync_engine if self.is_async else self.engine
+
+    def pool_status(self):
+        return self.pool_metrics.snapshot(self.serving_engine.pool)
+
+    @property
+    def is_async(self):
+        return self.async_engine is not None
+
     def create_database(self):
         conn = self.engine.connect()
         conn.execute('commit')
@@ -50,6 +129,13 @@ class Db:
     def session(self):
         return Session()
 
+    async def dispose(self):
+        """ Close all pooled connections, e.g. when the process shuts down. """
+        self.engine.dispose()
+
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+
     @contextmanager
     def session_scope(self):
         """Provide a database scope for operations."""
@@ -66,3 +152,42 @@ class Db:
 
         finally:
             session.close()
+
+    async def run_in_session(self, executor, fn, *args):
+        """ Run `fn(session, *args)` inside a session scope without blocking the event loop.
+
+            With the asyncio engine `fn` goes through `AsyncSession.run_sync`, otherwise it runs
+            on `executor`, or inline when `executor` is None.
+        """
+        if self.is_async:
+            async with self.async_session_scope() as session:
+                return await session.run_sync(fn, *args)
+
+        if executor is None:
+            return self._call_in_session(fn, *args)
+
+        # Copy of the caller's context, e.g. the stats of the request the queries belong to.
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, contextvars.copy_context().run, self._call_in_session, fn, *args
+        )
+
+    def _call_in_session(self, fn, *args):
+        with self.session_scope() as session:
+            return fn(session, *args)
+
+    @asynccontextmanager
+    async def async_session_scope(self):
+        """Provide an asyncio database scope for operations, same semantics as session_scope()."""
+        session = AsyncSessionMaker()
+
+        try:
+            yield session
+            await session.commit()
+
+        except Exception as e:
+
+            await session.rollback()
+            raise
+
+        finally:
+            await session.close()
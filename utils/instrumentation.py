@@ -0,0 +1,200 @@
+import contextvars
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+from utils.metrics import Histogram
+
+# RequestStats of the request being served. Copied into the DB executor threads by Db.run_in_session.
+current_request = contextvars.ContextVar('current_request', default=None)
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestStats(object):
+    """    Timings of a single request: wall time, DB time and statements, and the named
+        timings of the other steps (serialization, bcrypt...), all in seconds.
+    """
+
+    # Statements kept for the slow request log, the count and time cover all of them.
+    MAX_STATEMENTS = 20
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.statements = []
+        self.timings = {}
+        self.response_bytes = 0
+
+    def add_query(self, statement, duration):
+        self.db_time += duration
+        self.db_queries += 1
+
+        if len(self.statements) < self.MAX_STATEMENTS:
+            self.statements.append((duration, statement))
+
+    def add_timing(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """ Value of the Server-Timing header, durations in ms. """
+        parts = ['db;dur={:.1f};desc="{} queries"'.format(self.db_time * 1000, self.db_queries)]
+        parts += ['{};dur={:.1f}'.format(name, duration * 1000) for name, duration in self.timings.items()]
+        parts.append('total;dur={:.1f}'.format(self.elapsed() * 1000))
+
+        return ', '.join(parts)
+
+
+def record_timing(name, duration):
+    """ Add `duration` to the `name` timing of the current request, if any. """
+    stats = current_request.get()
+
+    if stats is not None:
+        stats.add_timing(name, duration)
+
+
+def instrument_engine(engine):
+    """ Record the time and statement of every query run by `engine` into the current request. """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_start'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start']
+
+        stats = current_request.get()
+
+        if stats is not None:
+            stats.add_query(statement, duration)
+
+
+class RouteMetrics(object):
+    def __init__(self):
+        self.duration = Histogram()
+        self.db_time = Histogram()
+        self.serialize_time = Histogram()
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.db_queries = 0
+        self.statuses = {}
+
+
+class RequestMetrics(object):
+    """    Histograms of the request timings per handler and method, rendered in the
+        Prometheus text format, plus the slow request log.
+    """
+
+    def __init__(self, enabled=True, slow_request_ms=500, worker=0):
+        self.enabled = enabled
+        self.slow_request_ms = slow_request_ms
+
+        # Number of the worker process, a label of every series so the workers don't collide.
+        self.worker = worker
+
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, slow_request_ms=None, worker=None, **_):
+        if enabled is not None:
+            self.enabled = enabled
+
+        if slow_request_ms is not None:
+            self.slow_request_ms = slow_request_ms
+
+        if worker is not None:
+            self.worker = worker
+
+    def _route(self, handler, method):
+        key = (handler, method)
+        route = self.routes.get(key)
+
+        if route is None:
+            with self._lock:
+                route = self.routes.setdefault(key, RouteMetrics())
+
+        return route
+
+    def observe(self, handler, method, status, uri, stats):
+        elapsed = stats.elapsed()
+
+        route = self._route(handler, method)
+        route.duration.observe(elapsed)
+        route.db_time.observe(stats.db_time)
+        route.serialize_time.observe(stats.timings.get('json', 0.0))
+        route.response_bytes.observe(stats.response_bytes)
+        route.db_queries += stats.db_queries
+        route.statuses[status] = route.statuses.get(status, 0) + 1
+
+        if elapsed * 1000 >= self.slow_request_ms:
+            self.log_slow_request(method, uri, status, elapsed, stats)
+
+    @staticmethod
+    def log_slow_request(method, uri, status, elapsed, stats):
+        slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:3]
+
+        logging.warning(
+            'Slow request %s %s %d in %.1fms: db %.1fms in %d queries, %s%s',
+            method, uri, status, elapsed * 1000, stats.db_time * 1000, stats.db_queries,
+            ', '.join('{} {:.1f}ms'.format(name, duration * 1000) for name, duration in stats.timings.items()),
+            ''.join('\n    {:.1f}ms {}'.format(duration * 1000, ' '.join(statement.split())[:1000])
+                    for duration, statement in slowest)
+        )
+
+    def render(self):
+        """ All the metrics in the Prometheus text exposition format. """
+        lines = []
+
+        histograms = [
+            ('http_request_duration_seconds', 'Request wall time', 'duration'),
+            ('http_request_db_seconds', 'Time spent in SQL queries per request', 'db_time'),
+            ('http_request_serialize_seconds', 'Time spent encoding JSON per request', 'serialize_time'),
+            ('http_response_size_bytes', 'Response body size', 'response_bytes'),
+        ]
+
+        routes = sorted(self.routes.items())
+
+        for name, help_text, attribute in histograms:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+
+            for (handler, method), route in routes:
+                histogram = getattr(route, attribute)
+                labels = 'worker="{}",handler="{}",method="{}"'.format(self.worker, handler, method)
+
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, '+Inf' if bound is None else bound, count
+                    ))
+
+                lines.append('{}_sum{{{}}} {}'.format(name, labels, histogram.sum))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+
+        lines.append('# HELP http_request_db_queries_total SQL queries run by the requests')
+        lines.append('# TYPE http_request_db_queries_total counter')
+
+        for (handler, method), route in routes:
+            lines.append('http_request_db_queries_total{{worker="{}",handler="{}",method="{}"}} {}'.format(
+                self.worker, handler, method, route.db_queries
+            ))
+
+        lines.append('# HELP http_requests_total Requests by response status')
+        lines.append('# TYPE http_requests_total counter')
+
+        for (handler, method), route in routes:
+            for status, count in sorted(route.statuses.items()):
+                lines.append('http_requests_total{{worker="{}",handler="{}",method="{}",status="{}"}} {}'.format(
+                    self.worker, handler, method, status, count
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+
+# Process wide metrics recorded by BaseHandler.
+request_metrics = RequestMetrics()
@@ -0,0 +1,56 @@
+import datetime
+import json
+import uuid
+
+
+def _default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class JsonEncoder(object):
+    """    Encoder of the handler responses to UTF-8 JSON bytes.
+
+        Uses orjson when it is installed, the stdlib json module otherwise. Both encode
+        UUIDs as strings and datetimes in isoformat, so rows can be passed as they come
+        out of the database.
+    """
+
+    BACKENDS = ('auto', 'orjson', 'json')
+
+    def __init__(self, backend='auto'):
+        self.configure(backend)
+
+    def configure(self, backend='auto'):
+        if backend not in self.BACKENDS:
+            raise ValueError('Invalid JSON backend {}. Must be one of {}.'.format(backend, ', '.join(self.BACKENDS)))
+
+        self.encode = self._encode_json
+        self.backend = 'json'
+
+        if backend in ('auto', 'orjson'):
+            try:
+                import orjson
+            except ImportError:
+                if backend == 'orjson':
+                    raise
+            else:
+                self._orjson = orjson
+                self.encode = self._encode_orjson
+                self.backend = 'orjson'
+
+    def _encode_orjson(self, value):
+        return self._orjson.dumps(value, default=_default)
+
+    @staticmethod
+    def _encode_json(value):
+        return json.dumps(value, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf8')
+
+
+# Process wide encoder used by BaseHandler.write.
+json_encoder = JsonEncoder()
@@ -0,0 +1,44 @@
+import bisect
+import threading
+
+
+class Histogram(object):
+    """    Fixed bucket histogram, safe to update from the executor threads.
+        Bucket bounds are upper bounds in seconds, the last implicit bucket is +Inf.
+    """
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        ix = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[ix] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative_counts(self):
+        """ Return (upper bound, cumulative count) pairs, the last bound is None for +Inf. """
+        total = 0
+        data = []
+
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            total += count
+            data.append((bound, total))
+
+        return data
+
+    def to_json(self):
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            buckets=[dict(le=bound if bound is not None else '+Inf', count=count)
+                     for bound, count in self.cumulative_counts()]
+        )
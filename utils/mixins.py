@@ -2,7 +2,7 @@ import datetime
 import uuid
 
 from sqlalchemy import Column, DateTime, Boolean
-from sqlalchemy import func
+from sqlalchemy import func, text
 from sqlalchemy.dialects import postgresql
 
 UUID = postgresql.UUID(as_uuid=True)
@@ -28,10 +28,32 @@ class UIDMixin(object):
                     created_at=self.created_at.isoformat())
 
 
+def utc_now():
+    """ Current time of the database in UTC, naive like utcnow(). Unlike now(), which is the start
+        of the transaction, it moves on within a transaction.
+    """
+    return func.timezone('UTC', func.clock_timestamp())
+
+
+class UpdatedAtMixin(object):
+    """ Model with an updated_at date, bumped on every UPDATE (soft deletes included).
+        The version of a single row; whole tables are versioned by utils.table_version.
+    """
+    updated_at = Column(DateTime, default=utc_now(), onupdate=utc_now(),
+                        server_default=text("timezone('UTC', clock_timestamp())"),
+                        nullable=False, index=True)
+
+
+def live_rows():
+    """ WHERE clause of the partial indexes covering the rows that are not marked deleted. """
+    return text('is_deleted = false')
+
+
 class DeletableMixin(object):
     """
     Model that can be deleted. We don't delete anything from the database,
-    we just mark rows as deleted.
+    we just mark rows as deleted. Tickets deleted long ago are moved to an
+    archive table, see ticket.archive.
     """
     is_deleted = Column(Boolean, default=False, server_default='f', nullable=False)
     deleted_at = Column(DateTime, nullable=True)
@@ -0,0 +1,172 @@
+import datetime
+import logging
+import time
+
+from sqlalchemy import text
+
+
+def partitioned_tables(metadata):
+    """ Names of the tables of `metadata` declared with postgresql_partition_by, which are
+        partitioned by month on a timestamp, see PartitionManager.
+    """
+    return [
+        table.name for table in metadata.sorted_tables
+        if table.dialect_options['postgresql'].get('partition_by')
+    ]
+
+
+def month_start(day, months=0):
+    """ First day of the month of `day`, moved by `months` months. """
+    month = day.year * 12 + day.month - 1 + months
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return '{}_{:%Y%m}'.format(table, month)
+
+
+class PartitionManager(object):
+    """    Creates the monthly partitions of the partitioned tables ahead of time, from the current
+        month to `months_ahead` months later, plus a default partition catching the rows of any
+        month without one, so inserts never fail.
+
+        A month can't be created while the default partition holds rows of it. Rows end up there
+        when the maintenance fell behind, they are then moved to the partition of their month
+        in the transaction creating it, and counted in `moved` for alerting.
+
+        Creating a partition briefly locks the parent table, so it is done well before the month
+        starts. Old months can be detached and dropped without touching the other ones.
+        Meant to be run by a single process, see server.schedule_background_tasks.
+    """
+
+    def __init__(self, months_ahead=3):
+        self.months_ahead = months_ahead
+
+        self.enabled = False
+        self.runs = 0
+        self.errors = 0
+        self.created = 0
+        self.moved = 0
+        self.last_run_at = None
+        self.last_run_ms = None
+
+    def configure(self, months_ahead=None, **_):
+        if months_ahead is not None:
+            self.months_ahead = months_ahead
+
+    def ensure(self, connection, tables, today=None, since=None):
+        """ Create the missing partitions of `tables` with `connection` (a connection or a
+            session), return the names of the ones created. `since` is a past date to create
+            the partitions from, e.g. before loading older rows.
+        """
+        today = today or datetime.datetime.utcnow().date()
+        first = month_start(since or today)
+        created = []
+
+        for table in tables:
+            existing = set(connection.execute(text(
+                'SELECT child.relname FROM pg_inherits '
+                'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+                'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+                'WHERE parent.relname = :table'
+            ), dict(table=table)).scalars())
+
+            default = '{}_default'.format(table)
+
+            if default not in existing:
+                connection.execute(text('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(default, table)))
+                created.append(default)
+
+            start = first
+
+            while start <= month_start(today, self.months_ahead):
+                name = partition_name(table, start)
+                end = month_start(start, 1)
+
+                if name not in existing:
+                    self.create_month(connection, table, default, name, start, end)
+                    created.append(name)
+
+                start = end
+
+        return created
+
+    def create_month(self, connection, table, default, name, start, end):
+        """ Create the partition `name` of `table` for [start, end), moving the rows of that
+            month out of the `default` partition first.
+        """
+        bounds = dict(start=start, end=end)
+
+        stranded = connection.execute(text(
+            'SELECT 1 FROM {} WHERE created_at >= :start AND created_at < :end LIMIT 1'.format(default)
+        ), bounds).first()
+
+        if stranded:
+            # Generated columns can't be inserted, they are computed again.
+            columns = ', '.join(connection.execute(text(
+                'SELECT column_name FROM information_schema.columns '
+                "WHERE table_schema = current_schema() AND table_name = :table AND is_generated = 'NEVER' "
+                'ORDER BY ordinal_position'
+            ), dict(table=table)).scalars())
+
+            connection.execute(text(
+                'CREATE TEMPORARY TABLE partition_rows AS SELECT {} FROM {} WITH NO DATA'.format(columns, default)
+            ))
+            moved = connection.execute(text(
+                'WITH moved AS (DELETE FROM {default} WHERE created_at >= :start AND created_at < :end '
+                'RETURNING {columns}) INSERT INTO partition_rows SELECT {columns} FROM moved'.format(
+                    default=default, columns=columns
+                )
+            ), bounds).rowcount
+
+        connection.execute(text(
+            "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ('{}') TO ('{}')".format(
+                name, table, start.isoformat(), end.isoformat()
+            )
+        ))
+
+        if stranded:
+            connection.execute(text(
+                'INSERT INTO {table} ({columns}) SELECT {columns} FROM partition_rows'.format(
+                    table=table, columns=columns
+                )
+            ))
+            connection.execute(text('DROP TABLE partition_rows'))
+
+            self.moved += moved
+            logging.warning('Moved %d rows of %s out of %s, its partitions are created too late', moved, name, default)
+
+    async def maintain(self, db, executor, tables):
+        start = time.perf_counter()
+
+        try:
+            created = await db.run_in_session(executor, self.ensure, tables)
+            self.created += len(created)
+
+            if created:
+                logging.info('Created the partitions %s', ', '.join(created))
+
+        except Exception:
+            self.errors += 1
+            logging.exception('Partition maintenance failed')
+
+        finally:
+            self.runs += 1
+            self.last_run_at = datetime.datetime.utcnow()
+            self.last_run_ms = (time.perf_counter() - start) * 1000
+
+    def stats(self):
+        return dict(
+            enabled=self.enabled,
+            months_ahead=self.months_ahead,
+            runs=self.runs,
+            errors=self.errors,
+            created=self.created,
+            moved=self.moved,
+            last_run_at=self.last_run_at,
+            last_run_ms=self.last_run_ms
+        )
+
+
+# Process wide manager, only enabled in the process running the background jobs.
+partition_manager = PartitionManager()
@@ -0,0 +1,99 @@
+import asyncio
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import tornado.web
+
+from utils.app_util import hash_password, match_password, password_cost
+from utils.instrumentation import record_timing
+
+
+class PasswordHasher(object):
+    """    bcrypt hashing on a bounded process pool, so logins don't hold the GIL of the
+        serving process.
+
+        The cost factor is `rounds`, or calibrated against `target_ms` when it isn't set.
+        At most `max_pending` hashes are queued, past that callers get a 503.
+        Without workers (async_mode off) hashing runs inline.
+    """
+
+    MIN_ROUNDS = 10
+    MAX_ROUNDS = 16
+
+    def __init__(self, workers=2, max_pending=64, rounds=None, target_ms=250):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.target_ms = target_ms
+
+        self.executor = None
+        self.pending = 0
+        self.rejected = 0
+
+    def start(self, use_pool=True):
+        if not self.rounds:
+            self.rounds = self.calibrate(self.target_ms)
+
+        if use_pool and self.workers:
+            # Spawned, not forked, as the serving process already runs threads.
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    @classmethod
+    def calibrate(cls, target_ms):
+        """ Highest cost factor whose hash takes about `target_ms` on this machine.
+            Each extra round doubles the time, so one timing at the minimum cost is enough.
+        """
+        start = time.perf_counter()
+        hash_password('calibration', cls.MIN_ROUNDS)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        rounds = cls.MIN_ROUNDS + int(math.floor(math.log(target_ms / elapsed_ms, 2)))
+
+        return max(cls.MIN_ROUNDS, min(rounds, cls.MAX_ROUNDS))
+
+    def needs_rehash(self, hashed):
+        return password_cost(hashed) != self.rounds
+
+    async def hash(self, password):
+        return await self._run(hash_password, password, self.rounds)
+
+    async def check(self, password, hashed):
+        return await self._run(match_password, password, bytes(hashed))
+
+    async def _run(self, fn, *args):
+        start = time.perf_counter()
+
+        try:
+            if self.executor is None:
+                return fn(*args)
+
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise tornado.web.HTTPError(503, 'Too many password checks in progress. Please retry.')
+
+            self.pending += 1
+
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+            finally:
+                self.pending -= 1
+
+        finally:
+            # Includes the wait for a free worker.
+            record_timing('bcrypt', time.perf_counter() - start)
+
+    def stats(self):
+        return dict(
+            rounds=self.rounds,
+            workers=self.workers,
+            pending=self.pending,
+            max_pending=self.max_pending,
+            rejected=self.rejected
+        )
@@ -0,0 +1,60 @@
+import time
+
+import sqlalchemy.exc
+
+from utils.metrics import Histogram
+
+
+class PoolMetrics(object):
+    """    Live metrics of an engine connection pool: checkout wait times and timeouts,
+        on top of the size/checked-out/overflow gauges the pool keeps itself.
+    """
+
+    def __init__(self):
+        self.wait_time = Histogram()
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def snapshot(self, pool):
+        data = dict(
+            pool=pool.__class__.__name__,
+            checkouts=self.checkouts,
+            timeouts=self.timeouts,
+            wait_seconds=self.wait_time.to_json()
+        )
+
+        # NullPool (external pooler mode) has no size or overflow.
+        if hasattr(pool, 'checkedout'):
+            data.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow()
+            )
+
+        return data
+
+
+def timed_pool_class(pool_class, metrics):
+    """ Return a subclass of `pool_class` recording how long each checkout waits in `metrics`.
+        The wait includes opening a new connection when the pool has to grow.
+    """
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+
+            try:
+                return super(TimedPool, self)._do_get()
+
+            except sqlalchemy.exc.TimeoutError:
+                metrics.timeouts += 1
+                raise
+
+            finally:
+                metrics.checkouts += 1
+                metrics.wait_time.observe(time.perf_counter() - start)
+
+    TimedPool.__name__ = 'Timed' + pool_class.__name__
+
+    return TimedPool
@@ -0,0 +1,63 @@
+from sqlalchemy import Column, String, DateTime, DDL, event
+
+from utils.dbbase import Base
+
+
+class TableVersion(Base):
+    """    Version of a whole table, the Last-Modified / ETag of its listings.
+
+        A deferred trigger of each tracked table (see `track`) bumps the row of the table when
+        the writing transaction commits. The row stays locked until the commit is done, so the
+        versions are ordered like the commits, unlike max(updated_at): a transaction committing
+        late can't leave behind a version older than one already served.
+
+        Taking the lock last, once every other lock of the transaction is held, can't deadlock
+        with them, and the writers of a table only queue up for the commit itself. A transaction
+        must not write more than one tracked table, their rows would be locked in no set order.
+    """
+    __tablename__ = 'table_version'
+
+    # Fired for every written row, only the first one of a transaction bumps the version.
+    # The table name is an argument: on a partitioned table the trigger fires on the partitions.
+    BUMP_FUNCTION = """
+        CREATE OR REPLACE FUNCTION table_version_bump() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('table_version.' || TG_ARGV[0], true) = 'bumped' THEN
+                RETURN NULL;
+            END IF;
+
+            PERFORM set_config('table_version.' || TG_ARGV[0], 'bumped', true);
+
+            INSERT INTO table_version (name, updated_at)
+            VALUES (TG_ARGV[0], timezone('UTC', clock_timestamp()))
+            ON CONFLICT (name) DO UPDATE SET updated_at = greatest(
+                EXCLUDED.updated_at, table_version.updated_at + interval '1 microsecond'
+            );
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+    # Deferred, so it runs when the transaction commits, after all its other locks.
+    BUMP_TRIGGER = """
+        CREATE CONSTRAINT TRIGGER {table}_table_version AFTER INSERT OR UPDATE OR DELETE ON {table}
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION table_version_bump('{table}')
+    """
+
+    name = Column(String, primary_key=True)
+
+    # Strictly increasing for a table, in UTC like the other timestamps.
+    updated_at = Column(DateTime, nullable=False)
+
+    @staticmethod
+    def track(table):
+        """ Bump the version of `table` on every write, once the table is created by create_all. """
+        # The function is only resolved when the trigger fires, table_version can come later.
+        event.listen(table, 'after_create', DDL(TableVersion.BUMP_FUNCTION))
+        event.listen(table, 'after_create', DDL(TableVersion.BUMP_TRIGGER.format(table=table.name)))
+
+    @staticmethod
+    def get(session, table):
+        """ Version of the table named `table`, None until its first write. """
+        return session.query(TableVersion.updated_at).filter(TableVersion.name == table).scalar()